@@ -30,7 +30,11 @@ import qtclient as qt
 
 class QTInstrumentFrame(gtk.VBox):
 
-    def __init__(self, ins, show_range, show_rate, **kwargs):
+    def __init__(self, ins, show_range, show_rate, values=None, **kwargs):
+        '''
+        values is an optional dictionary of parameter values, e.g. from an
+        Instruments.snapshot(); other values are requested separately.
+        '''
         gtk.VBox.__init__(self, **kwargs)
 
         self._label = gtk.Label()
@@ -62,7 +66,7 @@ class QTInstrumentFrame(gtk.VBox):
         # For formatting
         self._parameter_options = {}
 
-        self._add_parameters()
+        self._add_parameters(values)
 
         ins.connect('parameter-added', self._parameter_added_cb)
         ins.connect('parameter-changed', self._parameter_changed_cb)
@@ -76,7 +80,7 @@ class QTInstrumentFrame(gtk.VBox):
         # Update variables twice per second
         gobject.timeout_add(500, self._do_update_parameters_timer)
 
-    def _add_parameter_by_name(self, param):
+    def _add_parameter_by_name(self, param, values=None):
         if param in self._label_name:
             return
 
@@ -97,7 +101,10 @@ class QTInstrumentFrame(gtk.VBox):
         self._table.attach(plabel, 1, 2, nrows, nrows + 1)
 
         vlabel = gtk.Label()
-        val = self._instrument.get(param, query=False)
+        if values is not None and param in values:
+            val = values[param]
+        else:
+            val = self._instrument.get(param, query=False)
         self._cur_val[param] = val
         vlabel.set_markup('<b>%s</b>' % \
                 qt.format_parameter_value(self._parameter_options[param], val))
@@ -129,11 +136,11 @@ class QTInstrumentFrame(gtk.VBox):
 
         self._label_rate[param] = rlabel
 
-    def _add_parameters(self):
+    def _add_parameters(self, values=None):
         parameters = self._instrument.get_parameter_names()
         parameters.sort()
         for param in parameters:
-            self._add_parameter_by_name(param)
+            self._add_parameter_by_name(param, values)
 
         self.show()
 
@@ -307,11 +314,11 @@ class InstrumentWindow(qtwindow.QTWindow):
         self._rate_toggle.emit('toggled')
         self.add(self._outer_vbox)
 
-    def _add_instrument(self, ins):
+    def _add_instrument(self, ins, values=None):
         name = ins.get_name()
         self._ins_widgets[name] = QTInstrumentFrame(ins,
             self._range_toggle.get_active(),
-            self._rate_toggle.get_active())
+            self._rate_toggle.get_active(), values=values)
         self._vbox.pack_start(self._ins_widgets[name], False, False)
 
     def _remove_instrument(self, insname):
@@ -326,9 +333,17 @@ class InstrumentWindow(qtwindow.QTWindow):
                 self._ins_widgets[insname].update_parameter(param, val)
 
     def _add_instruments(self):
+        # Get all current values at once
+        values = {}
+        if hasattr(self._instruments, 'snapshot'):
+            snap = self._instruments.snapshot()
+            for insname, param, val in zip(snap['instruments'],
+                    snap['parameters'], snap['values']):
+                values.setdefault(insname, {})[param] = val
+
         for name in self._instruments.get_instrument_names():
             ins = qt.get_instrument_proxy(name)
-            self._add_instrument(ins)
+            self._add_instrument(ins, values.get(name, None))
 
     def _delete_event_cb(self, widget, event, data=None):
         self.hide()
@@ -404,6 +404,13 @@ class MeasurementWindow(QTWindow):
     def _measurement_progress_cb(self, sender, vals):
         running = time.time() - self._measurement_start
 
+        # Adaptive measurements may not know the total number of points
+        if 'total' not in vals:
+            text = _L('Step %d, running: %s') % \
+                (vals['current'], misc.seconds_to_str(running))
+            self._status_label.set_text(text)
+            return
+
         if vals['current'] > 0:
             predicted = running / vals['current'] * vals['total'] - running
         else:
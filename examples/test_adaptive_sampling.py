@@ -0,0 +1,55 @@
+# Script to compare adaptive sampling with a uniform grid.
+#
+# Simulated signals are sampled with lib.adaptive, with each loss
+# function, until the rms error of the reconstruction on a fine grid is
+# below a target. The number of points needed is printed; 'uniform'
+# refines the grid everywhere and serves as the reference.
+# The signals are a narrow resonance (1D) and a Coulomb diamond pattern
+# (2D), where most of a uniform grid is spent on flat regions.
+
+import time
+import numpy
+from lib import adaptive
+
+MAX_POINTS = 10000
+
+def resonance(x):
+    return 1.0 / (1 + ((x - 0.3) / 0.005) ** 2)
+
+def diamonds(x, y):
+    # Conductance peaks along the edges of diamonds in gate / bias space
+    d = numpy.abs(numpy.mod(x, 0.5) - 0.25) - numpy.abs(y) / 2
+    return numpy.exp(-(d / 0.03) ** 2) * (numpy.abs(y) > 0.02)
+
+def run(name, bounds, func, grid, targets):
+    print name
+    print '  rms error  %s' % '  '.join(['%8s' % t for t in targets])
+    truth = func(*grid.T)
+    for loss in ('uniform', 'gradient', 'curvature', 'variance'):
+        s = adaptive.AdaptiveSampler(bounds, loss=loss, min_size=1e-4)
+        needed = []
+        check = 10
+        start = time.time()
+        while s.get_npoints() < MAX_POINTS and len(needed) < len(targets):
+            p = s.ask()
+            if p is None:
+                break
+            s.tell(p, func(*p))
+            # Check the error at every 5% more points
+            if s.get_npoints() >= check:
+                check = max(check + 1, int(check * 1.05))
+                err = numpy.sqrt(numpy.nanmean((s.interpolate(grid) - truth) ** 2))
+                while len(needed) < len(targets) and err < targets[len(needed)]:
+                    needed.append(s.get_npoints())
+        dt = time.time() - start
+        needed += ['>%d' % s.get_npoints()] * (len(targets) - len(needed))
+        print '  %-10s %s  (%.1f s)' % (loss,
+                '  '.join(['%8s' % n for n in needed]), dt)
+
+print 'Points needed to reach the rms error'
+run('resonance (1D)', [(0, 1)], resonance,
+        numpy.linspace(0, 1, 20001).reshape(-1, 1), (1e-2, 3e-3, 1e-3))
+
+x, y = numpy.meshgrid(numpy.linspace(0, 1, 201), numpy.linspace(-0.5, 0.5, 201))
+run('diamonds (2D)', [(0, 1), (-0.5, 0.5)], diamonds,
+        numpy.column_stack((x.ravel(), y.ravel())), (0.1, 0.05, 0.03))
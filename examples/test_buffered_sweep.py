@@ -0,0 +1,148 @@
+# Script to check buffered sweeps in lib.measurement.
+#
+# Two fake instruments support buffered sweeps: a source with a buffered
+# 'x' and a plain 'y' for the outer loop, and a reader whose 'v' is twice
+# the source setpoint. A 5 x 3 loop is measured with option 'buffered',
+# and the setpoint and reading columns and the blocks in the file are
+# checked. Then the source refuses to arm, which should run the loop
+# point by point with the same result, and finally the measurement is
+# stopped during the second line, which should abort the sweep and leave
+# 'x' at the last setpoint that was sent.
+
+import types
+import numpy
+from instrument import Instrument
+from data import Data
+from lib.measurement import Measurement
+
+NX = 5
+NY = 3
+
+class BufferedSource(Instrument):
+
+    def __init__(self, name, fail_arm=False, stop_line=None):
+        Instrument.__init__(self, name)
+        self.add_parameter('x', type=types.FloatType,
+                flags=Instrument.FLAG_GETSET,
+                buffered=Instrument.FLAG_SET)
+        self.add_parameter('y', type=types.FloatType,
+                flags=Instrument.FLAG_GETSET)
+
+        self._fail_arm = fail_arm
+        self._stop_line = stop_line
+        self.measurement = None
+        self.x = 0.0
+        self.y = 0.0
+        self.nset = 0
+        self.ntrigger = 0
+        self.naborted = 0
+
+    def do_set_x(self, val):
+        self.x = val
+        self.nset += 1
+
+    def do_get_x(self):
+        return self.x
+
+    def do_set_y(self, val):
+        self.y = val
+
+    def do_get_y(self):
+        return self.y
+
+    def do_arm_buffered(self, sets, gets, npoints, interval):
+        if self._fail_arm:
+            return False
+        self._setpoints = sets['x']
+        return True
+
+    def do_trigger_buffered(self):
+        self.ntrigger += 1
+        if self.ntrigger == self._stop_line:
+            # Stopped from the GUI after two setpoints
+            self.x = self._setpoints[1]
+            self._nsent = 2
+            self.measurement.stop()
+            return
+        self.x = self._setpoints[-1]
+        self._nsent = len(self._setpoints)
+
+    def do_fetch_buffered(self):
+        return {}
+
+    def do_abort_buffered(self):
+        self.naborted += 1
+        return {'x': self._setpoints[self._nsent - 1]}
+
+class BufferedReader(Instrument):
+
+    def __init__(self, name, source):
+        Instrument.__init__(self, name)
+        self.add_parameter('v', type=types.FloatType,
+                flags=Instrument.FLAG_GET,
+                buffered=Instrument.FLAG_GET)
+        self._source = source
+        self.naborted = 0
+
+    def do_get_v(self):
+        return 2 * self._source.x
+
+    def do_arm_buffered(self, sets, gets, npoints, interval):
+        return True
+
+    def do_fetch_buffered(self):
+        return {'v': 2 * numpy.asarray(self._source._setpoints)}
+
+    def do_abort_buffered(self):
+        self.naborted += 1
+
+def run(name, **kwargs):
+    src = BufferedSource('%s_src' % name, **kwargs)
+    rdr = BufferedReader('%s_rdr' % name, src)
+    m = Measurement(name, buffered=True, delay=2)
+    src.measurement = m
+    m.add_coordinate(src, 'x', 0, 4, steps=NX)
+    m.add_coordinate(src, 'y', 0, 1, steps=NY)
+    m.add_measurement(rdr, 'v')
+    m.start()
+    d = Data(m.get_data().get_filepath())
+    return src, rdr, d
+
+def check(name, a, b):
+    a = numpy.asarray(a)
+    b = numpy.asarray(b)
+    if a.shape != b.shape or not numpy.allclose(a, b):
+        raise AssertionError('%s: %r != %r' % (name, a, b))
+
+x = numpy.tile(numpy.linspace(0, 4, NX), NY)
+y = numpy.repeat(numpy.linspace(0, 1, NY), NX)
+
+# Buffered: x is only set directly at the start of every line
+src, rdr, d = run('test_buffered')
+check('buffered columns', d.get_data(), numpy.column_stack((x, y, 2 * x)))
+check('buffered blocks', [d.get_block_size(i) for i in range(d.get_nblocks())],
+        [NX] * NY)
+if src.ntrigger != NY or src.nset != NY:
+    raise AssertionError('buffered: %d sweeps, %d sets' % \
+            (src.ntrigger, src.nset))
+check('buffered x after sweep', src.get_x(query=False), 4)
+
+# Arming fails: point by point
+src, rdr, d = run('test_buffered_fallback', fail_arm=True)
+check('fallback columns', d.get_data(), numpy.column_stack((x, y, 2 * x)))
+check('fallback blocks', [d.get_block_size(i) for i in range(d.get_nblocks())],
+        [NX] * NY)
+if src.ntrigger != 0 or rdr.naborted != 1:
+    raise AssertionError('fallback: %d sweeps, reader aborted %d times' % \
+            (src.ntrigger, rdr.naborted))
+
+# Stopped during the second line
+src, rdr, d = run('test_buffered_stop', stop_line=2)
+check('stopped columns', d.get_data(),
+        numpy.column_stack((x[:NX], y[:NX], 2 * x[:NX])))
+if src.ntrigger != 2 or src.naborted != 1 or rdr.naborted != 1:
+    raise AssertionError('stop: %d sweeps, aborted %d and %d times' % \
+            (src.ntrigger, src.naborted, rdr.naborted))
+check('stopped x', src.get_x(query=False), 1)
+
+print 'Buffered sweeps ok'
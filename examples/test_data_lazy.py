@@ -0,0 +1,47 @@
+# Script to check indexing of data files opened with inmem='lazy'.
+#
+# A small data file is written and opened both lazily and in memory.
+# Every kind of index supported by the lazy array should give the same
+# result as the in-memory array.
+
+import os
+import tempfile
+import numpy
+from data import Data
+
+NROWS = 50
+
+fd, fn = tempfile.mkstemp(suffix='.dat')
+f = os.fdopen(fd, 'w')
+f.write('# Column 1:\n#\tname: x\n# Column 2:\n#\tname: y\n\n')
+for i in xrange(NROWS):
+    f.write('%d\t%e\n' % (i, 0.5 * i))
+    if i % 10 == 9:
+        f.write('\n')
+f.close()
+
+lazy = Data(fn, inmem='lazy').get_data()
+ref = Data(fn, inmem=True).get_data()
+
+def check(name, a, b):
+    a = numpy.asarray(a)
+    b = numpy.asarray(b)
+    if a.shape != b.shape or not numpy.all(a == b):
+        raise AssertionError('%s: %r != %r' % (name, a, b))
+    print '%-16s ok' % name
+
+check('integer', lazy[3], ref[3])
+check('negative', lazy[-1], ref[-1])
+check('integer, column', lazy[3, 1], ref[3, 1])
+check('row', lazy[3, :], ref[3, :])
+check('slice', lazy[2:5], ref[2:5])
+check('step', lazy[1:40:7], ref[1:40:7])
+check('reversed', lazy[::-3], ref[::-3])
+check('column', lazy[:, 1], ref[:, 1])
+check('int array', lazy[[7, 2, 30]], ref[[7, 2, 30]])
+check('bool array', lazy[ref[:, 0] > 40], ref[ref[:, 0] > 40])
+check('asarray', numpy.asarray(lazy), ref)
+check('copy', lazy.copy(), ref)
+check('len', len(lazy), len(ref))
+
+os.remove(fn)
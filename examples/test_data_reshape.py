@@ -0,0 +1,31 @@
+# Script to check reshaping of 2D data, also for serpentine sweeps.
+#
+# The inner coordinate is swept up in every even block and down in every
+# odd block. get_reshaped_data() should reverse the odd blocks, so the
+# result is the same as for a plain sweep.
+
+import numpy
+from data import Data
+
+NX = 5
+NY = 3
+
+def make(serpentine):
+    d = Data(name='reshape', inmem=True, infile=False)
+    d.add_coordinate('x')
+    d.add_coordinate('y')
+    d.add_value('z')
+    for j in xrange(NY):
+        xs = range(NX)
+        if serpentine and j % 2 == 1:
+            xs.reverse()
+        for i in xs:
+            d.add_data_point(i, j, 10 * j + i)
+    return d
+
+plain = make(False).get_reshaped_data()
+for name, serpentine in (('plain', False), ('serpentine', True)):
+    data = make(serpentine).get_reshaped_data()
+    if data is None or data.shape != plain.shape or not numpy.all(data == plain):
+        raise AssertionError('%s: %r != %r' % (name, data, plain))
+    print '%-12s %s ok' % (name, data.shape)
@@ -0,0 +1,49 @@
+# Script to check the client side proxy cache of the object sharer.
+#
+# A proxy for a remote object is put in the cache, as find_remote_object()
+# does. When the remote root object announces that an object with the same
+# name was added (e.g. an instrument was reloaded), the cached proxy should
+# be dropped and stop listening for the signals that invalidate its cached
+# results. Cached lists should be returned as copies, so that a caller
+# sorting the result does not change the cache.
+
+from lib.network import object_sharer as objsh
+
+helper = objsh.helper
+
+info = {
+    'name': 'test_ins',
+    'properties': [],
+    'functions': [
+        ('get_parameter_names',
+            {'cache_args': True, 'invalidate_on': ('parameter-added', )}),
+    ],
+}
+proxy = objsh.ObjectProxy(None, info)
+helper._object_cache['test_ins'] = proxy
+
+# Pretend a result was received earlier
+proxy.get_parameter_names._cache[((), ())] = ['b', 'a']
+names = proxy.get_parameter_names()
+names.sort()
+names.append('c')
+if proxy.get_parameter_names() != ['b', 'a']:
+    raise AssertionError('Cached result was modified by the caller')
+
+helper._object_cache['remote:test_ins'] = proxy
+
+def ncallbacks():
+    return len(helper._callbacks_name.get('test_ins__parameter-added', {}))
+
+if ncallbacks() != 1:
+    raise AssertionError('Proxy did not connect to its invalidating signal')
+
+helper.receive_signal('root', 'object-added', 'test_ins')
+
+for key in ('test_ins', 'remote:test_ins'):
+    if key in helper._object_cache:
+        raise AssertionError('Proxy %s still cached after object-added' % key)
+if ncallbacks() != 0:
+    raise AssertionError('Dropped proxy is still connected')
+
+print 'Cached proxy released after object-added'
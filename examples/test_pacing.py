@@ -0,0 +1,60 @@
+# Script to test the timing of measurement points with lib.pacing.
+#
+# Points are measured at a fixed interval while a simulated GUI handles
+# events of random duration. First with a sleep after every point, as
+# qt.msleep() does, then with a Pacer on an absolute timeline that only
+# handles events in the slack time. The error of the interval between
+# points and the drift of the last point are printed, with the histogram
+# of the Pacer.
+
+import random
+import time
+import numpy
+from lib import pacing
+
+NPOINTS = 500
+INTERVAL = 0.01
+MEASURE_TIME = 0.003
+EVENT_TIME = 0.002
+
+def measure():
+    time.sleep(random.uniform(0, MEASURE_TIME))
+
+def handle_events(budget):
+    # Events are started while there is time left, each one runs to the end
+    start = time.time()
+    while time.time() - start + 0.001 < budget and random.random() < 0.5:
+        time.sleep(random.uniform(0, EVENT_TIME))
+
+def report(name, times):
+    err = numpy.diff(times) - INTERVAL
+    print '%-8s interval error rms %7.1f us, max %7.1f us, drift %7.1f ms' % \
+            (name, numpy.sqrt(numpy.mean(err ** 2)) * 1e6,
+            numpy.max(numpy.abs(err)) * 1e6,
+            (times[-1] - times[0] - (NPOINTS - 1) * INTERVAL) * 1e3)
+
+# Sleep after every point, handling events meanwhile
+times = []
+for i in xrange(NPOINTS):
+    times.append(time.time())
+    measure()
+    start = time.time()
+    handle_events(INTERVAL)
+    time.sleep(max(0, INTERVAL - (time.time() - start)))
+report('sleep', times)
+
+p = pacing.Pacer(idle=handle_events, jitter=1e-4)
+p.start()
+times = []
+for i in xrange(NPOINTS):
+    times.append(time.time())
+    measure()
+    p.next(INTERVAL)
+report('pacer', times)
+
+stats = p.get_stats()
+print 'Pacer: %d of %d waits exceed %.0f us, %d resyncs' % (stats['violations'],
+        stats['n'], stats['jitter'] * 1e6, stats['resyncs'])
+counts, edges = stats['histogram']
+for n, a, b in zip(counts, edges[:-1], edges[1:]):
+    print '  %10.0f .. %10.0f us: %d' % (a * 1e6, b * 1e6, n)
@@ -0,0 +1,84 @@
+# Script to check lib.readout.ParallelReader with fake instruments.
+#
+# Four instruments are read for every point, two on each of two buses
+# (lock classes). Every read takes READ_TIME, one of them waits with
+# qt.msleep() as some drivers do. Reads on different buses should
+# overlap, while the instruments on one bus are read one after the other
+# and in the order of the items.
+
+import threading
+import time
+import qt
+from lib.readout import ParallelReader
+
+NPOINTS = 10
+READ_TIME = 0.05
+
+class FakeInstrument:
+
+    def __init__(self, name, lockclass, log, msleep=False):
+        self._name = name
+        self._lockclass = lockclass
+        self._log = log
+        self._msleep = msleep
+
+    def get_name(self):
+        return self._name
+
+    def get_lock_class(self):
+        return self._lockclass
+
+    def get(self, var):
+        start = time.time()
+        if self._msleep:
+            qt.msleep(READ_TIME)
+        else:
+            time.sleep(READ_TIME)
+        self._log.append((self._name, self._lockclass, start, time.time(),
+                threading.currentThread().getName()))
+        return '%s.%s' % (self._name, var)
+
+log = []
+items = [
+    (FakeInstrument('a1', 'busA', log), 'v'),
+    (FakeInstrument('b1', 'busB', log, msleep=True), 'v'),
+    (FakeInstrument('a2', 'busA', log), 'v'),
+    (FakeInstrument('b2', 'busB', log), 'v'),
+]
+reader = ParallelReader(items)
+
+for i in xrange(NPOINTS):
+    del log[:]
+    start = time.time()
+    values = reader.read()
+    dt = time.time() - start
+
+    if values != ['a1.v', 'b1.v', 'a2.v', 'b2.v']:
+        raise AssertionError('Values out of order: %r' % values)
+
+    reads = {}
+    for name, lockclass, t0, t1, thread in log:
+        reads[name] = (t0, t1, thread)
+
+    # Same bus: same thread, in item order, not overlapping
+    for first, second in (('a1', 'a2'), ('b1', 'b2')):
+        if reads[first][2] != reads[second][2]:
+            raise AssertionError('%s and %s read by different threads' % \
+                    (first, second))
+        if reads[second][0] < reads[first][1]:
+            raise AssertionError('%s started before %s finished' % \
+                    (second, first))
+
+    # Different buses: overlapping
+    if reads['b1'][0] >= reads['a1'][1]:
+        raise AssertionError('busB did not start before busA finished')
+    if dt > 3 * READ_TIME:
+        raise AssertionError('Point took %.3f s, reads not concurrent' % dt)
+
+reader.close()
+
+stats = reader.get_stats()
+print 'Point: %.1f ms mean, %d reads of %.0f ms each' % \
+        (stats['point']['mean'] * 1e3, len(items), READ_TIME * 1e3)
+for key, group in sorted(stats['groups'].iteritems()):
+    print '  %s: %.1f ms mean' % (key, group['mean'] * 1e3)
@@ -1,32 +1,59 @@
 # Script to test overhead of QTLab framework
+#
+# Measures the time per call of instrument parameter access through the
+# different layers, using the dummy signal generator. Results are appended
+# to test_speed.log, with the result of the previous run for comparison,
+# so the overhead can be tracked over time.
 
 import qt
+import os
 import time
 
+LOGFILE = 'test_speed.log'
+N = 100000
+
+if 'dsgen' not in qt.instruments.get_instrument_names():
+    qt.instruments.create('dsgen', 'dummy_signal_generator')
 ins = qt.instruments['dsgen']
-N = 1e6
 
-start = time.time()
-i = 0
-while i < N:
-    v = ins._ins.do_get_wave()
-    i += 1
-stop = time.time()
-print 'do_get_wave: %s sec' % (stop - start, )
+def timeit(func):
+    start = time.time()
+    i = 0
+    while i < N:
+        func()
+        i += 1
+    stop = time.time()
+    return (stop - start) / N * 1e6
 
-start = time.time()
-i = 0
-while i < N:
-    v = ins.get_wave(fast=True)
-    i += 1
-stop = time.time()
-print 'get_wave(fast=True): %s sec' % (stop - start, )
+tests = (
+    ('do_get_wave', ins._ins.do_get_wave),
+    ('_get_value', lambda: ins._ins._get_value('wave')),
+    ('get_wave(fast=True)', lambda: ins.get_wave(fast=True)),
+    ('get_wave', ins.get_wave),
+    ('do_set_amplitude', lambda: ins._ins.do_set_amplitude(1.0)),
+    ('_set_value', lambda: ins._ins._set_value('amplitude', 1.0)),
+    ('set_amplitude(fast=True)', lambda: ins.set_amplitude(1.0, fast=True)),
+    ('set_amplitude', lambda: ins.set_amplitude(1.0)),
+)
 
-start = time.time()
-i = 0
-while i < N:
-    v = ins.get_wave()
-    i += 1
-stop = time.time()
-print 'get_wave: %s sec' % (stop - start, )
+# Results of the previous run
+last = {}
+if os.path.exists(LOGFILE):
+    for line in open(LOGFILE):
+        fields = line.strip().split('\t')
+        if len(fields) == 3:
+            last[fields[1]] = float(fields[2])
 
+ts = time.strftime('%Y-%m-%d %H:%M:%S')
+f = open(LOGFILE, 'a')
+for name, func in tests:
+    usec = timeit(func)
+    if name in last:
+        cmp = '(last run %.2f usec)' % last[name]
+    else:
+        cmp = ''
+    print '%-25s %8.2f usec/call %s' % (name, usec, cmp)
+    f.write('%s\t%s\t%.3f\n' % (ts, name, usec))
+    # Handle queued changed signals
+    qt.msleep(0.01)
+f.close()
@@ -0,0 +1,39 @@
+# Script to test the cost of Data.add_data_point for in-memory data.
+# The time per point should be the same for the first and the last block.
+
+import qt
+import time
+import numpy
+
+N = 1000000
+BLOCK = 100000
+
+d = qt.Data(name='append_speed', inmem=True, infile=False)
+d.add_coordinate('x')
+d.add_value('y')
+
+times = []
+start = time.time()
+i = 0
+while i < N:
+    d.add_data_point(i, 0.5 * i)
+    i += 1
+    if i % BLOCK == 0:
+        stop = time.time()
+        times.append((stop - start) / BLOCK)
+        print '%7d points: %.2f usec/point' % (i, times[-1] * 1e6)
+        # Handle the queued new-data-point signals
+        qt.msleep(0.01)
+        start = time.time()
+
+print 'last / first block: %.2f' % (times[-1] / times[0])
+print 'Points in memory: %d' % len(d.get_data())
+
+# Reference: numpy.append copies the whole array for each point
+M = 20000
+a = numpy.zeros((0, 2))
+start = time.time()
+for i in xrange(M):
+    a = numpy.append(a, [[i, 0.5 * i]], axis=0)
+stop = time.time()
+print 'numpy.append, %d points: %.2f usec/point' % (M, (stop - start) / M * 1e6)
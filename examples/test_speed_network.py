@@ -0,0 +1,145 @@
+# Script to test the latency and throughput of the object sharer.
+#
+# A second ObjectSharer is served from a thread over a local TCP
+# connection. First the round-trip time of small calls is measured, also
+# with pipelined asynchronous calls, with and without TCP_NODELAY (as set
+# by ObjectSharer.add_client) on both ends. Pipelining only helps much
+# with TCP_NODELAY set. Then payloads of increasing size are
+# sent to it. The time per call should scale linearly with the payload
+# size, i.e. the throughput should be about the same for all sizes.
+# Finally arrays are sent with compression and through shared memory.
+# Before that, calls are made from a second thread while the first one is
+# reading from the connection, waiting for a slow reply.
+
+import sys
+import socket
+import threading
+import time
+import numpy
+from lib.network import object_sharer as objsh
+
+NCALLS = 2000
+SIZES_MB = (1, 4, 16, 64)
+REPEAT = 3
+
+class Sink():
+    def ping(self):
+        return None
+
+    def size(self, data):
+        return len(data)
+
+    def slow(self, delay):
+        time.sleep(delay)
+        return delay
+
+srv = objsh.ObjectSharer()
+srv._objects['sink'] = Sink()
+
+listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+listener.bind(('127.0.0.1', 0))
+listener.listen(1)
+conn = socket.create_connection(listener.getsockname())
+srvconn = listener.accept()[0]
+listener.close()
+
+def serve():
+    while True:
+        try:
+            n = srv.receive(srvconn)
+        except socket.error:
+            break
+        if n == 0:
+            break
+
+thread = threading.Thread(target=serve)
+thread.setDaemon(True)
+thread.start()
+
+def run_calls(name):
+    print name
+    times = []
+    for i in xrange(NCALLS):
+        start = time.time()
+        objsh.helper.call(conn, 'sink', 'ping')
+        times.append(time.time() - start)
+    times = numpy.array(times) * 1e6
+    print '  Round-trip time: mean %.1f usec, median %.1f usec, max %.1f usec' % \
+            (numpy.mean(times), numpy.median(times), numpy.max(times))
+
+    # The same calls pipelined, sending all requests before waiting
+    start = time.time()
+    futures = [objsh.helper.call_async(conn, 'sink', 'ping') for i in xrange(NCALLS)]
+    for f in futures:
+        f.result()
+    print '  Pipelined calls: %.1f usec per call' % ((time.time() - start) / NCALLS * 1e6)
+
+run_calls('Nagle')
+objsh.set_nodelay(conn)
+objsh.set_nodelay(srvconn)
+run_calls('TCP_NODELAY')
+
+# A thread waiting for a reply while another thread reads from the
+# connection polls the reply event. This must not nest deeper with every
+# poll; a low recursion limit makes that fail quickly.
+SLOW = 2.0
+reader = threading.Thread(target=objsh.helper.call,
+        args=(conn, 'sink', 'slow', SLOW))
+reader.start()
+time.sleep(0.2)
+limit = sys.getrecursionlimit()
+sys.setrecursionlimit(100)
+try:
+    start = time.time()
+    ret = objsh.helper.call(conn, 'sink', 'slow', 0)
+    future = objsh.helper.call_async(conn, 'sink', 'ping')
+    future.result()
+finally:
+    sys.setrecursionlimit(limit)
+reader.join()
+print 'Call from a second thread while reading: %.2f s (slow call %.1f s), ok' % \
+        (time.time() - start, SLOW)
+
+def run(name, make_payload):
+    print name
+    for size in SIZES_MB:
+        payload = make_payload(size * 1024**2)
+        best = None
+        for i in range(REPEAT):
+            start = time.time()
+            ret = objsh.helper.call(conn, 'sink', 'size', payload, timeout=60)
+            dt = time.time() - start
+            if best is None or dt < best:
+                best = dt
+        print '  %4d MB: %8.1f ms, %7.1f MB/s' % (size, best * 1e3, size / best)
+
+run('string', lambda n: 'x' * n)
+
+# Arrays are sent as binary segments if the peer supports it
+objsh.helper._capabilities[conn] = set(objsh.CAPABILITIES)
+run('array', lambda n: numpy.ones(n / 8))
+
+# Compressed, as for a remote host. The arrays are mostly zero, random
+# data would not be compressed at all.
+srv._capabilities[srvconn] = set(objsh.CAPABILITIES)
+objsh.helper.set_compression('zlib', conn)
+srv.set_compression('zlib', srvconn)
+def sparse(n):
+    a = numpy.zeros(n / 8)
+    a[::100] = numpy.arange(len(a[::100]))
+    return a
+run('array, zlib', sparse)
+stats = objsh.helper.get_compression_stats(conn)
+print '  ratio %.3f, %.1f MB/s compressing' % (stats['sent_ratio'],
+        stats['sent_bytes'] / 1024.0**2 / stats['compress_time'])
+
+# Through shared memory, as for a client on the same host
+objsh.helper.set_compression(None, conn)
+srv.set_compression(None, srvconn)
+objsh.helper.set_shared_memory(True, conn)
+srv.set_shared_memory(True, srvconn)
+run('array, shared memory', lambda n: numpy.ones(n / 8))
+
+conn.close()
+thread.join()
+srvconn.close()
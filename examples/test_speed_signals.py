@@ -0,0 +1,42 @@
+# Script to test the overhead of signal callbacks in the object sharer.
+#
+# Callbacks are registered on the local ObjectSharer, like an ObjectProxy
+# does for remote objects. With a number of existing connections, as
+# with many plot and watch windows, the time of connect, receiving a signal
+# and disconnect is measured. The time per cycle should not depend on the
+# number of existing connections.
+
+import time
+from lib.network import object_sharer as objsh
+
+NCYCLES = 10000
+NEXISTING = (0, 100, 1000)
+
+def callback(sender, *args):
+    pass
+
+helper = objsh.helper
+for nexisting in NEXISTING:
+    hids = [helper.connect('obj%d' % (i % 50), 'changed', callback)
+            for i in xrange(nexisting)]
+
+    start = time.time()
+    for i in xrange(NCYCLES):
+        hid = helper.connect('test', 'changed', callback, i)
+        helper.receive_signal('test', 'changed', None, {'value': i})
+        helper.disconnect(hid)
+    dt = time.time() - start
+
+    # Emit to a signal that has all the existing connections
+    start2 = time.time()
+    for i in xrange(NCYCLES):
+        helper.receive_signal('obj0', 'changed', None, {'value': i})
+    dt2 = time.time() - start2
+
+    print '%5d connections: %6.2f usec per connect/emit/disconnect, ' \
+            '%6.2f usec per emit to %d callbacks' % \
+            (nexisting, dt / NCYCLES * 1e6, dt2 / NCYCLES * 1e6,
+                    nexisting / 50)
+
+    for hid in hids:
+        helper.disconnect(hid)
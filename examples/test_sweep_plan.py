@@ -0,0 +1,91 @@
+# Script to check the tables of lib.measurement.SweepPlan.
+#
+# The indices, setpoints, changed axes, block starts and delays are
+# compared with values worked out by hand for linear, serpentine and
+# hysteresis axes. The block starts of plain loops are compared with the
+# point by point computation that Measurement used before the plan
+# existed. Finally the setpoints generated from values, steps and stepsize
+# are checked, and coordinates without start and end should be refused.
+
+import numpy
+from lib.measurement import SweepPlan, Measurement
+
+def check(name, a, b):
+    a = numpy.asarray(a)
+    b = numpy.asarray(b)
+    if a.shape != b.shape or not numpy.allclose(a, b):
+        raise AssertionError('%s: %r != %r' % (name, a, b))
+
+def old_new_block(sizes):
+    # Loop index of every point, as iter_to_index() computed it, and a new
+    # block whenever an axis other than the first one changed.
+    last = None
+    ret = []
+    for i in xrange(int(numpy.prod(sizes))):
+        index = []
+        for size in sizes:
+            index.append(i % size)
+            i //= size
+        ret.append(last is not None and index[1:] != last[1:])
+        last = index
+    return ret
+
+# Linear
+plan = SweepPlan([{'setpoints': [0, 1, 2], 'delay': 100},
+        {'setpoints': [10, 20], 'delay': 500}])
+check('linear indices', plan.indices,
+        [[0, 0], [1, 0], [2, 0], [0, 1], [1, 1], [2, 1]])
+check('linear setpoints', plan.setpoints,
+        [[0, 10], [1, 10], [2, 10], [0, 20], [1, 20], [2, 20]])
+check('linear changed', plan.changed,
+        [[1, 1], [1, 0], [1, 0], [1, 1], [1, 0], [1, 0]])
+check('linear new_block', plan.new_block, [0, 0, 0, 1, 0, 0])
+check('linear delays', plan.delays, [0.6, 0.1, 0.1, 0.6, 0.1, 0.1])
+
+# Serpentine first axis: the turning point is not set again
+plan = SweepPlan([{'setpoints': [0, 1, 2], 'mode': 'serpentine'},
+        {'setpoints': [10, 20]}])
+check('serpentine indices', plan.indices[:, 0], [0, 1, 2, 2, 1, 0])
+check('serpentine setpoints', plan.setpoints[:, 0], [0, 1, 2, 2, 1, 0])
+check('serpentine changed', plan.changed,
+        [[1, 1], [1, 0], [1, 0], [0, 1], [1, 0], [1, 0]])
+check('serpentine new_block', plan.new_block, [0, 0, 0, 1, 0, 0])
+
+# Hysteresis: sweep to the end and back
+plan = SweepPlan([{'setpoints': [0, 1, 2], 'hysteresis': True},
+        {'setpoints': [10, 20]}])
+check('hysteresis axis', plan.get_axis_setpoints(0), [0, 1, 2, 1, 0])
+check('hysteresis indices', plan.indices[:5, 0], [0, 1, 2, 3, 4])
+check('hysteresis setpoints', plan.setpoints[:6, 0], [0, 1, 2, 1, 0, 0])
+if plan.get_npoints() != 10:
+    raise AssertionError('hysteresis: %d points' % plan.get_npoints())
+
+# Block starts as computed point by point before
+for sizes in ((5, ), (3, 2), (2, 3, 4), (1, 3, 2)):
+    plan = SweepPlan([{'setpoints': numpy.arange(n)} for n in sizes])
+    check('new_block %r' % (sizes, ), plan.new_block, old_new_block(sizes))
+
+# Setpoint generation
+def func(val):
+    pass
+
+m = Measurement('test_sweep_plan')
+m.add_coordinate_func(func, values=[1, 3, 2])
+m.add_coordinate_func(func, 0, 1, steps=5)
+m.add_coordinate_func(func, 0, 1, stepsize=0.3)
+m.add_coordinate_func(func, 1, 0, stepsize=0.5)
+m.add_coordinate_func(func, 0, 1, stepsize=0.1)
+plan = m.get_plan()
+check('values', plan.get_axis_setpoints(0), [1, 3, 2])
+check('steps', plan.get_axis_setpoints(1), [0, 0.25, 0.5, 0.75, 1])
+check('stepsize', plan.get_axis_setpoints(2), [0, 0.3, 0.6, 0.9])
+check('negative stepsize', plan.get_axis_setpoints(3), [1, 0.5, 0])
+check('stepsize to end', plan.get_axis_setpoints(4), numpy.linspace(0, 1, 11))
+
+# Refused: no end, or neither start nor end
+m.add_coordinate_func(func, 0, steps=5)
+m.add_coordinate_func(func, steps=5)
+if m.get_ncoordinates() != 5:
+    raise AssertionError('Coordinate without start and end was added')
+
+print 'Sweep plan ok'
@@ -36,6 +36,9 @@ from time import sleep
 from lib.network import object_sharer as objsh
 iname = _cfg.get('instance_name', '')
 objsh.root.set_instance_name(iname)
+objsh.helper.set_signal_rate(_cfg.get('signal_rate', objsh.SIGNAL_RATE))
+objsh.helper.set_compression(_cfg.get('network_compression', 'auto'))
+objsh.helper.set_shared_memory(_cfg.get('network_shared_memory', objsh.SHM_ENABLED))
 print 'Setting instance name to %s' % iname
 from lib.network import share_gtk
 share_gtk.start_server('localhost', port=_cfg.get('port', objsh.PORT))
@@ -81,7 +81,8 @@ class Agilent_34410A(Instrument):
         self.add_parameter('trigger_delay',
             flags=Instrument.FLAG_GETSET|Instrument.FLAG_GET_AFTER_SET, units='s', minval=0., maxval=3600., type=types.FloatType)
         self.add_parameter('readval',
-            flags=Instrument.FLAG_GET, units='V', type=types.FloatType)
+            flags=Instrument.FLAG_GET, units='V', type=types.FloatType,
+            buffered=Instrument.FLAG_GET)
 
         self.add_function('reset')
         self.add_function('get_all')
@@ -173,6 +174,47 @@ class Agilent_34410A(Instrument):
         s = self._visainstrument.ask('FETC?')
         return numpy.array([float(n) for n in s.split(',')])
 
+    def do_arm_buffered(self, sets, gets, npoints, interval):
+        '''
+        Prepare to take npoints readings, one every interval seconds by
+        the sample timer, starting half an interval after the trigger.
+        With trigger source 'EXT' every external trigger takes one reading
+        instead. The settings are restored after the sweep.
+        '''
+
+        logging.debug(__name__ + ' : arm buffered readout of %d points' % npoints)
+        self._buffered_settings = self.get(['samples_per_trigger',
+            'trigger_delay'], query=False)
+        if self.get_trigger_source(query=False) == 'EXT':
+            self._visainstrument.write('TRIG:COUN %u' % npoints)
+            ok = self.set_samples_per_trigger(1)
+        else:
+            self._visainstrument.write('SAMP:SOUR TIM')
+            self._visainstrument.write('SAMP:TIM %s' % interval)
+            ok = self.set_samples_per_trigger(npoints) and \
+                self.set_trigger_delay(interval / 2)
+        if not ok:
+            self.do_abort_buffered()
+        return ok
+
+    def do_trigger_buffered(self):
+        self.measurement_init()
+        if self.get_trigger_source(query=False) == 'BUS':
+            self.measurement_trigger()
+
+    def do_fetch_buffered(self):
+        try:
+            vals = self.measurement_fetch()
+        finally:
+            self.do_abort_buffered()
+        return {'readval': vals}
+
+    def do_abort_buffered(self):
+        self._visainstrument.write('ABOR')
+        self._visainstrument.write('SAMP:SOUR IMM')
+        self._visainstrument.write('TRIG:COUN 1')
+        self.set(self._buffered_settings)
+
     def get_all(self):
         '''
         Reads all implemented parameters from the instrument,
@@ -185,21 +227,91 @@ class Agilent_34410A(Instrument):
             None
         '''
         logging.info(__name__ + ' : get all')
-        self.get_measurement_function()
-        self.get_res_nplc()
-        self.get_res_autorange()
-        self.get_res_range()
-        self.get_v_nplc()
-        self.get_v_autorange()
-        self.get_v_range()
-        self.get_vac_autorange()
-        self.get_vac_range()
-        self.get_vac_bandwidth()
-        self.get_offset_compensation()
-        self.get_subtract_res_null_value()
-        self.get_res_null_value()
-        self.get_samples_per_trigger()
-        self.get_trigger_delay()
+        self.get(['measurement_function', 'res_nplc', 'res_autorange',
+            'res_range', 'v_nplc', 'v_autorange', 'v_range', 'vac_autorange',
+            'vac_range', 'vac_bandwidth', 'offset_compensation',
+            'subtract_res_null_value', 'res_null_value',
+            'samples_per_trigger', 'trigger_delay'])
+
+    # Parameters that can be combined in a single query or command
+    _SCPI_PARAMETERS = {
+        'res_nplc': ('SENS:RES:NPLC', float),
+        'res_autorange': ('SENS:RES:RANG:AUTO', bool),
+        'res_range': ('SENS:RES:RANG', float),
+        'v_nplc': ('SENS:VOLT:DC:NPLC', float),
+        'v_autorange': ('SENS:VOLT:DC:RANG:AUTO', bool),
+        'v_range': ('SENS:VOLT:DC:RANG', float),
+        'vac_autorange': ('SENS:VOLT:AC:RANG:AUTO', bool),
+        'vac_range': ('SENS:VOLT:AC:RANG', float),
+        'vac_bandwidth': ('SENS:VOLT:AC:BAND', float),
+        'offset_compensation': ('SENS:RES:OCOM', bool),
+        'subtract_res_null_value': ('SENS:RES:NULL', bool),
+        'res_null_value': ('SENS:RES:NULL:VAL', float),
+        'samples_per_trigger': ('SAMP:COUN', int),
+        'trigger_delay': ('TRIG:DEL', float),
+    }
+
+    def do_get_many(self, names):
+        '''
+        Read several settings with one compound query. Called by get()
+        with a list of parameter names, parameters that are not in
+        _SCPI_PARAMETERS are read separately.
+
+        Input:
+            names (list of strings)
+
+        Output:
+            dictionary of parameter name -> value
+        '''
+        names = [n for n in names if n in self._SCPI_PARAMETERS]
+        if len(names) < 2:
+            return {}
+
+        q = ';'.join([':%s?' % self._SCPI_PARAMETERS[n][0] for n in names])
+        r = self._visainstrument.ask(q)
+        logging.debug(__name__ + ' : get %s: %s' % (q, r))
+
+        replies = r.split(';')
+        if len(replies) != len(names):
+            logging.warning(__name__ + ' : unexpected reply to %s: %s' % (q, r))
+            return {}
+
+        values = {}
+        for name, reply in zip(names, replies):
+            ptype = self._SCPI_PARAMETERS[name][1]
+            if ptype is bool:
+                values[name] = bool(int(reply))
+            else:
+                values[name] = ptype(reply)
+        return values
+
+    def do_set_many(self, values):
+        '''
+        Set several settings with one compound command.
+
+        Input:
+            values (dict) : parameter name -> value
+
+        Output:
+            names (list of strings) : the parameters that were set
+        '''
+        names = [n for n in values if n in self._SCPI_PARAMETERS]
+        if len(names) < 2:
+            return []
+
+        cmds = []
+        for name in names:
+            cmd, ptype = self._SCPI_PARAMETERS[name]
+            val = values[name]
+            if ptype is bool:
+                val = int(val)
+            elif ptype is int:
+                val = '%u' % val
+            cmds.append(':%s %s' % (cmd, val))
+        cmd = ';'.join(cmds)
+        logging.debug(__name__ + ' : set %s' % cmd)
+        self._visainstrument.write(cmd)
+        return names
 
     def do_get_measurement_function(self):
         '''
@@ -21,9 +21,12 @@ from instrument import Instrument
 import types
 import pyvisa.vpp43 as vpp43
 from time import sleep
+import time
 import logging
 import numpy
+import qt
 from lib import visafunc
+from lib.pacing import Pacer
 
 class IVVI(Instrument):
     '''
@@ -84,7 +87,8 @@ class IVVI(Instrument):
             channels=(1, self._numdacs),
             maxstep=10, stepdelay=50,
             units='mV', format='%.02f',
-            tags=['sweep'])
+            tags=['sweep'],
+            buffered=Instrument.FLAG_SET)
         
         self._open_serial_connection()
 
@@ -241,6 +245,84 @@ class IVVI(Instrument):
         reply = self._send_and_read(message)
         return reply
 
+    def do_arm_buffered(self, sets, gets, npoints, interval):
+        '''
+        Prepare a buffered sweep of the dacs in 'sets'. The rack has no
+        memory for setpoints, so the messages are prepared here and sent
+        every interval seconds by do_trigger_buffered(). Readers are not
+        triggered by the rack, they should sample on their own timer.
+        '''
+
+        messages = []
+        for name, values in sets.iteritems():
+            channel = self.get_parameter_options(name)['channel']
+            dac_messages = []
+            for mvoltage in values:
+                (DataH, DataL) = self._mvoltage_to_bytes(mvoltage - self.pol_num[channel-1])
+                dac_messages.append("%c%c%c%c%c%c%c" % (7, 0, 2, 1, channel, DataH, DataL))
+            messages.append(dac_messages)
+
+        self._buffered_messages = zip(*messages)
+        self._buffered_sets = sets
+        self._buffered_interval = interval
+        self._buffered_stop = False
+        self._buffered_sent = 0
+        self._buffered_sending = False
+        return True
+
+    def do_trigger_buffered(self):
+        '''
+        Step through the setpoints, setting point k at k * interval seconds
+        after the start. Returns when the sweep is done or aborted, events
+        are handled in between the steps.
+        '''
+
+        steps = self._buffered_messages
+        late = 0
+        pacer = Pacer(idle=qt.flow.service_events)
+        pacer.start()
+        for i, messages in enumerate(steps):
+            if i > 0 and pacer.next(self._buffered_interval) > 0:
+                late += 1
+            # Set by do_abort_buffered(), e.g. from Measurement.stop()
+            if self._buffered_stop:
+                logging.info('Buffered sweep stopped after %d of %d setpoints',
+                    i, len(steps))
+                break
+            # If sending fails halfway, the dac values are unknown
+            self._buffered_sending = True
+            for message in messages:
+                self._send_and_read(message)
+            self._buffered_sending = False
+            self._buffered_sent = i + 1
+
+        if late > 0:
+            logging.warning('%d of %d setpoints were late, interval too short',
+                late, len(steps))
+
+    def do_fetch_buffered(self):
+        self._buffered_messages = []
+        return {}
+
+    def do_abort_buffered(self):
+        '''
+        Stop the sweep and return the last setpoint sent to every dac, or
+        an empty dictionary if it is not known.
+        '''
+
+        self._buffered_stop = True
+        self._buffered_messages = []
+        if self._buffered_sending:
+            return {}
+
+        last = {}
+        for name, values in self._buffered_sets.iteritems():
+            if self._buffered_sent > 0:
+                last[name] = values[self._buffered_sent - 1]
+            else:
+                last[name] = self.get(name, query=False)
+        return last
+
     def _get_dacs(self):
         '''
         Reads from device and returns all dacvoltages in a list
@@ -25,6 +25,7 @@ import visa
 import types
 import logging
 import numpy
+import time
 
 import qt
 
@@ -108,7 +109,8 @@ class Keithley_2700(Instrument):
         self.add_parameter('readval', flags=Instrument.FLAG_GET,
             units='AU',
             type=types.FloatType,
-            tags=['measure'])
+            tags=['measure'],
+            buffered=Instrument.FLAG_GET)
         self.add_parameter('readlastval', flags=Instrument.FLAG_GET,
             units='AU',
             type=types.FloatType,
@@ -231,23 +233,11 @@ class Keithley_2700(Instrument):
         '''
         logging.info('Get all relevant data from device')
         self.get_mode()
-        self.get_range()
-        self.get_trigger_continuous()
-        self.get_trigger_count()
-        self.get_trigger_delay()
-        self.get_trigger_source()
-        self.get_trigger_timer()
-        self.get_mode()
-        self.get_digits()
-        self.get_integrationtime()
-        self.get_nplc()
-        self.get_display()
-        self.get_autozero()
-        self.get_averaging()
-        self.get_averaging_window()
-        self.get_averaging_count()
-        self.get_averaging_type()
-        self.get_autorange()
+        self.get(['range', 'trigger_continuous', 'trigger_count',
+            'trigger_delay', 'trigger_source', 'trigger_timer', 'digits',
+            'integrationtime', 'nplc', 'display', 'autozero', 'averaging',
+            'averaging_window', 'averaging_count', 'averaging_type',
+            'autorange'])
 
 # Link old read and readlast to new routines:
     # Parameters are for states of the machnine and functions
@@ -461,6 +451,70 @@ class Keithley_2700(Instrument):
         self._visainstrument.write(':ABOR')
 
 
+    _BUFFERED_SETTINGS = ('trigger_count', 'trigger_source', 'trigger_timer',
+        'trigger_delay', 'trigger_continuous')
+
+    def do_arm_buffered(self, sets, gets, npoints, interval):
+        '''
+        Prepare to store npoints readings in the internal buffer. The
+        readings are triggered by the trigger timer every interval seconds,
+        half an interval after each timer tick, unless the trigger source
+        is external; then every trigger takes one reading.
+        The trigger settings are restored after the sweep.
+        '''
+
+        logging.debug('Arm buffered readout of %d points', npoints)
+        self._visainstrument.write(':ABOR')
+        self._buffered_settings = self.get(self._BUFFERED_SETTINGS,
+            query=False)
+        self._buffered_npoints = npoints
+        self._buffered_timeout = npoints * interval + 10
+
+        self.set_trigger_continuous(False)
+        self._visainstrument.write(':TRAC:CLE')
+        self._visainstrument.write(':TRAC:POIN %d' % npoints)
+        self._visainstrument.write(':TRAC:FEED SENS')
+        self._visainstrument.write(':TRAC:FEED:CONT NEXT')
+        self.set_trigger_count(npoints)
+        source = self._buffered_settings.get('trigger_source', '')
+        if not str(source).upper().startswith('EXT'):
+            self.set_trigger_source('TIM')
+            self.set_trigger_timer(interval)
+            self.set_trigger_delay(interval / 2)
+        return True
+
+    def do_trigger_buffered(self):
+        self._visainstrument.write(':INIT')
+
+    def do_fetch_buffered(self):
+        '''
+        Wait until the buffer is full and read it.
+        '''
+
+        try:
+            deadline = time.time() + self._buffered_timeout
+            while int(self._visainstrument.ask(':TRAC:POIN:ACT?')) < \
+                    self._buffered_npoints:
+                if time.time() > deadline:
+                    raise ValueError('Timeout waiting for buffered readings')
+                qt.msleep(0.05)
+
+            text = self._visainstrument.ask(':TRAC:DATA?')
+            vals = numpy.array([float(v[0:15]) for v in text.split(',')])
+        finally:
+            self.do_abort_buffered()
+
+        return {'readval': vals}
+
+    def do_abort_buffered(self):
+        self._visainstrument.write(':ABOR')
+        self._visainstrument.write(':TRAC:FEED:CONT NEV')
+        for key in self._BUFFERED_SETTINGS:
+            val = self._buffered_settings.get(key, None)
+            if val is not None:
+                self.set(key, val)
+
+
 # --------------------------------------
 #           parameters
 # --------------------------------------
@@ -1079,6 +1133,92 @@ class Keithley_2700(Instrument):
         elif ans.startswith('MOV'):
             ans='moving'
         return ans
+
+    # Parameters that can be combined in a single query or command:
+    # (mode or None for the current mode, parameter, type, settable)
+    # integrationtime and nplc are not set together, since setting one
+    # changes the other.
+    _FUNC_PARAMETERS = {
+        'range': (None, 'RANG', float, True),
+        'digits': (None, 'DIG', int, True),
+        'integrationtime': (None, 'APER', float, False),
+        'nplc': (None, 'NPLC', float, False),
+        'trigger_continuous': ('INIT', 'CONT', bool, True),
+        'trigger_delay': ('TRIG', 'DEL', float, True),
+        'display': ('DISP', 'ENAB', bool, True),
+        'autozero': ('SYST', 'AZER:STAT', bool, True),
+        'averaging': (None, 'AVER:STAT', bool, True),
+        'averaging_window': (None, 'AVER:WIND', float, True),
+        'averaging_count': (None, 'AVER:COUN', int, True),
+        'autorange': (None, 'RANG:AUTO', bool, True),
+    }
+
+    def do_get_many(self, names):
+        '''
+        Read several settings with one compound query. Called by get()
+        with a list of parameter names, parameters that are not in
+        _FUNC_PARAMETERS are read separately.
+
+        Input:
+            names (list of strings) : parameter names
+
+        Output:
+            dictionary of parameter name -> value
+        '''
+        names = [n for n in names if n in self._FUNC_PARAMETERS]
+        if len(names) < 2:
+            return {}
+
+        queries = []
+        for name in names:
+            mode, par, ptype, settable = self._FUNC_PARAMETERS[name]
+            queries.append(':%s:%s?' % (self._determine_mode(mode), par))
+        string = ';'.join(queries)
+        ans = self._visainstrument.ask(string)
+        logging.debug('ask instrument for %s (result %s)' % (string, ans))
+
+        replies = ans.split(';')
+        if len(replies) != len(names):
+            logging.warning('Unexpected reply to %s: %s' % (string, ans))
+            return {}
+
+        values = {}
+        for name, reply in zip(names, replies):
+            ptype = self._FUNC_PARAMETERS[name][2]
+            if ptype is bool:
+                values[name] = bool(int(reply))
+            else:
+                values[name] = ptype(reply)
+        return values
+
+    def do_set_many(self, values):
+        '''
+        Set several settings with one compound command. Called by set()
+        with a dictionary of parameter name -> value.
+
+        Input:
+            values (dict) : parameter name -> value
+
+        Output:
+            names (list of strings) : the parameters that were set
+        '''
+        names = [n for n in values if n in self._FUNC_PARAMETERS and \
+                self._FUNC_PARAMETERS[n][3]]
+        if len(names) < 2:
+            return []
+
+        commands = []
+        for name in names:
+            mode, par, ptype, settable = self._FUNC_PARAMETERS[name]
+            val = values[name]
+            if ptype is bool:
+                val = bool_to_str(val)
+            commands.append(':%s:%s %s' % (self._determine_mode(mode), par, val))
+        string = ';'.join(commands)
+        logging.debug('Set instrument to %s' % string)
+        self._visainstrument.write(string)
+        return names
+
 # --------------------------------------
 #           Internal Routines
 # --------------------------------------
@@ -34,6 +34,8 @@ class NI_DAQ(Instrument):
         Instrument.__init__(self, name, tags=['physical'])
 
         self._id = id
+        self._ai_task = None
+        self._ao_task = None
 
         for ch_in in self._get_input_channels():
             ch_in = _get_channel(ch_in)
@@ -43,7 +45,8 @@ class NI_DAQ(Instrument):
                 units='V',
                 tags=['measure'],
                 get_func=self.do_get_input,
-                channel=ch_in)
+                channel=ch_in,
+                buffered=Instrument.FLAG_GET)
 
         for ch_out in self._get_output_channels():
             ch_out = _get_channel(ch_out)
@@ -53,7 +56,8 @@ class NI_DAQ(Instrument):
                 units='V',
                 tags=['sweep'],
                 set_func=self.do_set_output,
-                channel=ch_out)
+                channel=ch_out,
+                buffered=Instrument.FLAG_SET)
 
         for ch_ctr in self._get_counter_channels():
             ch_ctr = _get_channel(ch_ctr)
@@ -134,6 +138,67 @@ class NI_DAQ(Instrument):
             srcs.append(self.get(chan + "_src"))
         return nidaq.read_counters(chans, src=srcs, freq=1.0/self._count_time)
 
+    def _get_devchan(self, name):
+        return '%s/%s' % (self._id, self.get_parameter_options(name)['channel'])
+
+    def do_arm_buffered(self, sets, gets, npoints, interval):
+        '''
+        Prepare a buffered sweep. The outputs in 'sets' are updated by the
+        sample clock; the inputs in 'gets' are sampled on the same clock,
+        half an interval after each update.
+        '''
+
+        self.do_abort_buffered()
+        freq = 1.0 / interval
+        clock = ''
+        try:
+            if len(sets) > 0:
+                names = sets.keys()
+                self._ao_task = nidaq.create_ao_task(
+                        [self._get_devchan(name) for name in names],
+                        [sets[name] for name in names], freq)
+                clock = '/%s/ao/SampleClock' % self._id
+            if len(gets) > 0:
+                self._ai_task = nidaq.create_ai_task(
+                        [self._get_devchan(name) for name in gets],
+                        npoints, freq, config=self._chan_config,
+                        clock=clock, delay=interval / 2)
+        except:
+            self.do_abort_buffered()
+            raise
+
+        self._ai_names = gets
+        self._ai_samples = npoints
+        self._ai_timeout = npoints * interval + 10
+        return True
+
+    def do_trigger_buffered(self):
+        # The inputs wait for the output sample clock
+        if self._ai_task is not None:
+            nidaq.start_task(self._ai_task)
+        if self._ao_task is not None:
+            nidaq.start_task(self._ao_task)
+
+    def do_fetch_buffered(self):
+        ret = {}
+        try:
+            if self._ai_task is not None:
+                data = nidaq.read_task(self._ai_task, len(self._ai_names),
+                        self._ai_samples, timeout=self._ai_timeout)
+                ret = dict(zip(self._ai_names, data))
+            if self._ao_task is not None:
+                nidaq.wait_task(self._ao_task, timeout=self._ai_timeout)
+        finally:
+            self.do_abort_buffered()
+        return ret
+
+    def do_abort_buffered(self):
+        for task in (self._ai_task, self._ao_task):
+            if task is not None:
+                nidaq.clear_task(task)
+        self._ai_task = None
+        self._ao_task = None
+
     # Dummy
     def do_set_counter_src(self, val, channel):
         return True
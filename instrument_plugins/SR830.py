@@ -234,30 +234,13 @@ class SR830(Instrument):
             None
         '''
         logging.info(__name__ + ' : reading all settings from instrument')
-        self.get_sensitivity()
-        self.get_tau()
-        self.get_tau_in_seconds()
-        self.get_frequency()
-        self.get_amplitude()
-        self.get_phase()
-        self.get_X()
-        self.get_Y()
-        self.get_R()
-        self.get_P()
-        self.get_ref_input()
-        self.get_ext_trigger()
-        self.get_sync_filter()
-        self.get_harmonic()
-        self.get_input_config()
-        self.get_input_shield()
-        self.get_input_coupling()
-        self.get_notch_filter()
-        self.get_reserve()
-        self.get_filter_slope()
-        self.get_unlocked()
-        self.get_input_overload()
-        self.get_time_constant_overload()
-        self.get_output_overload()
+        # X, Y, R, P and frequency are read at once with SNAP?
+        self.get(['sensitivity', 'tau', 'tau_in_seconds', 'frequency',
+            'amplitude', 'phase', 'X', 'Y', 'R', 'P', 'ref_input',
+            'ext_trigger', 'sync_filter', 'harmonic', 'input_config',
+            'input_shield', 'input_coupling', 'notch_filter', 'reserve',
+            'filter_slope', 'unlocked', 'input_overload',
+            'time_constant_overload', 'output_overload'])
 
     def __ask(self, msg):
       ''' Internal helper that retries a few times in case the first attempt to communicate with the instrument fails. '''
@@ -497,6 +480,34 @@ class SR830(Instrument):
         '''
         return self.read_output(4, ovl)
 
+    # Parameters that can be read together with SNAP?, and their index
+    _SNAP_PARAMETERS = {
+        'X': 1, 'Y': 2, 'R': 3, 'P': 4,
+        'in1': 5, 'in2': 6, 'in3': 7, 'in4': 8,
+        'frequency': 9,
+    }
+
+    def do_get_many(self, names):
+        '''
+        Read up to six of X, Y, R, P, in1-in4 and frequency simultaneously
+        using SNAP?. Called by get() with a list of parameter names, other
+        parameters are read separately.
+
+        Input:
+            names (list of strings) : parameter names
+
+        Output:
+            dictionary of parameter name -> value
+        '''
+        names = [n for n in names if n in self._SNAP_PARAMETERS][:6]
+        if len(names) < 2:
+            return {}
+
+        idx = ','.join(['%d' % self._SNAP_PARAMETERS[n] for n in names])
+        logging.debug(__name__ + ' : Reading parameters %s' % ', '.join(names))
+        reply = self.__ask('SNAP?%s' % idx)
+        return dict(zip(names, [float(v) for v in reply.split(',')]))
+
     def do_set_frequency(self, frequency):
         '''
         Set frequency of the local oscillator
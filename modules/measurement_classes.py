@@ -17,9 +17,13 @@ iterator2=0
 
 import qt
 reload(qt)
+from lib.readout import ParallelReader
 
 settings=qt.instruments.get('Measurement-Settings')
 
+# Read the values of instruments with a different lock class concurrently
+parallel_readout=False
+
 def execute_function_list(function_list):
     for function_tuple in function_list:
         function=function_tuple[0]
@@ -206,27 +210,29 @@ def launch2Dmeasurement(measurement_name):
     points=arange(0.0,settings.get_npoints_x()+1,1.0) # points: array of steps, including hysteresis
     if settings.get_hysteretic_x():
         points=concatenate((points,points[::-1]))
-    qt.mstart() #Send Start signal to qt
-    #Measurement Loop
-    for point in points:
-        result=list() #list to fill with data point (x1,x2,x3,y1,y2,y3,...)
-        # set all the coordinates
-        for coordinate in settings.get_coordinates_x():
-            #Calculate value to set
-            setvalue=((coordinate[3]-coordinate[2])*point)/settings.get_npoints_x()+coordinate[2]
-            result.append(setvalue)
-            setdevicevalue(coordinate[0],coordinate[1], setvalue)
-        # wait for result 
-        qt.msleep(settings.get_waittime())
-        # execute the functions to prepare the reading
-        execute_function_list_point
-        # read out all the values
-        for value in settings.get_values():
-            y=getdevicevalue(value['instrument'],value['parameter'])
-            result.append(y)
-        # save the data point
-        data.add_data_point(*result)
-        data.emit('new-data-point')
+    reader=create_value_reader()
+    try:
+        qt.mstart() #Send Start signal to qt
+        #Measurement Loop
+        for point in points:
+            result=list() #list to fill with data point (x1,x2,x3,y1,y2,y3,...)
+            # set all the coordinates
+            for coordinate in settings.get_coordinates_x():
+                #Calculate value to set
+                setvalue=((coordinate[3]-coordinate[2])*point)/settings.get_npoints_x()+coordinate[2]
+                result.append(setvalue)
+                setdevicevalue(coordinate[0],coordinate[1], setvalue)
+            # wait for result 
+            qt.msleep(settings.get_waittime())
+            # execute the functions to prepare the reading
+            execute_function_list_point
+            # read out all the values
+            result.extend(getdevicevalues(reader))
+            # save the data point
+            data.add_data_point(*result)
+            data.emit('new-data-point')
+    finally:
+        close_value_reader(reader)
     
     #################################################################
     # Closing
@@ -268,53 +274,57 @@ def launch3Dmeasurement(measurement_name):
     if settings.get_hysteretic_y():
         points_y=concatenate((points_y,points_y[::-1]))    
     data_mem=zeros((len(points_x),len(settings.get_values())+len(settings.get_coordinates_y())+len(settings.get_coordinates_x()))) #allocate memory for one data block
+    reader=create_value_reader()
     
-    #Outer-Loop
-    for j,point_y in enumerate(points_y):
-        #Set the y_coordinates according to point_y in points_y
-        for index,coordinate in enumerate(settings.get_coordinates_y()):
-            #Calculate value to set
-            setvalue=((coordinate[3]-coordinate[2])*point_y)/settings.get_npoints_y()+coordinate[2]
-            setdevicevalue(coordinate[0],coordinate[1], setvalue)
-            data_mem[:,len(settings.get_coordinates_x())+index]=setvalue
-        #Run the list of functions in settings._init_sweep
-        initialize_sweep()
-        
-        #Inner-Loop
-        for i,point_x in enumerate(points_x):  #start sweep loop
-            #Set the x_coordinates according to point_x in points_x
-            for index,coordinate in enumerate(settings.get_coordinates_x()):
+    try:
+        #Outer-Loop
+        for j,point_y in enumerate(points_y):
+            #Set the y_coordinates according to point_y in points_y
+            for index,coordinate in enumerate(settings.get_coordinates_y()):
                 #Calculate value to set
-                setvalue=((coordinate[3]-coordinate[2])*point_x)/settings.get_npoints_x()+coordinate[2]
+                setvalue=((coordinate[3]-coordinate[2])*point_y)/settings.get_npoints_y()+coordinate[2]
                 setdevicevalue(coordinate[0],coordinate[1], setvalue)
-                data_mem[i,index]=setvalue             
+                data_mem[:,len(settings.get_coordinates_x())+index]=setvalue
+            #Run the list of functions in settings._init_sweep
+            initialize_sweep()
+        
+            #Inner-Loop
+            for i,point_x in enumerate(points_x):  #start sweep loop
+                #Set the x_coordinates according to point_x in points_x
+                for index,coordinate in enumerate(settings.get_coordinates_x()):
+                    #Calculate value to set
+                    setvalue=((coordinate[3]-coordinate[2])*point_x)/settings.get_npoints_x()+coordinate[2]
+                    setdevicevalue(coordinate[0],coordinate[1], setvalue)
+                    data_mem[i,index]=setvalue             
             
-            # wait for result 
-            qt.msleep(settings.get_waittime())
-            # execute the functions to prepare the reading
-            execute_function_list_point
+                # wait for result 
+                qt.msleep(settings.get_waittime())
+                # execute the functions to prepare the reading
+                execute_function_list_point
             
-            # read out all the values
-            for index,value in enumerate(settings.get_values()):
-                y=getdevicevalue(value['instrument'],value['parameter'])
-                data_mem[i,index+len(settings.get_coordinates_y())+len(settings.get_coordinates_x())]=y
+                # read out all the values
+                offset=len(settings.get_coordinates_y())+len(settings.get_coordinates_x())
+                for index,y in enumerate(getdevicevalues(reader)):
+                    data_mem[i,index+offset]=y
         
-        #Indicate Remaining Time
-        if j==0: starttime=time()
-        elif j==1:
-            timenow=time()
-            runtime=(timenow-starttime)*len(points_y)
-            print 'The 3D scan takes %d min and will be finished at %s.' % (runtime/60, ctime(2*starttime+runtime-timenow))
-            print ''
+            #Indicate Remaining Time
+            if j==0: starttime=time()
+            elif j==1:
+                timenow=time()
+                runtime=(timenow-starttime)*len(points_y)
+                print 'The 3D scan takes %d min and will be finished at %s.' % (runtime/60, ctime(2*starttime+runtime-timenow))
+                print ''
             
-        #For Serpentine Measurement: reverse x axis.
-        if settings.get_serpentine() and not settings.get_hysteretic_x(): 
-            data_mem=array(sorted(data_mem, key=itemgetter(len(settings.get_coordinates_x()),0))) #in serpentine mode the data block has to be sort otherwise live plotting does not work
-            points_x=points_x[::-1]# reverse step order when measuring with serpentine=True
-        #Save Data Point
-        data.add_data_point(*(data_mem.transpose())) #the data block is saved
-        data.new_block() #this is a marker for the end of the data block that is required for gnuplot
-        terminate_sweep()
+            #For Serpentine Measurement: reverse x axis.
+            if settings.get_serpentine() and not settings.get_hysteretic_x(): 
+                data_mem=array(sorted(data_mem, key=itemgetter(len(settings.get_coordinates_x()),0))) #in serpentine mode the data block has to be sort otherwise live plotting does not work
+                points_x=points_x[::-1]# reverse step order when measuring with serpentine=True
+            #Save Data Point
+            data.add_data_point(*(data_mem.transpose())) #the data block is saved
+            data.new_block() #this is a marker for the end of the data block that is required for gnuplot
+            terminate_sweep()
+    finally:
+        close_value_reader(reader)
     #################################################################
     # Closing
     #################################################################    
@@ -376,6 +386,51 @@ def getdevicevalue(device_name,parameter_name):
     except:
         return -1
         
+def create_value_reader():
+    '''
+    Creates a ParallelReader for the values in settings if parallel_readout
+    is enabled, reading instruments with a different lock class at the same
+    time. Failing reads give -1, like getdevicevalue.
+    Output: ParallelReader or None
+    '''
+    if not parallel_readout:
+        return None
+    items=list()
+    for value in settings.get_values():
+        device=qt.instruments.get(value['instrument'])
+        if device is None:
+            items.append(lambda: -1)
+        else:
+            items.append((device,value['parameter']))
+    return ParallelReader(items,error_value=-1)
+
+def getdevicevalues(reader=None):
+    '''
+    Gets all the values in settings, with reader if given
+    Input:
+        reader: ParallelReader from create_value_reader() or None
+    Output: list of values
+    '''
+    if reader is not None:
+        return reader.read()
+    return [getdevicevalue(value['instrument'],value['parameter']) for value in settings.get_values()]
+
+def close_value_reader(reader):
+    '''
+    Prints the readout time per point and stops the reader
+    Input:
+        reader: ParallelReader from create_value_reader() or None
+    '''
+    if reader is None:
+        return
+    stats=reader.get_stats()
+    if stats['point'] is not None:
+        print 'Readout: %.1f ms per point (min %.1f ms, max %.1f ms)' % (stats['point']['mean']*1e3, stats['point']['min']*1e3, stats['point']['max']*1e3)
+        for name,group in sorted(stats['groups'].items()):
+            if group is not None:
+                print '    %s: %.1f ms' % (name,group['mean']*1e3)
+    reader.close()
+
 def getinstrumentstatus():
     '''
     Gets the current status of all the parameters of all the instruments
@@ -27,15 +27,17 @@ import logging
 import copy
 import shutil
 import pickle
+import itertools
+import json
 
 from gettext import gettext as _L
 
-from lib import namedlist, temp
+from lib import namedlist, temp, datawriter
 from lib.misc import dict_to_ordered_tuples, get_arg_type
 from lib.config import get_config
 config = get_config()
 in_qtlab = config.get('qtlab', False)
-from lib.network.object_sharer import SharedGObject, cache_result
+from lib.network.object_sharer import SharedGObject, cache_result, shm_empty
 
 if in_qtlab:
     import qt
@@ -325,6 +327,319 @@ class _DataList(namedlist.NamedList):
         else:
             return name
 
+class _RowBuffer:
+    '''
+    Growable 2d array to store data points in memory.
+
+    Rows are copied into a preallocated array whose capacity is doubled
+    when it is full, so appending costs amortized O(1) per row instead of
+    the full copy done by numpy.append. get() returns a view on the rows
+    filled so far.
+
+    If shared is True the array is allocated in shared memory, so that
+    clients on the same host (e.g. the GUI) can map it instead of
+    receiving a copy.
+    '''
+
+    MIN_CAPACITY = 1024
+
+    def __init__(self, data=None, shared=False):
+        self._buf = None
+        self._n = 0
+        self._view = None
+        if shared:
+            self._empty = shm_empty
+        else:
+            self._empty = numpy.empty
+
+        if data is not None and len(data) > 0:
+            data = numpy.asarray(data)
+            if len(data.shape) == 1:
+                data = data.reshape((len(data), 1))
+            self.append(data)
+
+    def __len__(self):
+        return self._n
+
+    def get_capacity(self):
+        if self._buf is None:
+            return 0
+        return len(self._buf)
+
+    def wraps(self, data):
+        '''Return whether data is the view last returned by this buffer.'''
+        return self._view is not None and data is self._view
+
+    def _grow(self, nrows, dtype):
+        capacity = max(self.get_capacity(), self.MIN_CAPACITY)
+        while capacity < nrows:
+            capacity *= 2
+        newbuf = self._empty((capacity, self._buf.shape[1]), dtype=dtype)
+        newbuf[:self._n] = self._buf[:self._n]
+        self._buf = newbuf
+
+    def append(self, rows):
+        '''
+        Append a 2d array (or nested sequence) of rows and return a view
+        on all rows in the buffer.
+        '''
+
+        rows = numpy.asarray(rows)
+        nrows = rows.shape[0]
+        if self._buf is None:
+            capacity = max(self.MIN_CAPACITY, nrows)
+            self._buf = self._empty((capacity, rows.shape[1]), dtype=rows.dtype)
+        else:
+            if rows.shape[1] != self._buf.shape[1]:
+                raise ValueError('Trying to add %d columns to buffer with %d columns' % \
+                        (rows.shape[1], self._buf.shape[1]))
+            dtype = numpy.promote_types(self._buf.dtype, rows.dtype)
+            if self._n + nrows > len(self._buf) or dtype != self._buf.dtype:
+                self._grow(self._n + nrows, dtype)
+
+        self._buf[self._n:self._n + nrows] = rows
+        self._n += nrows
+        self._view = self._buf[:self._n]
+        return self._view
+
+    def get(self):
+        '''Return a view on the filled part of the buffer.'''
+        return self._view
+
+# Line types returned by _scan_lines()
+_LINE_DATA = 0
+_LINE_COMMENT = 1
+_LINE_EMPTY = 2
+
+def _scan_lines(buf, final=True):
+    '''
+    Split a chunk of a data file into lines using numpy.
+
+    Returns arrays (starts, ends, types) with the start and end offset
+    (excluding the line ending) and the type (_LINE_DATA, _LINE_COMMENT or
+    _LINE_EMPTY) of each line. If final is False an unterminated last line
+    is not included.
+
+    Returns (None, None, None) if the chunk contains a comment that does
+    not start at the beginning of a line, which is not supported.
+    '''
+
+    a = numpy.frombuffer(buf, dtype=numpy.uint8)
+    ends = numpy.flatnonzero(a == 10)
+    if final and len(a) > 0 and a[-1] != 10:
+        ends = numpy.append(ends, len(a))
+    starts = numpy.empty(len(ends), dtype=ends.dtype)
+    if len(ends) > 0:
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+
+    # Strip \r of \r\n line endings
+    nonempty = ends > starts
+    cr = numpy.zeros(len(ends), dtype=numpy.bool_)
+    cr[nonempty] = a[ends[nonempty] - 1] == 13
+    ends[cr] -= 1
+
+    types = numpy.zeros(len(ends), dtype=numpy.int8)
+    nonempty = ends > starts
+    first = numpy.zeros(len(ends), dtype=numpy.uint8)
+    first[nonempty] = a[starts[nonempty]]
+    types[~nonempty] = _LINE_EMPTY
+    types[first == 35] = _LINE_COMMENT
+
+    # Lines starting with white space are rare, check them one by one
+    for i in numpy.flatnonzero((first == 32) | (first == 9)):
+        line = buf[starts[i]:ends[i]].strip()
+        if len(line) == 0:
+            types[i] = _LINE_EMPTY
+        elif line.startswith('#'):
+            return None, None, None
+
+    # Any '#' should be in a comment line
+    hashes = numpy.flatnonzero(a[:ends[-1] if len(ends) > 0 else 0] == 35)
+    if len(hashes) > 0:
+        lineno = numpy.searchsorted(starts, hashes, side='right') - 1
+        if numpy.any(types[lineno] != _LINE_COMMENT):
+            return None, None, None
+
+    return starts, ends, types
+
+def _count_fields(buf, starts):
+    '''
+    Return the number of white space separated fields on each line of buf,
+    given the line start offsets from _scan_lines().
+    '''
+
+    a = numpy.frombuffer(buf, dtype=numpy.uint8)
+    ws = (a == 32) | (a == 9) | (a == 10) | (a == 13)
+    fieldstart = ~ws
+    fieldstart[1:] &= ws[:-1]
+    lineno = numpy.searchsorted(starts, numpy.flatnonzero(fieldstart), side='right') - 1
+    return numpy.bincount(lineno, minlength=len(starts))
+
+class _LazyTextArray:
+    '''
+    Read-only 2d array of the data rows in a text data file.
+
+    Nothing is kept in memory except a sparse index with the file offset of
+    every step'th data row. Indexing reads and parses only the requested
+    rows, in chunks of READ_SIZE bytes, so memory use is bounded by the
+    size of the result. Indexing with integers, slices, integer or boolean
+    arrays and a column index is supported and returns an ndarray.
+    '''
+
+    READ_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, filepath, offsets, step, nrows, nfields):
+        self._filepath = filepath
+        self._offsets = offsets
+        self._step = step
+        self.shape = (nrows, nfields)
+        self.ndim = 2
+        self.dtype = numpy.dtype(numpy.float64)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        ret = self._read(0, self.shape[0], types.SliceType(None))
+        if dtype is not None:
+            ret = ret.astype(dtype)
+        return ret
+
+    def copy(self):
+        '''Read all data and return it as an ndarray.'''
+        return self._read(0, self.shape[0], types.SliceType(None))
+
+    def _parse(self, buf, starts, ends):
+        seg = buf[starts[0]:ends[-1]]
+        # A '#' can only be in comment lines between the data lines
+        if '#' in seg:
+            seg = '\n'.join([buf[s:e] for s, e in itertools.izip(starts, ends)])
+        values = numpy.fromstring(seg, dtype=numpy.float64, sep=' ')
+        if values.size != len(starts) * self.shape[1]:
+            raise ValueError('Unable to parse data rows in %s' % self._filepath)
+        return values.reshape((len(starts), self.shape[1]))
+
+    def _iter_chunks(self, lo, hi):
+        '''
+        Generate (row, array) for consecutive chunks of data rows lo to hi
+        (exclusive), where row is the number of the first row in array.
+        '''
+
+        if lo >= hi:
+            return
+
+        k = lo // self._step
+        row = k * self._step
+        f = open(self._filepath, 'rb')
+        try:
+            f.seek(self._offsets[k])
+            rest = ''
+            while row < hi:
+                chunk = f.read(self.READ_SIZE)
+                final = len(chunk) == 0
+                buf = rest + chunk
+                if not final:
+                    nl = buf.rfind('\n')
+                    if nl < 0:
+                        rest = buf
+                        continue
+                    buf, rest = buf[:nl + 1], buf[nl + 1:]
+
+                starts, ends, ltypes = _scan_lines(buf)
+                if starts is None:
+                    raise ValueError('Unsupported data layout in %s' % self._filepath)
+                isdata = (ltypes == _LINE_DATA)
+                starts, ends = starts[isdata], ends[isdata]
+
+                a = max(lo - row, 0)
+                b = min(hi - row, len(starts))
+                if a < b:
+                    yield row + a, self._parse(buf, starts[a:b], ends[a:b])
+                row += len(starts)
+
+                if final:
+                    if row < hi:
+                        raise IOError('File %s is shorter than its index' % self._filepath)
+                    break
+        finally:
+            f.close()
+
+    def _read(self, lo, hi, cols, step=1):
+        '''Return every step'th row from lo to hi, with columns cols.'''
+
+        pieces = [numpy.zeros((0, self.shape[1]))[:, cols]]
+        for row, chunk in self._iter_chunks(lo, hi):
+            first = (lo - row) % step
+            pieces.append(chunk[first::step, cols])
+        return numpy.concatenate(pieces)
+
+    def _read_rows(self, rows, cols):
+        '''Return the rows in integer array rows, with columns cols.'''
+
+        order = numpy.argsort(rows, kind='mergesort')
+        srows = rows[order]
+        pieces = []
+        for row, chunk in self._iter_chunks(srows[0], srows[-1] + 1):
+            i0, i1 = numpy.searchsorted(srows, [row, row + len(chunk)])
+            pieces.append(chunk[srows[i0:i1] - row][:, cols])
+        out = numpy.concatenate(pieces)
+        ret = numpy.empty_like(out)
+        ret[order] = out
+        return ret
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            if len(index) != 2:
+                raise IndexError('Too many indices')
+            rows, cols = index
+        else:
+            rows, cols = index, types.SliceType(None)
+
+        nrows = self.shape[0]
+        if isinstance(rows, (int, long, numpy.integer)):
+            if rows < 0:
+                rows += nrows
+            if rows < 0 or rows >= nrows:
+                raise IndexError('Index out of range')
+            return self._read(rows, rows + 1, cols)[0]
+
+        if isinstance(rows, types.SliceType):
+            start, stop, step = rows.indices(nrows)
+            if step > 0:
+                return self._read(start, stop, cols, step)
+            n = len(xrange(start, stop, step))
+            if n == 0:
+                return self._read(0, 0, cols)
+            last = start + (n - 1) * step
+            return self._read(last, start + 1, cols, -step)[::-1]
+
+        rows = numpy.asarray(rows)
+        if rows.dtype == numpy.bool_:
+            rows = numpy.flatnonzero(rows)
+        else:
+            rows = rows.astype(numpy.int64)
+            rows[rows < 0] += nrows
+        if len(rows) == 0:
+            return self._read(0, 0, cols)
+        if rows.min() < 0 or rows.max() >= nrows:
+            raise IndexError('Index out of range')
+        return self._read_rows(rows, cols)
+
+# Binary data files store the rows as raw little endian doubles in
+# <name>.bin, the meta data is kept in <name>.json.
+_BINARY_EXT = '.bin'
+_BINARY_HEADER_EXT = '.json'
+_BINARY_DTYPE = '<f8'
+_BINARY_FORMAT = 'qtlab-binary'
+_BINARY_VERSION = 1
+
+def _json_default(obj):
+    '''Convert objects json does not know about, e.g. numpy scalars.'''
+    if isinstance(obj, numpy.generic):
+        return obj.item()
+    return str(obj)
+
 class Data(SharedGObject):
     '''
     Data class
@@ -405,7 +720,10 @@ class Data(SharedGObject):
         kwargs input:
             name (string), default will be 'data<n>'
             infile (bool), default True
-            inmem (bool), default False if no file specified, True otherwise
+            inmem (bool), default False if no file specified, True otherwise.
+                If 'lazy' a data file is not loaded into memory; get_data()
+                returns an array-like object that reads only the rows that
+                are indexed. See set_filepath().
             tempfile (bool), default False. If True create a temporary file
                 for the data.
             binary (bool), default True. Whether tempfile should be binary.
@@ -420,6 +738,9 @@ class Data(SharedGObject):
                       ignored.
               True  --> the data point (row) is loaded
               False --> the data point (row) is ignored
+            follow, default False. Open a file that is still being written;
+                    an incomplete last line is not loaded and refresh()
+                    reads only the data appended since.
         '''
 
         # Init SharedGObject a bit lower
@@ -430,19 +751,30 @@ class Data(SharedGObject):
         self._cache_path = kwargs.get('cache_path', None)
         self._overwrite_cache = kwargs.get('overwrite_cache', False)
         self._load_row_mask = kwargs.get('row_mask')
+        self._follow = kwargs.get('follow', False)
+        # File offset up to which the data has been read in follow mode
+        self._follow_offset = None
         self._inmem = inmem
         self._tempfile = kwargs.get('tempfile', False)
         self._temp_binary = kwargs.get('binary', True)
         self._options = kwargs
         self._file = None
+        self._binary = False
+        self._writer = None
+        self._column_formats = None
         self._log_file_handler = None
         self._stop_req_hid = None
 
+        # Growable buffer backing self._data when adding points in memory
+        self._data_buffer = None
+
         # Dimension info
         self._dimensions = []
         self._block_sizes = []
         self._loopdims = None
+        self._loopsweeps = []
         self._loopshape = None
+        self._detected_npoints = None
         self._complete = False
         self._reshaped_data = None
 
@@ -517,6 +849,7 @@ class Data(SharedGObject):
 
     def __setitem__(self, index, val):
         self._data[index] = val
+        self._reshaped_data = None
 
 ### Data info
 
@@ -639,6 +972,13 @@ class Data(SharedGObject):
         Normally the data is just a 2D array, with a set of values on each
         'line'. However, if reshape is True, the data will be reshaped into
         the detected dimension sizes.
+
+        Data added with add_data_point() is returned as a view on the
+        internal buffer, so it is not copied; use .copy() if you want to
+        keep a snapshot.
+
+        For data opened with inmem='lazy' an array-like object is returned
+        that reads data from the file when it is indexed.
         '''
 
         if not self._inmem and self._infile:
@@ -709,6 +1049,15 @@ class Data(SharedGObject):
         fn, ext = os.path.splitext(self.get_filepath())
         return fn + '.log'
 
+    def get_header_filepath(self):
+        '''Return the path of the meta data file of binary data.'''
+        fn, ext = os.path.splitext(self.get_filepath())
+        return fn + _BINARY_HEADER_EXT
+
+    def is_binary(self):
+        '''Return whether the data file is in the binary format.'''
+        return self._binary
+
     def is_file_open(self):
         '''Return whether a file is open or not.'''
 
@@ -741,6 +1090,7 @@ class Data(SharedGObject):
             kwargs['size'] = 0
         self._ncoordinates += 1
         self._dimensions.append(kwargs)
+        self._column_formats = None
 
     def add_value(self, name, **kwargs):
         '''
@@ -761,12 +1111,13 @@ class Data(SharedGObject):
         kwargs['type'] = 'value'
         self._nvalues += 1
         self._dimensions.append(kwargs)
+        self._column_formats = None
 
     def add_comment(self, comment):
         '''Add comment to the Data object.'''
         self._comment.append([self.get_npoints(), comment])
-        if self._file is not None:
-            self._file.write('# %s\n' % comment)
+        if self._writer is not None and not self._binary:
+            self._writer.write('# %s\n' % comment)
 
     def get_comment(self, include_row_numbers=False):
         '''Return the comment for the Data object.'''
@@ -774,7 +1125,9 @@ class Data(SharedGObject):
 
 ### File writing
 
-    def create_file(self, name=None, filepath=None, settings_file=True, log_file=True, log_level=logging.INFO):
+    def create_file(self, name=None, filepath=None, settings_file=True, log_file=True, log_level=logging.INFO,
+            flush_rows=None, flush_interval=None, flush_on_block=None,
+            async_write=None, binary=None):
         '''
         Create a new data file and leave it open. In addition a
         settings file is generated, unless settings_file=False is
@@ -783,6 +1136,36 @@ class Data(SharedGObject):
 
         This function should be called after adding the comment and the
         coordinate and value metadata, because it writes the file header.
+
+        Data rows are buffered and written to disk according to a flush
+        policy. If not specified the defaults are taken from the config
+        options 'data_flush_rows', 'data_flush_interval' and
+        'data_flush_on_block'.
+            flush_rows (int): flush every flush_rows rows, default 1. This
+                is the safest setting if qtlab crashes, larger values
+                reduce the number of disk accesses.
+            flush_interval (float): flush if this many seconds passed since
+                the last flush, default None (disabled).
+            flush_on_block (bool): flush at every new_block(), default True.
+        The file is always flushed by close_file().
+
+        If async_write is True (default is config option 'data_async_write'
+        or False) rows are written to disk by a separate thread, so a slow
+        disk does not delay the measurement loop. The queue holds at most
+        'data_async_queue_size' (default 10000) items; if it is full
+        add_data_point() waits, or raises an error if 'data_async_policy'
+        is 'error' instead of 'block'. Errors in the writer thread are
+        raised by the next add_data_point(). close_file() waits until all
+        data is written.
+
+        If binary is True (default is config option 'data_binary' or
+        False, or True if filepath has extension .bin) the data is stored
+        as raw little endian doubles in a <name>.bin file instead of text.
+        The meta data (dimensions, comments and block sizes) is written to
+        <name>.json, which is updated at every flushed block and when the
+        file is closed. Binary files are much faster to write and can be
+        opened without parsing; use convert_to_binary() for existing .dat
+        files.
         '''
 
         if name is None and filepath is None:
@@ -791,17 +1174,32 @@ class Data(SharedGObject):
         if filepath is None:
             filepath = self._filename_generator.new_filename(self)
 
+        if binary is None:
+            binary = os.path.splitext(filepath)[1] == _BINARY_EXT or \
+                    config.get('data_binary', False)
+        if binary:
+            filepath = os.path.splitext(filepath)[0] + _BINARY_EXT
+        self._binary = binary
+
         self._dir, self._filename = os.path.split(filepath)
         if not os.path.isdir(self._dir):
             os.makedirs(self._dir)
 
         try:
-            self._file = open(self.get_filepath(), 'w+')
+            if binary:
+                self._file = open(self.get_filepath(), 'wb+')
+            else:
+                self._file = open(self.get_filepath(), 'w+')
         except:
             logging.error('Unable to open file')
             return False
 
-        self._write_header()
+        if binary:
+            self._write_binary_header()
+        else:
+            self._write_header()
+        self._open_writer(flush_rows, flush_interval, flush_on_block,
+                async_write)
 
         if settings_file and in_qtlab:
             self._write_settings_file()
@@ -828,13 +1226,42 @@ class Data(SharedGObject):
             self._log_file_handler.close()
             self._log_file_handler = None
 
-        if self._file is not None:
-            self._file.close()
-            self._file = None
-
-        if self._stop_req_hid is not None and in_qtlab:
-            qt.flow.disconnect(self._stop_req_hid)
-            self._stop_req_hid = None
+        try:
+            if self._writer is not None:
+                writer = self._writer
+                self._writer = None
+                writer.close()
+        finally:
+            if self._stop_req_hid is not None and in_qtlab:
+                qt.flow.disconnect(self._stop_req_hid)
+                self._stop_req_hid = None
+
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                if self._binary:
+                    self._write_binary_header()
+
+    def _open_writer(self, flush_rows=None, flush_interval=None,
+            flush_on_block=None, async_write=False):
+        if flush_rows is None:
+            flush_rows = config.get('data_flush_rows', 1)
+        if flush_interval is None:
+            flush_interval = config.get('data_flush_interval', None)
+        if flush_on_block is None:
+            flush_on_block = config.get('data_flush_on_block', True)
+        if async_write is None:
+            async_write = config.get('data_async_write', False)
+
+        self._flush_on_block = flush_on_block
+        if async_write:
+            self._writer = datawriter.ThreadedWriter(self._file,
+                    flush_rows=flush_rows, flush_interval=flush_interval,
+                    maxsize=config.get('data_async_queue_size', 10000),
+                    policy=config.get('data_async_policy', 'block'))
+        else:
+            self._writer = datawriter.BufferedWriter(self._file,
+                    flush_rows=flush_rows, flush_interval=flush_interval)
 
     def _open_log_file(self, log_level=logging.INFO):
         fn = self.get_log_filepath()
@@ -879,21 +1306,88 @@ class Data(SharedGObject):
 
         self._file.write('\n')
 
+    def _write_binary_header(self):
+        '''
+        Write the meta data of a binary data file to <name>.json.
+        '''
+
+        header = {
+            'format': _BINARY_FORMAT,
+            'version': _BINARY_VERSION,
+            'filename': self._filename,
+            'timestamp': self._timestamp,
+            'dtype': _BINARY_DTYPE,
+            'ncolumns': len(self._dimensions),
+            'dimensions': self._dimensions,
+            'comments': self._comment,
+            'block_sizes': self._block_sizes,
+        }
+
+        f = open(self.get_header_filepath(), 'w')
+        try:
+            json.dump(header, f, indent=1, sort_keys=True,
+                    default=_json_default)
+        finally:
+            f.close()
+
+    def _write_binary_rows(self, rows):
+        '''Write a 2d array of data points to a binary data file.'''
+
+        if self._file is None:
+            logging.info('File not opened yet, doing now')
+            self.create_file(binary=True)
+
+        rows = numpy.asarray(rows, dtype=_BINARY_DTYPE)
+        self._writer.write(rows.tostring(), len(rows))
+
+    def _get_column_format(self, colnum):
+        '''Return the format string for non-integer values in column colnum.'''
+
+        if self._column_formats is None:
+            precision = config.get('default_precision', 12)
+            formats = []
+            for opts in self._dimensions:
+                if 'format' in opts:
+                    formats.append(opts['format'])
+                elif 'precision' in opts:
+                    formats.append('%%.%de' % opts['precision'])
+                else:
+                    formats.append('%%.%de' % precision)
+            self._column_formats = formats
+
+        if colnum < len(self._column_formats):
+            return self._column_formats[colnum]
+
+        precision = config.get('default_precision', 12)
+        return '%%.%de' % precision
+
     def _format_data_value(self, val, colnum):
         if type(val) in self._INT_TYPES:
             return '%d' % val
 
-        if colnum < len(self._dimensions):
-            opts = self._dimensions[colnum]
-            if 'format' in opts:
-                return opts['format'] % val
-            elif 'precision' in opts:
-                format = '%%.%de' % opts['precision']
-                return format % val
+        return self._get_column_format(colnum) % val
 
-        precision = config.get('default_precision', 12)
-        format = '%%.%de' % precision
-        return format % val
+    def _format_data_block(self, columns):
+        '''
+        Format data points given as a list of 1d column arrays in a single
+        string formatting pass. Returns None if a column is not numeric.
+        '''
+
+        formats = []
+        values = []
+        for colnum, col in enumerate(columns):
+            col = numpy.asarray(col)
+            if col.dtype.kind in ('i', 'u'):
+                formats.append('%d')
+            elif col.dtype.kind == 'f':
+                formats.append(self._get_column_format(colnum))
+            else:
+                return None
+            values.append(col.tolist())
+
+        linefmt = '\t'.join(formats) + '\n'
+        flat = tuple(itertools.chain.from_iterable(itertools.izip(*values)))
+        return (linefmt * len(values[0])) % flat
 
     def _write_data_line(self, args):
         '''
@@ -902,13 +1396,8 @@ class Data(SharedGObject):
         '''
 
         if hasattr(args, '__len__'):
-            if len(args) > 0:
-                line = self._format_data_value(args[0], 0)
-                for colnum in range(1, len(args)):
-                    line += '\t%s' % \
-                            self._format_data_value(args[colnum], colnum)
-            else:
-                line = ''
+            line = '\t'.join([self._format_data_value(val, colnum) \
+                    for colnum, val in enumerate(args)])
         else:
             line = self._format_data_value(args, 0)
 
@@ -918,18 +1407,42 @@ class Data(SharedGObject):
             logging.info('File not opened yet, doing now')
             self.create_file()
 
-        self._file.write(line)
-        self._file.flush()
+        self._writer.write(line, 1)
 
-    def _get_block_columns(self):
-        blockcols = []
-        for i in range(self.get_ncoordinates()):
-            if len(self._data) > 1 and self._data[0][i] == self._data[1][i]:
-                blockcols.append(True)
+    _BLOCK_FORMAT_ROWS = 10000
+
+    def _write_data_block(self, columns, npoints):
+        '''
+        Write npoints lines of data, given as a list of column arrays.
+        '''
+
+        if self._file is None:
+            logging.info('File not opened yet, doing now')
+            self.create_file()
+
+        for start in xrange(0, npoints, self._BLOCK_FORMAT_ROWS):
+            end = min(start + self._BLOCK_FORMAT_ROWS, npoints)
+            chunk = [col[start:end] for col in columns]
+            text = self._format_data_block(chunk)
+            if text is not None:
+                self._writer.write(text, end - start)
             else:
-                blockcols.append(False)
-        for i in range(self.get_nvalues()):
-            blockcols.append(False)
+                for row in zip(*chunk):
+                    self._write_data_line(row)
+
+    def _get_block_columns(self):
+        '''
+        Return for each column whether it is a coordinate that is constant
+        within a block, i.e. a new block starts when its value changes.
+        '''
+
+        blockcols = [False] * (self.get_ncoordinates() + self.get_nvalues())
+        ncoords = self.get_ncoordinates()
+        if len(self._data) > 1 and len(numpy.shape(self._data)) == 2 \
+                and ncoords > 0:
+            same = numpy.asarray(self._data[0, :ncoords]) == \
+                    numpy.asarray(self._data[1, :ncoords])
+            blockcols[:ncoords] = same.tolist()
 
         return blockcols
 
@@ -938,25 +1451,40 @@ class Data(SharedGObject):
             logging.warning('Unable to _write_data() without having it in memory')
             return False
 
-        blockcols = self._get_block_columns()
-
-        non_header_comments = filter(lambda rowno,commentstr: rowno!=0, self._comments)
-        non_header_comments_rowno = np.array([rowno for rowno,commentstr in non_header_comments])
-        non_header_comments_commentstr = [commentstr for rowno,commentstr in non_header_comments]
-
-        lastvals = None
-        for rowno, vals in enumerate(self._data):
-            if type(vals) is numpy.ndarray and lastvals is not None:
-                for i in range(len(vals)):
-                    if blockcols[i] and vals[i] != lastvals[i]:
-                        self._file.write('\n')
+        data = numpy.asarray(self._data)
+        npoints = len(data)
+
+        # Rows at which a new block starts; like gnuplot expects, one empty
+        # line is written for every block column that changes.
+        newblock = {}
+        blockcols = numpy.flatnonzero(self._get_block_columns())
+        if npoints > 1 and len(blockcols) > 0:
+            cols = data[:, blockcols]
+            nchanged = numpy.sum(cols[1:] != cols[:-1], axis=1)
+            rows = numpy.flatnonzero(nchanged) + 1
+            newblock = dict(zip(rows.tolist(), nchanged[rows - 1].tolist()))
+
+        # Comments that were not written in the header
+        comments = {}
+        for rowno, commentstr in self._comment:
+            if rowno != 0:
+                comments.setdefault(rowno, []).append(commentstr)
+
+        start = 0
+        for end in sorted(set(newblock) | set(comments) | set([npoints])):
+            if end > start:
+                if len(data.shape) == 1:
+                    self._write_data_block([data[start:end]], end - start)
+                else:
+                    self._write_data_block(data[start:end].T, end - start)
+                start = end
 
-            # write comments preceding the data point, if any.
-            for commentind in np.where(non_header_comments_rowno == rowno):
-                self._file.write('# %s\n' % line)
+            if end in newblock:
+                self._writer.write('\n' * newblock[end])
+            for commentstr in comments.get(end, []):
+                self._writer.write('# %s\n' % commentstr)
 
-            self._write_data_line(vals)
-            lastvals = vals
+        return True
 
     def _write_binary(self):
         if not self._inmem:
@@ -982,7 +1510,10 @@ class Data(SharedGObject):
         if not self.create_file(name=name, filepath=filepath):
             return
 
-        self._write_data()
+        if self._binary:
+            self._write_binary_rows(self._data)
+        else:
+            self._write_data()
         self.close_file()
 
     def create_tempfile(self, path=None):
@@ -995,6 +1526,7 @@ class Data(SharedGObject):
         else:
             mode = 'w'
         self._file = temp.File(path, mode=mode, binary=self._temp_binary)
+        self._open_writer()
         try:
             if self._temp_binary:
                 ret = self._write_binary()
@@ -1002,6 +1534,7 @@ class Data(SharedGObject):
                 self._write_data()
 
             self._dir, self._filename = os.path.split(self._file.name)
+            self._writer.flush()
             self._file.close()
             self._tempfile = True
         except Exception, e:
@@ -1024,6 +1557,7 @@ class Data(SharedGObject):
             self._write_binary()
         else:
             self._write_data()
+        self._writer.flush()
         self._file.close()
 
     def copy_file(self, fn):
@@ -1070,6 +1604,9 @@ class Data(SharedGObject):
         shapes = [numpy.shape(i) for i in args]
         dims = numpy.array([len(i) for i in shapes])
 
+        # For >1 data points also keep the data per column, for writing
+        columns = None
+
         if len(args) == 0:
             logging.warning('add_data_point(): no data specified')
             return
@@ -1078,10 +1615,16 @@ class Data(SharedGObject):
                 ncols = shapes[0][1]
                 npoints = shapes[0][0]
                 args = args[0]
+                if isinstance(args, numpy.ndarray):
+                    columns = args.T
+                else:
+                    # Keep int columns of nested lists formatted as ints
+                    columns = [numpy.asarray(c) for c in zip(*args)]
             elif dims[0] == 1:
                 ncols = 1
                 npoints = shapes[0][0]
                 args = args[0]
+                columns = [args]
             elif dims[0] == 0:
                 ncols = 1
                 npoints = 1
@@ -1098,6 +1641,7 @@ class Data(SharedGObject):
             if sum(dims!=1) == 0:
                 ncols = len(args)
                 npoints = shapes[0][0]
+                columns = args
                 # Transpose args to a single 2-d list
                 args = zip(*args)
             elif sum(dims!=0) == 0:
@@ -1128,23 +1672,28 @@ class Data(SharedGObject):
         #   - a 1d tuple of numbers, for adding a single data point
         #   - a 2d tuple/list/array, for adding >1 data points
         if self._inmem:
-            if len(self._data) == 0:
-                self._data = numpy.atleast_2d(args)
-            else:
-                args_n_dims = len(numpy.array(args).shape)
-                if args_n_dims == 1:
-                  self._data = numpy.append(self._data, [args], axis=0)
-                elif args_n_dims == 2:
-                  self._data = numpy.append(self._data, args, axis=0)
-                else:
-                  assert False, 'args should not have more than 2 dimensions here...'
+            # self._data might have been replaced (set_data, loading a file),
+            # in that case start a new buffer from its contents.
+            if self._data_buffer is None or \
+                    not self._data_buffer.wraps(self._data):
+                self._data_buffer = _RowBuffer(self._data,
+                        shared=config.get('data_shared_memory', False))
+            rows = numpy.reshape(args, (npoints, ncols))
+            self._data = self._data_buffer.append(rows)
+            self._reshaped_data = None
 
         if self._infile:
-            if npoints == 1:
+            if self._file is None:
+                logging.info('File not opened yet, doing now')
+                self.create_file()
+
+            if self._binary:
+                self._write_binary_rows(numpy.reshape(args, (npoints, ncols)))
+            elif columns is not None:
+                if npoints > 0:
+                    self._write_data_block(columns, npoints)
+            else:
                 self._write_data_line(args)
-            elif npoints > 1:
-                for i in range(npoints):
-                    self._write_data_line(args[i])
 
         self._npoints += npoints
         self._npoints_last_block += npoints
@@ -1159,12 +1708,20 @@ class Data(SharedGObject):
     def new_block(self):
         '''Start a new data block.'''
 
-        if self._infile:
-            self._file.write('\n')
+        flush = False
+        if self._infile and self._writer is not None:
+            if not self._binary:
+                self._writer.write('\n')
+            if self._flush_on_block:
+                self._writer.flush()
+                flush = True
 
         self._block_sizes.append(self._npoints_last_block)
         self._npoints_last_block = 0
 
+        if flush and self._binary:
+            self._write_binary_header()
+
         self.emit('new-data-block')
 
     def _add_missing_dimensions(self, nfields):
@@ -1198,6 +1755,7 @@ class Data(SharedGObject):
         if not isinstance(data, numpy.ndarray):
             data = numpy.array(data)
         self._data = data
+        self._reshaped_data = None
         self._inmem = True
         self._infile = False
         self._npoints = len(self._data)
@@ -1244,6 +1802,7 @@ class Data(SharedGObject):
         If the data is associated with a temporary file, it will be updated.
         '''
         self._data = data
+        self._reshaped_data = None
         if self._tempfile:
             self.rewrite_tempfile()
 
@@ -1261,15 +1820,391 @@ class Data(SharedGObject):
             self._nvalues = 1
             self._ncoordinates -= 1
 
+    def _get_cache_filepath(self):
+        return os.path.join(self._cache_path, os.path.splitext(self._filename)[0]) + '_tmp.npz'
+
+    def _save_cache(self, cache_fname, blocksize):
+        try:
+            numpy.savez(cache_fname,
+                     data=self._data,
+                     blocksize=numpy.array([blocksize]),
+                     comment_pickled=numpy.array(pickle.dumps(self._comment)))
+        except Exception as e:
+            logging.warn('Failed to save cache file %s: %s' % (cache_fname,e))
+
     def _load_file(self):
         """
         Load data from file and store internally.
+
+        The file is parsed with _load_file_fast() if possible. Loading with
+        a row_mask, from an existing cache file or from files that
+        _load_file_fast() does not support is done line by line.
+        Binary files are opened with _load_binary_file().
+        """
+
+        if os.path.splitext(self._filename)[1] == _BINARY_EXT:
+            return self._load_binary_file()
+
+        self._follow_offset = None
+        use_fast = self._load_row_mask is None
+        if self._cache_path != None and not self._overwrite_cache and \
+                os.path.exists(self._get_cache_filepath()):
+            use_fast = False
+
+        if use_fast:
+            try:
+                ret = self._load_file_fast()
+            except MemoryError:
+                raise
+            except Exception, e:
+                logging.info('Fast loading of %s failed (%s)',
+                        self.get_filepath(), str(e))
+                ret = None
+
+            if ret is not None:
+                return ret
+            logging.info('Parsing %s line by line', self.get_filepath())
+
+        return self._load_file_lines()
+
+    def _load_file_fast(self):
+        """
+        Load data from file in two phases. First the file is split into
+        lines and the header, comments and block boundaries are located.
+        Then all numeric data is parsed with a single numpy call.
+
+        Returns True / False on success / failure to open the file, or None
+        if the file layout is not supported (e.g. comments after data on a
+        line, rows with different number of fields or non-numeric data).
+        """
+
+        try:
+            f = open(self.get_filepath(), 'rb')
+        except:
+            logging.warning('Unable to open file %s' % self.get_filepath())
+            return False
+        try:
+            buf = f.read()
+        finally:
+            f.close()
+
+        # The last line might not be complete if the file is being written
+        if self._follow:
+            buf = buf[:buf.rfind('\n') + 1]
+
+        starts, ends, ltypes = _scan_lines(buf)
+        if starts is None:
+            return None
+
+        isdata = (ltypes == _LINE_DATA)
+        ndata = numpy.count_nonzero(isdata)
+        if ndata > 0:
+            first = starts[isdata][0], ends[isdata][0]
+            nfields = len(buf[first[0]:first[1]].split())
+        else:
+            nfields = 0
+
+        # Number of data rows up to and including each line
+        rows_before = numpy.cumsum(isdata)
+
+        # Phase 1: meta data and comments
+        self._dimensions = []
+        self._values = []
+        self._comment = []
+
+        comment_lines = numpy.flatnonzero(ltypes == _LINE_COMMENT)
+        for i in comment_lines:
+            line = buf[starts[i]:ends[i]].rstrip(' \t')
+            self._parse_meta_data(line, line_number=int(rows_before[i]))
+
+        # Block sizes from the empty lines after the first data row
+        empty_lines = numpy.flatnonzero((ltypes == _LINE_EMPTY) & (rows_before > 0))
+        block_ends = rows_before[empty_lines]
+        self._block_sizes = numpy.diff(numpy.concatenate(([0], block_ends))).tolist()
+        if len(block_ends) > 0:
+            blocksize = ndata - int(block_ends[-1])
+        else:
+            blocksize = ndata
+        if len(self._block_sizes) > 0:
+            self._npoints_max_block = max(self._block_sizes)
+        else:
+            self._npoints_max_block = 0
+
+        # Phase 2: numeric data. Empty lines are just white space for the
+        # parser, so only comment lines after the first data row need to be
+        # cut out.
+        if ndata > 0:
+            body_start = starts[isdata][0]
+            cuts = [i for i in comment_lines if starts[i] > body_start]
+            pieces = []
+            pos = body_start
+            for i in cuts:
+                pieces.append(buf[pos:starts[i]])
+                pos = ends[i]
+            pieces.append(buf[pos:])
+            values = numpy.fromstring(''.join(pieces), dtype=numpy.float64, sep=' ')
+            if values.size != ndata * nfields:
+                return None
+            data = values.reshape((ndata, nfields))
+        else:
+            data = numpy.zeros((0, nfields))
+
+        logging.info('Finished reading %d data points.' % ndata)
+        self._data = data
+        self._finish_load(nfields, blocksize)
+
+        if self._follow:
+            # Dimension size detection guesses block sizes, keep the actual
+            # blocks to continue from.
+            self._block_sizes = numpy.diff(numpy.concatenate(([0], block_ends))).astype(int).tolist()
+            self._follow_offset = len(buf)
+
+        if self._cache_path != None:
+            self._save_cache(self._get_cache_filepath(), blocksize)
+
+        return True
+
+    def _load_binary_file(self):
+        """
+        Open a binary data file. The data is memory mapped read-only, so
+        nothing is read from disk until it is used.
+
+        A partially written last row, or block sizes that refer to rows not
+        yet on disk, are ignored; this happens when opening a file that is
+        still being written.
+        """
+
+        hdrpath = self.get_header_filepath()
+        try:
+            f = open(hdrpath, 'r')
+            try:
+                header = json.load(f)
+            finally:
+                f.close()
+        except Exception, e:
+            logging.warning('Unable to read header %s: %s', hdrpath, str(e))
+            return False
+
+        if header.get('format') != _BINARY_FORMAT or \
+                header.get('version', 0) > _BINARY_VERSION:
+            logging.warning('Unsupported binary data header %s', hdrpath)
+            return False
+
+        nfields = int(header['ncolumns'])
+        dtype = numpy.dtype(str(header.get('dtype', _BINARY_DTYPE)))
+        try:
+            size = os.path.getsize(self.get_filepath())
+        except OSError:
+            logging.warning('Unable to open file %s' % self.get_filepath())
+            return False
+
+        rowsize = nfields * dtype.itemsize
+        if rowsize > 0:
+            npoints = size // rowsize
+        else:
+            npoints = 0
+
+        # numpy can not memory map an empty file
+        if npoints > 0:
+            self._data = numpy.memmap(self.get_filepath(), dtype=dtype,
+                    mode='r', shape=(npoints, nfields))
+        else:
+            self._data = numpy.zeros((0, nfields), dtype=dtype)
+
+        self._dimensions = [dict((str(k), v) for k, v in dim.iteritems()) \
+                for dim in header.get('dimensions', [])]
+        self._comment = [[int(rowno), comment] \
+                for rowno, comment in header.get('comments', [])]
+
+        self._block_sizes = []
+        total = 0
+        for size in header.get('block_sizes', []):
+            if total + size > npoints:
+                break
+            self._block_sizes.append(int(size))
+            total += size
+        if len(self._block_sizes) > 0:
+            self._npoints_max_block = max(self._block_sizes)
+        else:
+            self._npoints_max_block = 0
+
+        self._binary = True
+        logging.info('Opened %d data points.' % npoints)
+        self._finish_load(nfields, npoints - total)
+        return True
+
+    def _finish_load(self, nfields, blocksize, detect_size=True):
+        self._add_missing_dimensions(nfields)
+        self._count_coord_val_dims()
+
+        self._npoints = len(self._data)
+        self._inmem = True
+        self._reshaped_data = None
+
+        logging.debug('Read %u data points.' % (len(self._data)))
+
+        self._npoints_last_block = blocksize
+
+        if not detect_size:
+            return
+
+        try:
+            self._detect_dimensions_size()
+        except Exception, e:
+            logging.warning('Error while detecting dimension size')
+
+    _LAZY_INDEX_STEP = 1024
+
+    def _get_index_filepath(self):
+        if self._cache_path is not None:
+            dirname = self._cache_path
+        else:
+            dirname = self._dir
+        return os.path.join(dirname, os.path.splitext(self._filename)[0]) + '_idx.npz'
+
+    def _build_lazy_index(self):
+        """
+        Scan the data file in chunks and parse the meta data, comments and
+        block sizes. Returns (offsets, nfields, blocksize), where offsets
+        contains the file offset of every _LAZY_INDEX_STEP'th data row, or
+        None if the file layout is not supported.
+        """
+
+        step = self._LAZY_INDEX_STEP
+        self._dimensions = []
+        self._values = []
+        self._comment = []
+
+        offsets = []
+        block_ends = []
+        nrows = 0
+        nfields = 0
+        pos = 0
+        rest = ''
+        f = open(self.get_filepath(), 'rb')
+        try:
+            while True:
+                chunk = f.read(_LazyTextArray.READ_SIZE)
+                final = len(chunk) == 0
+                buf = rest + chunk
+                if not final:
+                    nl = buf.rfind('\n')
+                    if nl < 0:
+                        rest = buf
+                        continue
+                    buf, rest = buf[:nl + 1], buf[nl + 1:]
+
+                starts, ends, ltypes = _scan_lines(buf)
+                if starts is None:
+                    return None
+
+                isdata = (ltypes == _LINE_DATA)
+                rows_before = nrows + numpy.cumsum(isdata)
+
+                for i in numpy.flatnonzero(ltypes == _LINE_COMMENT):
+                    line = buf[starts[i]:ends[i]].rstrip(' \t')
+                    self._parse_meta_data(line, line_number=int(rows_before[i]))
+
+                empty_lines = numpy.flatnonzero((ltypes == _LINE_EMPTY) & (rows_before > 0))
+                block_ends.extend(rows_before[empty_lines].tolist())
+
+                dstarts = starts[isdata]
+                if nrows == 0 and len(dstarts) > 0:
+                    nfields = len(buf[dstarts[0]:ends[isdata][0]].split())
+                # Rows are not parsed here, but should all be complete
+                if numpy.any(_count_fields(buf, starts)[isdata] != nfields):
+                    return None
+                rownums = nrows + numpy.arange(len(dstarts))
+                offsets.append(dstarts[rownums % step == 0] + pos)
+                nrows += len(dstarts)
+
+                if final:
+                    break
+                pos += len(buf)
+        finally:
+            f.close()
+
+        self._block_sizes = numpy.diff(numpy.concatenate(([0], block_ends))).astype(int).tolist()
+        if len(block_ends) > 0:
+            blocksize = nrows - int(block_ends[-1])
+        else:
+            blocksize = nrows
+
+        offsets = numpy.concatenate(offsets + [numpy.zeros(0, dtype=numpy.int64)])
+        return offsets.astype(numpy.int64), nrows, nfields, blocksize
+
+    def _load_lazy(self):
+        """
+        Open the data file without loading the data. The row index is
+        stored in a <name>_idx.npz file (in cache_path if specified) and
+        reused as long as the data file does not change.
+
+        Returns True / False on success / failure to open the file, or None
+        if the file layout is not supported.
+        """
+
+        try:
+            st = os.stat(self.get_filepath())
+        except OSError:
+            logging.warning('Unable to open file %s' % self.get_filepath())
+            return False
+        stat = numpy.array([st.st_size, st.st_mtime])
+
+        idx_fname = self._get_index_filepath()
+        index = None
+        if os.path.exists(idx_fname):
+            try:
+                f = numpy.load(idx_fname)
+                try:
+                    if numpy.array_equal(f['stat'], stat):
+                        index = (f['offsets'], f['info'],
+                                pickle.loads(f['meta_pickled']))
+                finally:
+                    f.close()
+            except Exception, e:
+                logging.info('Failed to load index file %s: %s' % (idx_fname, e))
+
+        if index is not None:
+            offsets, info, meta = index
+            step, nrows, nfields, blocksize = [int(i) for i in info]
+            self._dimensions, self._comment, self._block_sizes = meta
+            logging.info('Loaded index from %s.' % idx_fname)
+        else:
+            ret = self._build_lazy_index()
+            if ret is None:
+                return None
+            offsets, nrows, nfields, blocksize = ret
+            step = self._LAZY_INDEX_STEP
+            meta = (self._dimensions, self._comment, self._block_sizes)
+            try:
+                numpy.savez(idx_fname,
+                        offsets=offsets,
+                        info=numpy.array([step, nrows, nfields, blocksize]),
+                        stat=stat,
+                        meta_pickled=numpy.array(pickle.dumps(meta)))
+            except Exception, e:
+                logging.info('Failed to save index file %s: %s' % (idx_fname, e))
+
+        if len(self._block_sizes) > 0:
+            self._npoints_max_block = max(self._block_sizes)
+        else:
+            self._npoints_max_block = 0
+
+        self._data = _LazyTextArray(self.get_filepath(), offsets, step,
+                nrows, nfields)
+        self._finish_load(nfields, blocksize, detect_size=False)
+        self._inmem = 'lazy'
+        return True
+
+    def _load_file_lines(self):
+        """
+        Load data from file line by line and store internally.
         """
 
         cache = None
 
         if self._cache_path != None:
-            cache_fname = os.path.join(self._cache_path, os.path.splitext(self._filename)[0]) + '_tmp.npz'
+            cache_fname = self._get_cache_filepath()
             if not self._overwrite_cache:
                 try:
                     cache = numpy.load(cache_fname)
@@ -1361,33 +2296,14 @@ class Data(SharedGObject):
                 data[row_no,:] = numpy.array(fields)
                 blocksize += 1
 
-        self._add_missing_dimensions(nfields)
-        self._count_coord_val_dims()
-
         if cache == None:
           logging.info('Finished reading %d data points. Data buffer size was %d points.' % (row_no, len(data)))
           self._data = data[:1+row_no,:]
 
-        self._npoints = len(self._data)
-        self._inmem = True
-
-        logging.debug('Read %u data points.' % (len(self._data)))
-
-        self._npoints_last_block = blocksize
-
-        try:
-            self._detect_dimensions_size()
-        except Exception, e:
-            logging.warning('Error while detecting dimension size')
+        self._finish_load(nfields, blocksize)
 
         if cache == None and self._cache_path != None:
-            try:
-                numpy.savez(cache_fname,
-                         data=self._data,
-                         blocksize=numpy.array([blocksize]),
-                         comment_pickled=numpy.array(pickle.dumps(self._comment)))
-            except Exception as e:
-                logging.warn('Failed to save cache file %s: %s' % (cache_fname,e))
+            self._save_cache(cache_fname, blocksize)
 
         return True
 
@@ -1444,11 +2360,22 @@ class Data(SharedGObject):
         '''
         Return a reshaped version of the data. This is not guaranteed to be
         a view to the same data object.
+
+        The result is cached until the data changes. Blocks of a serpentine
+        sweep are reversed, so that all blocks run in the same direction.
         '''
 
         if self._reshaped_data is not None:
             return self._reshaped_data
 
+        # Data added since the last detection, e.g. with add_data_point()
+        if self._detected_npoints != len(self._data):
+            try:
+                self._detect_dimensions_size(set_blocks=False)
+            except Exception, e:
+                logging.warning('Error while detecting dimension size')
+                return None
+
         loopdims = copy.copy(self._loopdims)
         newshape = copy.copy(self._loopshape)
         if not self._complete or None in (loopdims, newshape):
@@ -1470,6 +2397,21 @@ class Data(SharedGObject):
             newshape.append(-1)
             data = data.reshape(newshape)
 
+            # Loop i is along axis nloops - 1 - i; for serpentine sweeps
+            # reverse it in every other step of the next loop.
+            nloops = len(loopdims)
+            for i, sweep in enumerate(self._loopsweeps):
+                axis = nloops - 1 - i
+                if sweep != 'serpentine' or axis == 0:
+                    continue
+                if data.base is not None:
+                    data = data.copy()
+                odd = [types.SliceType(None)] * data.ndim
+                odd[axis - 1] = types.SliceType(1, None, 2)
+                rev = [types.SliceType(None)] * data.ndim
+                rev[axis] = types.SliceType(None, None, -1)
+                data[tuple(odd)] = data[tuple(odd)][tuple(rev)]
+
             # Swap axes if necessary
             if fshape_ok:
                 for i in range(self.get_ncoordinates() - 1):
@@ -1478,94 +2420,297 @@ class Data(SharedGObject):
         self._reshaped_data = data
         return self._reshaped_data
 
-    def _detect_dimensions_size(self):
+    # Number of recurrences of the start value tried as loop period
+    _MAX_PERIOD_CANDIDATES = 4
+
+    def _detect_loop_size(self, col, outer):
+        '''
+        Return (size, sweep) for a loop of coordinate column col, sampled
+        once per iteration of the faster loops. outer contains the columns
+        that may belong to slower loops, sampled the same way.
+
+        sweep is None for a normal sweep, 'hysteretic' for a sweep that goes
+        back and forth within one loop, or 'serpentine' for a sweep that
+        reverses direction every loop.
+        '''
+
+        n = len(col)
+
+        # A sweep that reverses direction repeats its turning point
+        same = numpy.flatnonzero(col[1:] == col[:-1])
+        if len(same) > 0:
+            half = int(same[0]) + 1
+            m = min(half, n - half)
+            period = 2 * half
+            if numpy.array_equal(col[half:half + m], col[half - 1::-1][:m]) and \
+                    (n <= period or numpy.array_equal(col[:n - period], col[period:])):
+                if outer.shape[1] > 0 and numpy.any(outer[half] != outer[0]):
+                    return half, 'serpentine'
+                return min(period, n), 'hysteretic'
+
+        cands = numpy.flatnonzero(col[1:] == col[0])[:self._MAX_PERIOD_CANDIDATES] + 1
+        for p in cands:
+            if numpy.array_equal(col[:n - p], col[p:]):
+                return int(p), None
+
+        return n, None
+
+    def _detect_dimensions_size(self, set_blocks=True):
+        '''
+        Detect which coordinate columns are swept in which order and the
+        number of points in each sweep. If set_blocks is True and no block
+        sizes are known, they are set from the first loop size.
+        '''
+
         data = self._data
         ncoords = self.get_ncoordinates()
+        self._detected_npoints = len(data)
+        self._reshaped_data = None
         if len(data) < 2:
             for colnum in range(ncoords):
                 self._dimensions[colnum]['size'] = len(data)
             return
 
         loopdims = []
+        loopsweeps = []
         newshape = []
         mulsize = 1
-        firstloopdim = None
         for iter in range(ncoords):
+            if mulsize >= len(data):
+                break
+
             loopdim = None
             for colnum in range(ncoords):
-                if mulsize >= len(data):
-                    continue
-
-                if data[0, colnum] != data[mulsize, colnum]:
+                if colnum not in loopdims and \
+                        data[0, colnum] != data[mulsize, colnum]:
                     loopdim = colnum
-                    loopdims.append(loopdim)
-                    loopstart = data[0, loopdim]
                     break
 
             if loopdim is None:
                 break
 
-            if firstloopdim is None:
-                firstloopdim = loopdim
-
-            i = 1
-            while i * mulsize < len(data):
-                if data[i * mulsize, loopdim] == loopstart:
-                    break
-                i += 1
+            loopdims.append(loopdim)
+            others = [colnum for colnum in range(ncoords) \
+                    if colnum not in loopdims]
+            sampled = data[::mulsize]
+            size, sweep = self._detect_loop_size(sampled[:, loopdim],
+                    sampled[:, others])
+            loopsweeps.append(sweep)
 
             opt = self._dimensions[loopdim]
-            opt['start'] = loopstart
-            opt['size'] = i
-            opt['end'] = data[mulsize * (i - 1), loopdim]
-            newshape.append(i)
+            opt['start'] = sampled[0, loopdim]
+            opt['size'] = size
+            if sweep == 'hysteretic':
+                opt['end'] = sampled[size / 2 - 1, loopdim]
+            else:
+                opt['end'] = sampled[size - 1, loopdim]
+            newshape.append(size)
 
-            mulsize *= i
+            mulsize *= size
 
         complete = len(self._data) == mulsize
         self._loopdims = loopdims
+        self._loopsweeps = loopsweeps
         self._loopshape = newshape
         self._complete = complete
 
         # Determine number of blocks
-        bs = self._dimensions[firstloopdim]['size']
-        if bs > 0:
-            if len(data) % bs == 0:
+        if set_blocks and len(loopdims) > 0 and len(self._block_sizes) == 0:
+            bs = self._dimensions[loopdims[0]]['size']
+            if bs > 0:
                 self._block_sizes = [bs] * (len(data) / bs)
-            else:
-                self._block_sizes = [bs] * (int(len(data) / bs) + 1)
+                if len(data) % bs != 0:
+                    self._block_sizes.append(bs)
 
         return complete
 
     def set_filepath(self, fp, inmem=True):
         '''
         Set the filepath associated with the data.
-        If inmem is True it will be loaded directly.
-        If fp is a directory, a file with extension .dat will be searched for.
+        If inmem is True it will be loaded directly. If inmem is 'lazy' only
+        an index of the rows is built (or loaded from the index file); data
+        is read from the file when get_data() or the Data object is indexed.
+        In this mode dimension sizes are not detected and the data can not
+        be reshaped.
+        If fp is a directory, a file with extension .dat (or .bin for binary
+        data) will be searched for.
         '''
 
         if os.path.isdir(fp):
             files = os.listdir(fp)
             foundfile = None
             for fn in files:
-                if os.path.splitext(fn)[1] == '.dat':
+                if os.path.splitext(fn)[1] in ('.dat', _BINARY_EXT):
                     if foundfile is not None:
-                        raise ValueError('Multiple .dat files in directory, Unable to decide which one to load')
+                        raise ValueError('Multiple data files in directory, Unable to decide which one to load')
                     foundfile = fn
             if foundfile is None:
-                raise ValueError('No .dat file found in directory')
+                raise ValueError('No .dat or .bin file found in directory')
 
             self._dir, self._filename = fp, foundfile
 
         else:
             self._dir, self._filename = os.path.split(fp)
 
+        self._binary = os.path.splitext(self._filename)[1] == _BINARY_EXT
+
+        if inmem == 'lazy' and not self._binary:
+            try:
+                ret = self._load_lazy()
+            except MemoryError:
+                raise
+            except Exception, e:
+                logging.warning('Unable to open %s lazily: %s',
+                        self.get_filepath(), str(e))
+                ret = None
+            if ret is not None:
+                if not ret:
+                    self._inmem = False
+                return
+            logging.info('Loading %s into memory', self.get_filepath())
+
         if inmem:
             if self._load_file():
                 self._inmem = True
             else:
                 self._inmem = False
 
+    def refresh(self):
+        '''
+        Read data that was added to the file by another process.
+
+        In follow mode (see Data()) only the part of the file after the
+        previously read data is parsed. The new points are added and the
+        'new-data-point' and 'new-data-block' signals are emitted, so plots
+        of the data are updated. Other files are reloaded completely, and
+        follow mode is enabled for next refreshes if possible.
+
+        Output:
+            The number of new data points.
+        '''
+
+        self._follow = True
+        npoints = self._npoints
+        nblocks = len(self._block_sizes)
+
+        if self._follow_offset is not None:
+            ret = self._read_appended()
+            if ret is not None:
+                return ret
+
+        if self._inmem == 'lazy':
+            self._load_lazy()
+        else:
+            self._load_file()
+        self._reshaped_data = None
+
+        if self._npoints != npoints or len(self._block_sizes) != nblocks:
+            if self._npoints > npoints:
+                self.emit('new-data-point')
+            for i in range(nblocks, len(self._block_sizes)):
+                self.emit('new-data-block')
+        return max(self._npoints - npoints, 0)
+
+    def _read_appended(self):
+        '''
+        Parse data appended to the file since self._follow_offset.
+        Returns the number of new points, or None if the file has to be
+        reloaded.
+        '''
+
+        fp = self.get_filepath()
+        try:
+            size = os.path.getsize(fp)
+        except OSError:
+            logging.warning('Unable to open file %s' % fp)
+            return 0
+
+        if size < self._follow_offset:
+            logging.info('File %s was truncated, reloading', fp)
+            return None
+        if size == self._follow_offset:
+            return 0
+
+        f = open(fp, 'rb')
+        try:
+            f.seek(self._follow_offset)
+            buf = f.read(size - self._follow_offset)
+        finally:
+            f.close()
+
+        buf = buf[:buf.rfind('\n') + 1]
+        if len(buf) == 0:
+            return 0
+
+        starts, ends, ltypes = _scan_lines(buf)
+        if starts is None:
+            return None
+
+        isdata = (ltypes == _LINE_DATA)
+        ndata = numpy.count_nonzero(isdata)
+        if self._npoints > 0:
+            nfields = self._data.shape[1]
+        elif ndata > 0:
+            first = starts[isdata][0], ends[isdata][0]
+            nfields = len(buf[first[0]:first[1]].split())
+
+        # Total number of data rows up to and including each line
+        rows_before = self._npoints + numpy.cumsum(isdata)
+
+        comment_lines = numpy.flatnonzero(ltypes == _LINE_COMMENT)
+        if ndata > 0:
+            body_start = starts[isdata][0]
+            pieces = []
+            pos = body_start
+            for i in comment_lines:
+                if starts[i] > body_start:
+                    pieces.append(buf[pos:starts[i]])
+                    pos = ends[i]
+            pieces.append(buf[pos:])
+            values = numpy.fromstring(''.join(pieces), dtype=numpy.float64, sep=' ')
+            if values.size != ndata * nfields:
+                return None
+            rows = values.reshape((ndata, nfields))
+
+        for i in comment_lines:
+            line = buf[starts[i]:ends[i]].rstrip(' \t')
+            self._parse_meta_data(line, line_number=int(rows_before[i]))
+
+        if ndata > 0:
+            if self._npoints == 0:
+                self._add_missing_dimensions(nfields)
+                self._count_coord_val_dims()
+            if self._data_buffer is None or \
+                    not self._data_buffer.wraps(self._data):
+                self._data_buffer = _RowBuffer(self._data,
+                        shared=config.get('data_shared_memory', False))
+            self._data = self._data_buffer.append(rows)
+            self._reshaped_data = None
+        elif len(comment_lines) > 0 and self._npoints == 0:
+            self._count_coord_val_dims()
+
+        self._follow_offset += len(buf)
+
+        # Update block info and emit signals in the order of the file
+        empty_lines = numpy.flatnonzero((ltypes == _LINE_EMPTY) & (rows_before > 0))
+        block_ends = rows_before[empty_lines].tolist()
+        start = self._npoints
+        for i, end in enumerate(block_ends + [start + ndata]):
+            n = end - self._npoints
+            if n > 0:
+                self._npoints += n
+                self._npoints_last_block += n
+                if self._npoints_last_block > self._npoints_max_block:
+                    self._npoints_max_block = self._npoints_last_block
+                self.emit('new-data-point')
+
+            if i < len(block_ends):
+                self._block_sizes.append(self._npoints_last_block)
+                self._npoints_last_block = 0
+                self.emit('new-data-block')
+
+        return self._npoints - start
+
 ### Misc
 
     def _stop_request_cb(self, sender):
@@ -1584,3 +2729,29 @@ def slice(data, coords, vals):
     """
     Return new data object with a slice of the given data set
     """
+
+def convert_to_binary(filepath, binpath=None):
+    '''
+    Convert a .dat file to the binary format (see Data.create_file()).
+
+    Input:
+        filepath (string): .dat file to convert
+        binpath (string): file to create, default is filepath with
+            extension .bin. The meta data is stored next to it with
+            extension .json.
+
+    Output:
+        The path of the binary file, or None if it could not be created.
+    '''
+
+    if binpath is None:
+        binpath = os.path.splitext(filepath)[0] + _BINARY_EXT
+
+    d = Data(filepath)
+    if not d.create_file(filepath=binpath, binary=True,
+            settings_file=False, log_file=False):
+        return None
+    d._write_binary_rows(d.get_data())
+    d.close_file()
+
+    return d.get_filepath()
@@ -23,7 +23,8 @@ import math
 import inspect
 from gettext import gettext as _L
 from lib import calltimer
-from lib.network.object_sharer import SharedGObject, cache_result
+from lib.network.object_sharer import SharedGObject, cache_result, \
+        cache_result_until
 
 import numpy as np
 import logging
@@ -43,6 +44,10 @@ class Instrument(SharedGObject):
     Implement an instrument:
     In __init__ call self.add_variable(<name>, <option dict>)
     Implement _do_get_<variable> and _do_set_<variable> functions
+
+    Optionally implement do_get_many(names) and do_set_many(values) to
+    get or set several parameters in one instrument transaction, see
+    _get_many() and _set_many().
     """
 
     __gsignals__ = {
@@ -103,6 +108,9 @@ class Instrument(SharedGObject):
 
         self._parameters = {}
         self._parameter_groups = {}
+        # Compiled get / set functions per parameter, see _compile_parameter
+        self._getters = {}
+        self._setters = {}
         self._functions = {}
         self._added_methods = []
         self._probe_ids = []
@@ -110,6 +118,9 @@ class Instrument(SharedGObject):
         self._default_read_var = None
         self._default_write_var = None
 
+        # (sets, gets, npoints) of an armed buffered sweep
+        self._buffered = None
+
         self._lock_class = kwargs.get('lockclass', name)
         if self._lock_class in Instrument._lock_classes:
             self._access_lock = Instrument._lock_classes[self._lock_class]
@@ -131,6 +142,18 @@ class Instrument(SharedGObject):
 
         return self._name
 
+    @cache_result
+    def get_lock_class(self):
+        '''
+        Returns the lock class of the instrument. Instruments in the same
+        lock class (e.g. sharing a bus) are never accessed at the same time.
+
+        Input: None
+        Output: lock class (string)
+        '''
+
+        return self._lock_class
+
     def get_type(self):
         """Return type of instrument as a string."""
         modname = str(self.__module__)
@@ -260,6 +283,8 @@ class Instrument(SharedGObject):
                 cache_time: the time during which get_<parameter> will perform
                     a SOFTGET, i.e. returns the value last passed to
                     set_<parameter>. Set to zero to disable.
+                buffered: FLAG_SET and / or FLAG_GET if the parameter can
+                    be swept / read in a buffered sweep, see arm_buffered().
 
         Output: None
         '''
@@ -411,6 +436,8 @@ class Instrument(SharedGObject):
             else:
                 self._parameter_groups[g].append(name)
 
+        self._compile_parameter(name)
+
         self.emit('parameter-added', name)
 
     def _remove_parameters(self):
@@ -424,6 +451,8 @@ class Instrument(SharedGObject):
                 if hasattr(self, fname):
                     delattr(self, fname)
         self._parameters = {}
+        self._getters = {}
+        self._setters = {}
 
     def remove_parameter(self, name):
         if name not in self._parameters:
@@ -434,6 +463,8 @@ class Instrument(SharedGObject):
                 delattr(self, func)
 
         del self._parameters[name]
+        del self._getters[name]
+        del self._setters[name]
         self.emit('parameter-removed', name)
 
     def has_parameter(self, name):
@@ -454,6 +485,8 @@ class Instrument(SharedGObject):
         else:
             return None
 
+    @cache_result_until('parameter-added', 'parameter-removed',
+            'parameter-changed', 'changed', 'reload')
     def get_shared_parameter_options(self, name):
         '''
         Return list of options for paramter.
@@ -474,7 +507,9 @@ class Instrument(SharedGObject):
 
     def set_parameter_options(self, name, **kwargs):
         '''
-        Change parameter options.
+        Change parameter options. Options should only be changed with
+        this function, so that the parameter get / set functions are
+        updated.
 
         Input:  name of parameter (string)
         Ouput:  None
@@ -485,6 +520,7 @@ class Instrument(SharedGObject):
 
         for key, val in kwargs.iteritems():
             self._parameters[name][key] = val
+        self._compile_parameter(name)
 
         self.emit('parameter-changed', name)
 
@@ -557,6 +593,7 @@ class Instrument(SharedGObject):
         '''
         self.set_parameter_options(name, maxstep=stepsize, stepdelay=stepdelay)
 
+    @cache_result_until('parameter-added', 'parameter-removed', 'reload')
     def get_parameter_names(self):
         '''
         Returns a list of parameter names.
@@ -575,6 +612,8 @@ class Instrument(SharedGObject):
         '''
         return self._parameters
 
+    @cache_result_until('parameter-added', 'parameter-removed',
+            'parameter-changed', 'changed', 'reload')
     def get_shared_parameters(self):
         '''
         Return the parameter dictionary, with non-shareable items stripped.
@@ -588,6 +627,7 @@ class Instrument(SharedGObject):
             params[key] = self.get_shared_parameter_options(key)
         return params
 
+    @cache_result_until('parameter-added', 'parameter-removed', 'reload')
     def get_parameter_groups(self):
         '''
         Return a dictionary with parameter group name -> group members.
@@ -689,58 +729,142 @@ class Instrument(SharedGObject):
         '''
 
         try:
-            p = self._parameters[name]
-        except:
+            getter = self._getters[name]
+        except KeyError:
             logging.warn('Could not retrieve options for parameter %s' % name)
             return None
 
-        if 'channel' in p and 'channel' not in kwargs:
-            kwargs['channel'] = p['channel']
+        return getter(query, kwargs)
 
-        current_time = time.time()
+    # Functions to cast values returned by drivers, per parameter type
+    _GET_CAST_MAP = {
+            types.IntType: int,
+            types.FloatType: float,
+            types.BooleanType: bool,
+            np.ndarray: np.array,
+    }
+
+    def _compile_parameter(self, name):
+        '''
+        Create the get and set functions for parameter 'name'. Everything
+        that depends only on the parameter options, such as the flags, the
+        type conversion, bounds and channel, is looked up once here instead
+        of at every get / set. This is done by add_parameter and again by
+        set_parameter_options.
+        '''
+
+        p = self._parameters[name]
+        self._getters[name] = self._compile_getter(name, p)
+        self._setters[name] = self._compile_setter(name, p)
+
+    def _compile_getter(self, name, p):
         flags = p['flags']
-        if not query or flags & 8 or (current_time - p['last_physical_access_time']) < p['cache_time']: #self.FLAG_SOFTGET:
-            if 'value' in p:
-                if p['type'] == np.ndarray:
-                    return np.array(p['value'])
+        softget = bool(flags & Instrument.FLAG_SOFTGET)
+        canget = bool(flags & Instrument.FLAG_GET)
+        cache_time = p['cache_time']
+        ptype = p.get('type', types.NoneType)
+        is_array = (ptype == np.ndarray)
+        cast = self._GET_CAST_MAP.get(ptype, None)
+        func = p.get('get_func', None)
+        channel = p.get('channel', None)
+        has_channel = 'channel' in p
+        gettime = time.time
+
+        def needs_query(current_time):
+            return canget and not softget and \
+                (current_time - p['last_physical_access_time']) >= cache_time
+
+        def store(value, current_time):
+            if cast is not None and value is not None:
+                try:
+                    value = cast(value)
+                except:
+                    logging.warning('Unable to cast value "%s" to %s', value, ptype)
+
+            p['value'] = value
+            p['last_physical_access_time'] = current_time
+            return value
+
+        def getter(query, kwargs):
+            current_time = gettime()
+            if not query or softget or \
+                    (current_time - p['last_physical_access_time']) < cache_time:
+                if 'value' in p:
+                    if is_array:
+                        return np.array(p['value'])
+                    else:
+                        return p['value']
                 else:
-                    return p['value']
-            else:
-#                logging.debug('Trying to access cached value, but none available')
+                    return None
+
+            # Check this here; getting of cached values should work
+            if not canget:
+                logging.warn('Instrument does not support getting of %s' % name)
                 return None
 
-        # Check this here; getting of cached values should work
-        if not flags & 1: #Instrument.FLAG_GET:
-            logging.warn('Instrument does not support getting of %s' % name)
-            return None
+            if has_channel and 'channel' not in kwargs:
+                kwargs['channel'] = channel
 
-        if 'base_name' in p:
-            base_name = p['base_name']
-        else:
-            base_name = name
+            # Same as store(), but inline since this is the common path
+            value = func(**kwargs)
+            if cast is not None and value is not None:
+                try:
+                    value = cast(value)
+                except:
+                    logging.warning('Unable to cast value "%s" to %s', value, ptype)
 
-        func = p['get_func']
-        value = func(**kwargs)
-        if 'type' in p and value is not None:
-            try:
-                if p['type'] == types.IntType:
-                    value = int(value)
-                elif p['type'] == types.FloatType:
-                    value = float(value)
-                elif p['type'] == types.StringType:
-                    pass
-                elif p['type'] == types.BooleanType:
-                    value = bool(value)
-                elif p['type'] == types.NoneType:
-                    pass
-                elif p['type'] == np.ndarray:
-                    value = np.array(value)
-            except:
-                logging.warning('Unable to cast value "%s" to %s', value, p['type'])
+            p['value'] = value
+            p['last_physical_access_time'] = current_time
+            return value
 
-        p['value'] = value
-        p['last_physical_access_time'] = current_time
-        return value
+        # Used by _get_many
+        getter.needs_query = needs_query
+        getter.store = store
+        return getter
+
+    def _get_many(self, names, query, kwargs):
+        '''
+        Get several parameter values.
+
+        If the driver implements do_get_many(names), all parameters that
+        have to be read from the instrument are passed to it at once, so
+        that it can read them in a single transaction. It should return a
+        dictionary of name -> value; parameters that are missing from it
+        are read one by one as usual.
+
+        Input:
+            names (list of strings): parameter names
+            query (bool): whether to query the instrument
+            kwargs (dict): extra options passed to the get functions
+        Output:
+            dictionary of parameter -> value, without None values
+        '''
+
+        values = {}
+        if query and len(kwargs) == 0 and hasattr(self, 'do_get_many'):
+            current_time = time.time()
+            todo = [key for key in names if key in self._getters and \
+                    self._getters[key].needs_query(current_time)]
+            if len(todo) > 1:
+                values = self.do_get_many(todo)
+                if values is None:
+                    values = {}
+                for key in values.keys():
+                    if key in todo:
+                        values[key] = self._getters[key].store(values[key],
+                                current_time)
+                    else:
+                        del values[key]
+
+        result = {}
+        for key in names:
+            if key in values:
+                val = values[key]
+            else:
+                val = self._get_value(key, query, **kwargs)
+            if val is not None:
+                result[key] = val
+        return result
 
     def get(self, name, query=True, fast=False, **kwargs):
         '''
@@ -770,13 +894,8 @@ class Instrument(SharedGObject):
             return ret
 
         if type(name) in (types.ListType, types.TupleType):
-            changed = {}
-            result = {}
-            for key in name:
-                val = self._get_value(key, query, **kwargs)
-                if val is not None:
-                    result[key] = val
-                    changed[key] = val
+            result = self._get_many(name, query, kwargs)
+            changed = dict(result)
 
         else:
             result = self._get_value(name, query, **kwargs)
@@ -867,26 +986,6 @@ class Instrument(SharedGObject):
             np.ndarray: lambda x: x.tolist(),
     }
 
-    def _convert_value(self, value, ttype):
-        if type(value) is types.BooleanType and \
-                ttype is not types.BooleanType:
-            logging.warning('Setting a boolean, but that is not the expected type')
-            raise ValueError()
-
-        if ttype not in self._CONVERT_MAP:
-            logging.warning('Unsupported type %s', ttype)
-            raise ValueError()
-
-        try:
-            func = self._CONVERT_MAP[ttype]
-            value = func(value)
-        except:
-            logging.warning('Conversion of %r to type %s failed',
-                    value, ttype)
-            raise ValueError()
-
-        return value
-
     def _set_value(self, name, value, **kwargs):
         '''
         Private wrapper function to set a value.
@@ -898,99 +997,223 @@ class Instrument(SharedGObject):
         Output: Value returned by the _do_set_<name> function,
                 or result of get in FLAG_GET_AFTER_SET specified.
         '''
-        if self._parameters.has_key(name):
-            p = self._parameters[name]
-        else:
-            return None
 
-        if not p['flags'] & Instrument.FLAG_SET:
-            logging.warn('Instrument does not support setting of %s' % name)
+        try:
+            setter = self._setters[name]
+        except KeyError:
             return None
 
-        if 'channel' in p and 'channel' not in kwargs:
-            kwargs['channel'] = p['channel']
-
-        # If a format map is available the key should be found.
-        if 'format_map' in p:
-            newval = self._val_from_option_dict(p['format_map'], value)
-            if newval is None:
-                logging.error('Value %s is not a valid option for "%s", valid options: %r',
-                    value, name, repr(p['format_map']))
-                return
-            value = newval
-
-        # If an option list is available check whether the value is in there
-        if 'option_list' in p:
-            newval = self._val_from_option_list(p['option_list'], value)
-            if newval is None:
-                logging.error('Value %s is not a valid option for "%s", valid: %r',
-                    value, name, repr(p['option_list']))
-                return
-            value = newval
-
-        if 'type' in p:
+        return setter(value, kwargs)
+
+    def _compile_setter(self, name, p):
+        flags = p['flags']
+        if not flags & Instrument.FLAG_SET:
+            def check(value):
+                logging.warn('Instrument does not support setting of %s' % name)
+                return None
+            return self._make_setter(check)
+
+        ptype = p.get('type', types.NoneType)
+        if ptype not in self._CONVERT_MAP:
+            def check(value):
+                logging.warning('Unsupported type %s', ptype)
+                return None
+            return self._make_setter(check)
+        convert = self._CONVERT_MAP[ptype]
+        is_bool = ptype is types.BooleanType
+
+        format_map = p.get('format_map', None)
+        option_list = p.get('option_list', None)
+        has_min, minval = 'minval' in p, p.get('minval', None)
+        has_max, maxval = 'maxval' in p, p.get('maxval', None)
+        stepped = p.get('maxstep', None) is not None
+        get_after_set = bool(flags & self.FLAG_GET_AFTER_SET)
+        persist = bool(flags & self.FLAG_PERSIST)
+        func = p['set_func']
+        channel = p.get('channel', None)
+        has_channel = 'channel' in p
+
+        def check(value):
+            # If a format map is available the key should be found.
+            if format_map is not None:
+                newval = self._val_from_option_dict(format_map, value)
+                if newval is None:
+                    logging.error('Value %s is not a valid option for "%s", valid options: %r',
+                        value, name, repr(format_map))
+                    return
+                value = newval
+
+            # If an option list is available check whether the value is in there
+            if option_list is not None:
+                newval = self._val_from_option_list(option_list, value)
+                if newval is None:
+                    logging.error('Value %s is not a valid option for "%s", valid: %r',
+                        value, name, repr(option_list))
+                    return
+                value = newval
+
+            if type(value) is types.BooleanType and not is_bool:
+                logging.warning('Setting a boolean, but that is not the expected type')
+                return None
             try:
-                value = self._convert_value(value, p['type'])
+                value = convert(value)
             except:
+                logging.warning('Conversion of %r to type %s failed',
+                        value, ptype)
                 return None
 
-        if 'minval' in p and value < p['minval']:
-            logging.warn('Trying to set "%s" too small: %s' % (name, value))
-            return None
+            if has_min and value < minval:
+                logging.warn('Trying to set "%s" too small: %s' % (name, value))
+                return None
 
-        if 'maxval' in p and value > p['maxval']:
-            logging.warn('Trying to set "%s" too large: %s' % (name, value))
-            return None
+            if has_max and value > maxval:
+                logging.warn('Trying to set "%s" too large: %s' % (name, value))
+                return None
 
-        if 'base_name' in p:
-            base_name = p['base_name']
-        else:
-            base_name = name
+            return value
 
-        func = p['set_func']
-        if 'maxstep' in p and p['maxstep'] is not None:
-            curval = p['value']
-            if curval is None:
-                logging.warning('Current "%s" value not available, ignoring maxstep', name)
-                curval = value + 0.01 * p['maxstep']
-
-            delta = curval - value
-            if delta < 0:
-                sign = 1
-            else:
-                sign = -1
+        def store(value):
+            if persist:
+                config.set('persist_%s_%s' % (self._name, name), value)
+                config.save()
 
-            if 'stepdelay' in p:
-                delay = p['stepdelay']
+            p['value'] = value
+            p['last_physical_access_time'] = time.time()
+            return value
+
+        def setter(value, kwargs):
+            if has_channel and 'channel' not in kwargs:
+                kwargs['channel'] = channel
+
+            value = check(value)
+            if value is None:
+                return None
+
+            if stepped:
+                self._set_value_stepped(name, p, func, value, kwargs)
             else:
-                delay = 50
+                func(value, **kwargs)
 
-            while math.fabs(delta) > 0:
-                if math.fabs(delta) > p['maxstep']:
-                    curval += sign * p['maxstep']
-                    delta += sign * p['maxstep']
-                else:
-                    curval = value
-                    delta = 0
+            if get_after_set:
+                value = self._get_value(name, **kwargs)
+
+            if persist:
+                config.set('persist_%s_%s' % (self._name, name), value)
+                config.save()
+
+            p['value'] = value
+            p['last_physical_access_time'] = time.time()
+            return value
 
-                ret = func(curval, **kwargs)
+        return self._make_setter(check, setter, store, stepped, get_after_set)
 
-                if delta != 0:
-                    time.sleep(delay / 1000.0)
+    def _make_setter(self, check, setter=None, store=None, stepped=False,
+            get_after_set=False):
+        '''
+        Return the set function for a parameter. The parts that _set_many
+        needs are attached to it as attributes.
+        '''
+
+        if setter is None:
+            def setter(value, kwargs):
+                return check(value)
 
+        setter.check = check
+        setter.store = store
+        setter.stepped = stepped
+        setter.get_after_set = get_after_set
+        return setter
+
+    def _set_value_stepped(self, name, p, func, value, kwargs):
+        '''
+        Set a parameter with a maximum step size in steps of 'maxstep',
+        waiting 'stepdelay' ms between steps.
+        '''
+
+        curval = p['value']
+        if curval is None:
+            logging.warning('Current "%s" value not available, ignoring maxstep', name)
+            curval = value + 0.01 * p['maxstep']
+
+        delta = curval - value
+        if delta < 0:
+            sign = 1
         else:
-            ret = func(value, **kwargs)
+            sign = -1
 
-        if p['flags'] & self.FLAG_GET_AFTER_SET:
-            value = self._get_value(name, **kwargs)
+        if 'stepdelay' in p:
+            delay = p['stepdelay']
+        else:
+            delay = 50
 
-        if p['flags'] & self.FLAG_PERSIST:
-            config.set('persist_%s_%s' % (self._name, name), value)
-            config.save()
+        while math.fabs(delta) > 0:
+            if math.fabs(delta) > p['maxstep']:
+                curval += sign * p['maxstep']
+                delta += sign * p['maxstep']
+            else:
+                curval = value
+                delta = 0
 
-        p['value'] = value
-        p['last_physical_access_time'] = time.time()
-        return value
+            func(curval, **kwargs)
+
+            if delta != 0:
+                time.sleep(delay / 1000.0)
+
+    def _set_many(self, values, kwargs):
+        '''
+        Set several parameter values.
+
+        If the driver implements do_set_many(values), the parameters that
+        can be set directly (without maxstep) are checked and converted,
+        and passed to it at once as a dictionary of name -> value, so that
+        it can set them in a single transaction. It should return a list
+        of the names that it did set; the other parameters are set one by
+        one as usual. Parameters with FLAG_GET_AFTER_SET are read back
+        together using _get_many().
+
+        Input:
+            values (dict): parameter -> value
+            kwargs (dict): extra options passed to the set functions
+        Output:
+            dictionary of parameter -> new value, None if setting failed
+        '''
+
+        result = {}
+        if len(kwargs) == 0 and hasattr(self, 'do_set_many'):
+            batch = {}
+            for key, val in values.iteritems():
+                setter = self._setters.get(key, None)
+                if setter is None or setter.stepped:
+                    continue
+                val = setter.check(val)
+                if val is None:
+                    result[key] = None
+                else:
+                    batch[key] = val
+
+            if len(batch) > 1:
+                done = self.do_set_many(batch)
+                if done is None:
+                    done = []
+                readback = []
+                for key in done:
+                    if key not in batch:
+                        continue
+                    if self._setters[key].get_after_set:
+                        readback.append(key)
+                    else:
+                        result[key] = self._setters[key].store(batch[key])
+
+                if len(readback) > 0:
+                    newvals = self._get_many(readback, True, {})
+                    for key in readback:
+                        result[key] = self._setters[key].store(
+                                newvals.get(key, None))
+
+        for key, val in values.iteritems():
+            if key not in result:
+                result[key] = self._set_value(key, val, **kwargs)
+        return result
 
     def set(self, name, value=None, fast=False, **kwargs):
         '''
@@ -1023,8 +1246,7 @@ class Instrument(SharedGObject):
         result = True
         changed = {}
         if type(name) == types.DictType:
-            for key, val in name.iteritems():
-                val = self._set_value(key, val, **kwargs)
+            for key, val in self._set_many(name, kwargs).iteritems():
                 if val is not None:
                     changed[key] = val
                 else:
@@ -1065,6 +1287,192 @@ class Instrument(SharedGObject):
 
         self._queue_changed({name: value})
 
+    def supports_buffered(self, name, flags):
+        '''
+        Return whether parameter 'name' can be used in a buffered sweep,
+        for setting (flags FLAG_SET) and / or getting (FLAG_GET).
+
+        Input:
+            name (string): parameter name
+            flags (int): FLAG_SET, FLAG_GET or both
+        Output: True or False
+        '''
+
+        if name not in self._parameters or \
+                not hasattr(self, 'do_arm_buffered'):
+            return False
+        return (self._parameters[name].get('buffered', 0) & flags) == flags
+
+    def arm_buffered(self, npoints, interval, sets=None, gets=None):
+        '''
+        Prepare a buffered sweep, in which the instrument steps through a
+        list of setpoints and / or records a list of values by itself,
+        without a call for every point.
+
+        Sources set point k at k * interval seconds after the trigger,
+        readers take sample k at (k + 0.5) * interval seconds after the
+        trigger. Readers should be triggered before the sources, see
+        trigger_buffered(), and the result is read with fetch_buffered().
+
+        The setpoints are checked like in set(). Parameters with a maxstep
+        can only be swept if no step is larger than maxstep, and not
+        faster than the stepdelay.
+
+        Drivers support this by implementing do_arm_buffered(sets, gets,
+        npoints, interval), which should return True if armed,
+        do_fetch_buffered(), which should return a dictionary of name ->
+        array of npoints values for the parameters in gets, and
+        optionally do_trigger_buffered() to start. The parameters are
+        marked with the 'buffered' option, see add_parameter().
+
+        Input:
+            npoints (int): number of points
+            interval (float): time per point in seconds
+            sets (dict): parameter -> list of npoints setpoints
+            gets (list): parameters to record
+        Output: True if armed, False otherwise
+        '''
+
+        if sets is None:
+            sets = {}
+        if gets is None:
+            gets = []
+
+        if len(sets) > 0 and self._locked:
+            logging.warning('Trying to sweep "%s" of locked instrument (%s)',
+                    sets.keys(), self.get_name())
+            return False
+
+        checked = {}
+        for name, values in sets.iteritems():
+            if not self.supports_buffered(name, Instrument.FLAG_SET):
+                logging.warning('Parameter %s does not support buffered set', name)
+                return False
+            if len(values) != npoints:
+                logging.warning('Need %d setpoints for %s, got %d',
+                        npoints, name, len(values))
+                return False
+
+            setter = self._setters[name]
+            values = [setter.check(v) for v in values]
+            if None in values:
+                return False
+            values = np.array(values)
+
+            p = self._parameters[name]
+            if p.get('maxstep', None) is not None:
+                steps = np.abs(np.diff(values))
+                if p['value'] is not None:
+                    steps = np.append(steps, abs(values[0] - p['value']))
+                if len(steps) > 0 and steps.max() > p['maxstep']:
+                    logging.warning('Buffered sweep of %s has steps larger than %s',
+                            name, p['maxstep'])
+                    return False
+                if interval * 1000.0 < p.get('stepdelay', 50):
+                    logging.warning('Buffered sweep of %s faster than stepdelay',
+                            name)
+                    return False
+
+            checked[name] = values
+
+        for name in gets:
+            if not self.supports_buffered(name, Instrument.FLAG_GET):
+                logging.warning('Parameter %s does not support buffered get', name)
+                return False
+
+        gets = list(gets)
+        if not self.do_arm_buffered(checked, gets, npoints, interval):
+            return False
+        self._buffered = (checked, gets, npoints)
+        return True
+
+    def trigger_buffered(self):
+        '''
+        Start a buffered sweep prepared with arm_buffered().
+        '''
+
+        if self._buffered is None:
+            logging.warning('Buffered sweep not armed')
+            return False
+        if hasattr(self, 'do_trigger_buffered'):
+            self.do_trigger_buffered()
+        return True
+
+    def fetch_buffered(self):
+        '''
+        Wait for a buffered sweep to finish and return the recorded values.
+        The parameter values are updated to the last point.
+
+        Output: dictionary of parameter -> array of values
+        '''
+
+        if self._buffered is None:
+            raise ValueError('Buffered sweep of %s not armed' % self.get_name())
+        sets, gets, npoints = self._buffered
+        self._buffered = None
+
+        values = self.do_fetch_buffered()
+        if values is None:
+            values = {}
+
+        current_time = time.time()
+        result = {}
+        changed = {}
+        for name in gets:
+            if name not in values or len(values[name]) != npoints:
+                raise ValueError('Buffered sweep of %s did not return %d values for %s' % \
+                        (self.get_name(), npoints, name))
+            result[name] = np.asarray(values[name])
+            changed[name] = self._getters[name].store(result[name][-1],
+                    current_time)
+        for name, vals in sets.iteritems():
+            changed[name] = self._setters[name].store(vals[-1])
+
+        if len(changed) > 0:
+            self._queue_changed(changed)
+        return result
+
+    def abort_buffered(self):
+        '''
+        Stop a buffered sweep prepared with arm_buffered() without reading
+        the result. Drivers can implement do_abort_buffered() to restore
+        their settings; it can return a dictionary of parameter -> last
+        setpoint that was sent.
+
+        The swept parameters may have stopped anywhere in the sweep, so
+        their values are updated to the last setpoint sent, or read from
+        the instrument if the driver does not know it. A value that is
+        still unknown is set to None.
+        '''
+
+        if self._buffered is None:
+            return
+        sets = self._buffered[0]
+        self._buffered = None
+        last = None
+        if hasattr(self, 'do_abort_buffered'):
+            last = self.do_abort_buffered()
+        if last is None:
+            last = {}
+
+        changed = {}
+        for name in sets:
+            if last.get(name, None) is not None:
+                changed[name] = self._setters[name].store(last[name])
+                continue
+            try:
+                value = self._get_value(name, query=True)
+            except Exception, e:
+                logging.warning('Unable to read %s after aborted sweep: %s',
+                        name, str(e))
+                value = None
+            if value is None:
+                self._parameters[name]['value'] = None
+            changed[name] = value
+
+        if len(changed) > 0:
+            self._queue_changed(changed)
+
     def get_argspec_dict(self, a):
         return dict(args=a[0], varargs=a[1], keywords=a[2], defaults=a[3])
 
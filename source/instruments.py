@@ -25,7 +25,7 @@ import sys
 import instrument
 from lib.config import get_config
 from insproxy import Proxy
-from lib.network.object_sharer import SharedGObject
+from lib.network.object_sharer import SharedGObject, cache_result_until
 
 from lib.misc import get_traceback
 TB = get_traceback()()
@@ -113,6 +113,11 @@ class Instruments(SharedGObject):
         self._instruments_info = {}
         self._tags = []
 
+        # Version at which each parameter last changed, for snapshot_delta
+        self._version = 0
+        self._param_versions = {}
+        self._removed_params = {}
+
     def __getitem__(self, key):
         return self.get(key)
 
@@ -135,8 +140,13 @@ class Instruments(SharedGObject):
         info['changed_hid'] = ins.connect('changed', self._instrument_changed_cb)
         info['removed_hid'] = ins.connect('removed', self._instrument_removed_cb)
         info['reload_hid'] = ins.connect('reload', self._instrument_reload_cb)
+        info['padd_hid'] = ins.connect('parameter-added',
+                self._parameter_added_cb)
+        info['prem_hid'] = ins.connect('parameter-removed',
+                self._parameter_removed_cb)
         info['proxy'] = Proxy(ins.get_name())
         self._instruments_info[ins.get_name()] = info
+        self._touch_parameters(ins.get_name(), ins.get_parameter_names())
 
         newtags = []
         for tag in ins.get_tags():
@@ -170,6 +180,7 @@ class Instruments(SharedGObject):
         else:
             return None
 
+    @cache_result_until('instrument-added', 'instrument-removed')
     def get_instrument_names(self):
         keys = self._instruments.keys()
         keys.sort()
@@ -245,6 +256,7 @@ class Instruments(SharedGObject):
                 ret.append(ins)
         return ret
 
+    @cache_result_until('tags-added')
     def get_tags(self):
         '''
         Return list of tags present in instruments.
@@ -380,6 +392,11 @@ class Instruments(SharedGObject):
             del self._instruments[name]
             del self._instruments_info[name]
 
+        if name in self._param_versions:
+            self._version += 1
+            for param in self._param_versions.pop(name):
+                self._removed_params[(name, param)] = self._version
+
         self.emit('instrument-removed', name)
 
     def _instrument_removed_cb(self, sender, name):
@@ -410,8 +427,118 @@ class Instruments(SharedGObject):
             None
         '''
 
+        self._touch_parameters(sender.get_name(), changes.keys())
         self.emit('instrument-changed', sender.get_name(), changes)
 
+    def _parameter_added_cb(self, sender, name):
+        self._touch_parameters(sender.get_name(), [name])
+
+    def _parameter_removed_cb(self, sender, name):
+        insname = sender.get_name()
+        self._version += 1
+        self._param_versions.get(insname, {}).pop(name, None)
+        self._removed_params[(insname, name)] = self._version
+
+    def _touch_parameters(self, insname, names):
+        '''Mark parameters of instrument insname as changed.'''
+        self._version += 1
+        versions = self._param_versions.setdefault(insname, {})
+        for name in names:
+            versions[name] = self._version
+            self._removed_params.pop((insname, name), None)
+
+    def get_version(self):
+        '''
+        Return the current version counter, which is increased when
+        parameters change, are added or removed.
+        '''
+        return self._version
+
+    def snapshot(self, instrument_names=None, query=False):
+        '''
+        Return the state of all parameters of several instruments at once.
+
+        Input:
+            instrument_names (list of strings): instruments to include,
+                default all
+            query (bool): whether to read the values from the instruments
+                first; by default the last known values are returned
+        Output:
+            dictionary with the current 'version' and equally long lists
+            'instruments', 'parameters', 'values', 'units' and 'timestamps'
+            (time of the last instrument access, or None), one item per
+            parameter.
+        '''
+        return self._snapshot(instrument_names, query, None)
+
+    def snapshot_delta(self, version, instrument_names=None):
+        '''
+        Return the parameters that changed since version, which is the
+        'version' item of an earlier snapshot() or snapshot_delta().
+
+        Input:
+            version (int): version of the earlier snapshot
+            instrument_names (list of strings): instruments to include,
+                default all
+        Output:
+            dictionary like snapshot(), with only the changed parameters,
+            and 'removed', a list of (instrument, parameter) tuples that
+            were removed.
+        '''
+
+        snap = self._snapshot(instrument_names, False, version)
+        snap['removed'] = [key for key, v in self._removed_params.iteritems()
+                if v > version and
+                (instrument_names is None or key[0] in instrument_names)]
+        return snap
+
+    def _snapshot(self, instrument_names, query, version):
+        if instrument_names is None:
+            instrument_names = self.get_instrument_names()
+
+        snap = {
+            'version': self._version,
+            'instruments': [],
+            'parameters': [],
+            'values': [],
+            'units': [],
+            'timestamps': [],
+        }
+
+        for insname in instrument_names:
+            ins = self._instruments.get(insname, None)
+            if ins is None:
+                continue
+
+            params = ins.get_parameters()
+            if version is None:
+                names = params.keys()
+            else:
+                versions = self._param_versions.get(insname, {})
+                names = [name for name, v in versions.iteritems()
+                        if v > version and name in params]
+            names.sort()
+
+            if query:
+                toget = [name for name in names
+                        if params[name]['flags'] & instrument.Instrument.FLAG_GET]
+                try:
+                    ins.get(toget)
+                except Exception, e:
+                    logging.warning('Unable to query %s for snapshot: %s',
+                            insname, str(e))
+
+            for name in names:
+                opts = params[name]
+                snap['instruments'].append(insname)
+                snap['parameters'].append(name)
+                snap['values'].append(opts.get('value', None))
+                snap['units'].append(opts.get('units', ''))
+                ts = opts.get('last_physical_access_time', 0)
+                snap['timestamps'].append(ts or None)
+
+        return snap
+
 _config = get_config()
 _insdir = _set_insdir()
 _user_insdir = _set_user_insdir()
@@ -0,0 +1,289 @@
+# adaptive.py, choose measurement points where the signal changes
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import types
+import numpy
+
+# Loss functions get, for every cell, its size and the values at its
+# corners and center, scaled to the range of all values measured so far
+# and to a unit domain. They return the loss of each cell; the cell with
+# the largest loss is refined first.
+
+def loss_uniform(size, corners, center):
+    '''Refine the largest cells first, i.e. a uniform grid.'''
+    return size
+
+def _area_weight(size, corners):
+    # Weight by the square root of the cell area (length in 1D), so that
+    # the loss follows the contribution of a cell to the rms error.
+    ndim = numpy.log2(corners.shape[1])
+    return size ** (ndim / 2)
+
+def loss_gradient(size, corners, center):
+    '''
+    Refine where the value changes most across a cell, e.g. steps and
+    steep slopes.
+    '''
+    values = numpy.column_stack((corners, center))
+    spread = values.max(axis=1) - values.min(axis=1)
+    return (spread + 0.1 * size) * _area_weight(size, corners)
+
+def loss_curvature(size, corners, center):
+    '''
+    Refine where the center value deviates most from the linear
+    interpolation of the corners, e.g. peaks and kinks. A fraction of the
+    size is added so that flat regions are sampled as well.
+    '''
+    deviation = numpy.abs(center - corners.mean(axis=1))
+    return (deviation + 0.1 * size) * _area_weight(size, corners)
+
+def loss_variance(size, corners, center):
+    '''
+    Refine where the values within a cell are spread most, e.g. noisy
+    regions. A fraction of the size is added so that flat regions are
+    sampled as well.
+    '''
+    values = numpy.column_stack((corners, center))
+    return (values.std(axis=1) + 0.1 * size) * _area_weight(size, corners)
+
+LOSSES = {
+    'uniform': loss_uniform,
+    'gradient': loss_gradient,
+    'curvature': loss_curvature,
+    'variance': loss_variance,
+}
+
+class AdaptiveSampler:
+    '''
+    Chooses the points of a 1D or 2D sweep from the values measured so
+    far.
+
+    The domain is divided in cells (intervals or rectangles), measured at
+    their corners and center. The cell with the largest loss is split in
+    two (1D) or four (2D) cells, and the new corners and centers are
+    measured next. Cells smaller than min_size, as a fraction of the
+    domain, are not split further. The sampler starts with a coarse
+    uniform grid, which should be fine enough not to miss narrow features
+    completely.
+
+    Usage:
+        s = AdaptiveSampler([(0, 1)], loss='curvature')
+        while s.get_npoints() < 100:
+            x = s.ask()
+            if x is None:
+                break
+            s.tell(x, f(*x))
+    '''
+
+    def __init__(self, bounds, loss='curvature', min_size=1e-3, initial=3):
+        '''
+        Input:
+            bounds (list of (start, end) tuples): range of each axis
+            loss (string or function): one of LOSSES or a function with
+                the same arguments
+            min_size (float): smallest cell size, relative to the domain
+            initial (int): number of uniform refinements to start with,
+                i.e. 2**initial cells along each axis
+        '''
+
+        self._bounds = [(float(a), float(b)) for a, b in bounds]
+        self._ndim = len(self._bounds)
+        if self._ndim not in (1, 2):
+            raise ValueError('Adaptive sampling supports 1 or 2 axes')
+        if type(loss) is types.StringType:
+            loss = LOSSES[loss]
+        self._loss = loss
+        self._min_size = min_size
+
+        # Points are stored in unit coordinates, which are exact binary
+        # fractions, so cells sharing a point find the same key.
+        self._values = {}
+        self._asked = {}
+        self._queue = []
+        self._queued = set()
+
+        # Leaf cells as [lo, hi, size, values], values is None until all
+        # points of the cell are known.
+        self._cells = []
+        cells = [((0.0,) * self._ndim, (1.0,) * self._ndim)]
+        for i in range(initial):
+            cells = [c for lo, hi in cells for c in self._split(lo, hi)]
+        for lo, hi in cells:
+            self._add_cell(lo, hi)
+
+    def _cell_points(self, lo, hi):
+        '''Corners and center of a cell.'''
+        if self._ndim == 1:
+            return [lo, hi, ((lo[0] + hi[0]) / 2, )]
+        return [lo, (hi[0], lo[1]), (lo[0], hi[1]), hi,
+                ((lo[0] + hi[0]) / 2, (lo[1] + hi[1]) / 2)]
+
+    def _split(self, lo, hi):
+        mid = [(a + b) / 2 for a, b in zip(lo, hi)]
+        if self._ndim == 1:
+            return [(lo, (mid[0], )), ((mid[0], ), hi)]
+        return [(lo, (mid[0], mid[1])),
+                ((mid[0], lo[1]), (hi[0], mid[1])),
+                ((lo[0], mid[1]), (mid[0], hi[1])),
+                ((mid[0], mid[1]), hi)]
+
+    def _add_cell(self, lo, hi):
+        size = numpy.prod([b - a for a, b in zip(lo, hi)]) ** (1.0 / self._ndim)
+        self._cells.append([lo, hi, size, None])
+        for p in self._cell_points(lo, hi):
+            if p not in self._values and p not in self._queued:
+                self._queue.append(p)
+                self._queued.add(p)
+
+    def _to_coords(self, p):
+        return tuple([a + u * (b - a) for u, (a, b) in zip(p, self._bounds)])
+
+    def _get_losses(self):
+        '''Return the loss of every cell, -1 for cells that can't be split.'''
+
+        n = len(self._cells)
+        npts = 2 ** self._ndim + 1
+        values = numpy.zeros((n, npts))
+        sizes = numpy.zeros(n)
+        ok = numpy.zeros(n, dtype=bool)
+        for i, cell in enumerate(self._cells):
+            if cell[3] is None:
+                try:
+                    cell[3] = [self._values[p] for p in \
+                            self._cell_points(cell[0], cell[1])]
+                except KeyError:
+                    continue
+            values[i] = cell[3]
+            sizes[i] = cell[2]
+            ok[i] = True
+
+        measured = numpy.array(self._values.values(), dtype=float)
+        measured = measured[numpy.isfinite(measured)]
+        if len(measured) > 0:
+            vmin = measured.min()
+            scale = measured.max() - vmin
+        else:
+            vmin = 0.0
+            scale = 0.0
+        if scale == 0:
+            scale = 1.0
+        values = (values - vmin) / scale
+
+        losses = numpy.asarray(self._loss(sizes, values[:, :-1], values[:, -1]),
+                dtype=float)
+        losses[~ok | (sizes / 2 < self._min_size) | ~numpy.isfinite(losses)] = -1
+        return losses
+
+    def ask(self):
+        '''
+        Return the coordinates of the next point to measure, as a tuple,
+        or None if all cells have reached the minimum size.
+        '''
+
+        if len(self._queue) == 0:
+            if len(self._cells) == 0:
+                return None
+            losses = self._get_losses()
+            i = numpy.argmax(losses)
+            if losses[i] < 0:
+                return None
+            lo, hi, size, values = self._cells.pop(i)
+            for clo, chi in self._split(lo, hi):
+                self._add_cell(clo, chi)
+
+        p = self._queue.pop(0)
+        self._queued.discard(p)
+        coords = self._to_coords(p)
+        self._asked[coords] = p
+        return coords
+
+    def tell(self, coords, value):
+        '''
+        Store the value measured at coords, as returned by ask(). None is
+        stored as NaN; cells with a NaN value are not refined.
+        '''
+
+        p = self._asked.pop(tuple(coords))
+        if value is None:
+            value = numpy.nan
+        self._values[p] = float(value)
+
+    def get_loss(self):
+        '''
+        Return the largest loss of the cells that can still be split,
+        infinite while points of new cells remain to be measured.
+        '''
+        if len(self._queue) > 0 or len(self._asked) > 0:
+            return numpy.inf
+        if len(self._cells) == 0:
+            return 0.0
+        return max(self._get_losses().max(), 0.0)
+
+    def get_npoints(self):
+        '''Return the number of measured points.'''
+        return len(self._values)
+
+    def get_points(self):
+        '''
+        Return the measured points as an array of coordinates, one row
+        per point, and an array of values.
+        '''
+
+        keys = self._values.keys()
+        coords = numpy.array([self._to_coords(p) for p in keys]).reshape(
+                len(keys), self._ndim)
+        values = numpy.array([self._values[p] for p in keys])
+        return coords, values
+
+    def interpolate(self, coords):
+        '''
+        Interpolate the measured values at coords, an array with one row
+        per point (or a 1D array for a 1D sweep): linearly in 1D,
+        bilinearly within each cell in 2D. Points outside measured cells
+        give NaN.
+        '''
+
+        coords = numpy.asarray(coords, dtype=float)
+        if self._ndim == 1:
+            x, y = self.get_points()
+            order = numpy.argsort(x[:, 0])
+            return numpy.interp(coords.ravel(), x[order, 0], y[order])
+
+        coords = coords.reshape(-1, 2)
+        u = numpy.empty_like(coords)
+        for i, (a, b) in enumerate(self._bounds):
+            u[:, i] = (coords[:, i] - a) / (b - a)
+        ret = numpy.empty(len(u))
+        ret.fill(numpy.nan)
+
+        # Sort on x so only the points in the column of a cell are checked
+        order = numpy.argsort(u[:, 0])
+        u = u[order]
+        self._get_losses()
+        for lo, hi, size, values in self._cells:
+            if values is None:
+                continue
+            i0 = numpy.searchsorted(u[:, 0], lo[0], 'left')
+            i1 = numpy.searchsorted(u[:, 0], hi[0], 'right')
+            mask = (u[i0:i1, 1] >= lo[1]) & (u[i0:i1, 1] <= hi[1])
+            if not mask.any():
+                continue
+            tx = (u[i0:i1, 0][mask] - lo[0]) / (hi[0] - lo[0])
+            ty = (u[i0:i1, 1][mask] - lo[1]) / (hi[1] - lo[1])
+            ret[order[i0:i1][mask]] = values[0] * (1 - tx) * (1 - ty) + \
+                    values[1] * tx * (1 - ty) + \
+                    values[2] * (1 - tx) * ty + values[3] * tx * ty
+        return ret
@@ -24,7 +24,7 @@ import gtk
 
 import threading
 import time
-from misc import exact_time
+from pacing import Pacer
 
 class ThreadSafeGObject(gobject.GObject):
 
@@ -114,17 +114,19 @@ class CallTimerThread(GObjectThread):
 
         self._stop_lock = threading.Lock()
         self._stop_requested = False
+        self._pacer = None
 
     def run(self):
-        tstart = exact_time()
-        extra_delay = 0
+        # No main loop to service in this thread
+        self._pacer = Pacer()
+        self._pacer.start()
 
         i = 0
         while i < self._n:
             f = self._cb
 
             try:
-                extra_delay += f(i, *self._args, **self._kwargs)
+                extra_delay = f(i, *self._args, **self._kwargs)
             except Exception, e:
                 self.emit('finished')
                 raise e
@@ -139,13 +141,10 @@ class CallTimerThread(GObjectThread):
                 break
 
             # delay
-            tn = exact_time()
             if 'time_exact' in self._kwargs:
-                req_delay = tstart + extra_delay / 1000.0 + float(i) * self._delay / 1000.0 - tn
-                if req_delay > 0:
-                    time.sleep(req_delay)
+                self._pacer.next((extra_delay + self._delay) / 1000.0)
             else:
-                time.sleep((extra_delay + self._delay) / 1000.0)
+                self._pacer.sleep((extra_delay + self._delay) / 1000.0)
 
         self.emit('finished', 'ok')
 
@@ -164,6 +163,15 @@ class CallTimerThread(GObjectThread):
     def get_stop_message(self):
         return self._stop_message
 
+    def get_pacing_stats(self):
+        '''
+        Return the timing of the delays, see Pacer.get_stats(), or None
+        if not started yet.
+        '''
+        if self._pacer is None:
+            return None
+        return self._pacer.get_stats()
+
 class CallTimer:
     '''
     Class to several times do a callback with a specified delay, blocking.
@@ -186,10 +194,12 @@ class CallTimer:
         self._n = n
         self._args = args
         self._kwargs = kwargs
+        self._pacer = None
 
     def start(self):
         import qt
-        tstart = exact_time()
+        self._pacer = Pacer(idle=qt.flow.service_events)
+        self._pacer.start()
 
         i = 0
         while i < self._n:
@@ -200,10 +210,16 @@ class CallTimer:
                 break
 
             # delay
-            tn = exact_time()
-            req_delay = tstart + float(i) * self._delay / 1000.0 - tn
-            if req_delay > 0:
-                qt.msleep(req_delay)
+            self._pacer.next(self._delay / 1000.0)
+
+    def get_pacing_stats(self):
+        '''
+        Return the timing of the delays, see Pacer.get_stats(), or None
+        if not started yet.
+        '''
+        if self._pacer is None:
+            return None
+        return self._pacer.get_stats()
 
 class ThreadCall(threading.Thread):
     '''
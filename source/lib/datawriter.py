@@ -0,0 +1,195 @@
+# datawriter.py, buffered writers for measurement data files
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import time
+import threading
+import Queue
+import logging
+
+class BufferedWriter:
+    '''
+    Collects data written to a file and writes it out in batches.
+
+    The flush policy is set by:
+        flush_rows (int): flush after this many data rows. 1 (the default)
+            flushes after every row, 0 or None disables this.
+        flush_interval (float): flush if this many seconds passed since the
+            last flush. This is checked when data is written. None disables
+            this.
+
+    flush() should be called explicitly at points where the file should be
+    complete on disk, e.g. at the end of a block or when closing the file.
+    '''
+
+    def __init__(self, f, flush_rows=1, flush_interval=None):
+        self._file = f
+        self._flush_rows = flush_rows
+        self._flush_interval = flush_interval
+
+        self._pending = []
+        self._pending_rows = 0
+        self._last_flush = time.time()
+
+    def get_file(self):
+        return self._file
+
+    def set_flush_policy(self, flush_rows=1, flush_interval=None):
+        self._flush_rows = flush_rows
+        self._flush_interval = flush_interval
+
+    def _need_flush(self):
+        if self._flush_rows and self._pending_rows >= self._flush_rows:
+            return True
+        if self._flush_interval is not None and \
+                time.time() - self._last_flush >= self._flush_interval:
+            return True
+        return False
+
+    def write(self, data, nrows=0):
+        '''
+        Queue data (a string) containing nrows data rows for writing.
+        '''
+
+        self._pending.append(data)
+        self._pending_rows += nrows
+        if self._need_flush():
+            self.flush()
+
+    def flush(self):
+        '''Write all pending data and flush the file.'''
+
+        if len(self._pending) > 0:
+            self._file.write(''.join(self._pending))
+            self._pending = []
+        self._pending_rows = 0
+        self._file.flush()
+        self._last_flush = time.time()
+
+    def close(self):
+        '''
+        Flush pending data. The file itself is not closed, that is up to the
+        owner of the file object.
+        '''
+        self.flush()
+
+class WriterError(Exception):
+    pass
+
+class ThreadedWriter:
+    '''
+    Writes data to a file from a separate thread, so that slow disk access
+    does not block the thread that produces the data.
+
+    Data is put on a bounded queue and the writer thread writes it using a
+    BufferedWriter with the same flush policy options. The flush interval
+    is also honored when no new data arrives.
+
+    If the queue is full, policy decides what happens:
+        'block': wait until the writer thread made space (default)
+        'error': raise WriterError
+
+    An error in the writer thread is raised as WriterError by the next call
+    to write() or flush(). close() waits until all data is written.
+    '''
+
+    def __init__(self, f, flush_rows=1, flush_interval=None,
+            maxsize=10000, policy='block'):
+        if policy not in ('block', 'error'):
+            raise ValueError('Unknown queue policy %r' % policy)
+
+        self._writer = BufferedWriter(f, flush_rows=flush_rows,
+                flush_interval=flush_interval)
+        self._flush_interval = flush_interval
+        self._queue = Queue.Queue(maxsize)
+        self._policy = policy
+        self._error = None
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run,
+                name='DataWriter')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def get_file(self):
+        return self._writer.get_file()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(True, self._flush_interval)
+            except Queue.Empty:
+                item = ('flush', None)
+
+            cmd, arg = item[0], item[1:]
+            if self._error is None:
+                try:
+                    if cmd == 'write':
+                        self._writer.write(*arg)
+                    elif cmd in ('flush', 'close'):
+                        self._writer.flush()
+                except Exception, e:
+                    logging.error('Data writer thread failed: %s', str(e))
+                    self._error = e
+
+            if cmd == 'close':
+                arg[0].set()
+                return
+
+    def _check_error(self):
+        if self._error is not None:
+            raise WriterError('Writing data failed: %s' % str(self._error))
+
+    def _put(self, item):
+        if self._closed:
+            raise WriterError('Writer already closed')
+
+        if self._policy == 'block':
+            self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except Queue.Full:
+                raise WriterError('Data writer queue full (%d items)' % \
+                        self._queue.maxsize)
+
+    def write(self, data, nrows=0):
+        '''Queue data containing nrows data rows for writing.'''
+        self._check_error()
+        self._put(('write', data, nrows))
+
+    def flush(self):
+        '''Request a flush; this does not wait for it to complete.'''
+        self._check_error()
+        self._put(('flush', ))
+
+    def get_queue_size(self):
+        '''Return the number of items waiting to be written.'''
+        return self._queue.qsize()
+
+    def close(self):
+        '''
+        Write all queued data, flush and stop the writer thread.
+        The file itself is not closed.
+        '''
+
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(('close', done))
+        self._closed = True
+        done.wait()
+        self._thread.join()
+        self._check_error()
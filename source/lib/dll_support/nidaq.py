@@ -45,6 +45,7 @@ _config_map = {
 }
 
 DAQmx_Val_Volts             = 10348
+DAQmx_Val_Seconds           = 10364
 DAQmx_Val_Rising            = 10280
 DAQmx_Val_FiniteSamps       = 10178
 DAQmx_Val_GroupByChannel    = 0
@@ -250,6 +251,124 @@ def write(devchan, data, freq=10000.0, minv=-10.0, maxv=10.0,
 
     return written.value
 
+def _get_config(config):
+    if type(config) is types.StringType:
+        if config.upper() not in _config_map:
+            raise ValueError('Unknown channel configuration %s' % config)
+        config = _config_map[config.upper()]
+    return config
+
+def create_ai_task(devchans, samples, freq, minv=-10.0, maxv=10.0,
+            config=DAQmx_Val_Cfg_Default, clock='', delay=None):
+    '''
+    Create a task to acquire a number of samples from one or more input
+    channels with a sample clock. Start it with start_task() and read the
+    data with read_task().
+
+    Input:
+        devchans (list of strings): device/channel specifiers
+        samples (int): the number of samples per channel
+        freq (float): the sampling frequency
+        minv (float): the minimum voltage
+        maxv (float): the maximum voltage
+        config (string or int): the configuration of the channels
+        clock (string): sample clock terminal, e.g. /Dev1/ao/SampleClock,
+            the default is the internal clock
+        delay (float): delay between the sample clock and the conversion
+            in seconds, None for the default
+
+    Output:
+        The task handle, raises RuntimeError on error
+    '''
+
+    config = _get_config(config)
+    taskHandle = TaskHandle(0)
+    try:
+        CHK(nidaq.DAQmxCreateTask("", ctypes.byref(taskHandle)))
+        CHK(nidaq.DAQmxCreateAIVoltageChan(taskHandle, ','.join(devchans),
+            "", config, float64(minv), float64(maxv),
+            DAQmx_Val_Volts, None))
+        CHK(nidaq.DAQmxCfgSampClkTiming(taskHandle, clock, float64(freq),
+            DAQmx_Val_Rising, DAQmx_Val_FiniteSamps, uInt64(samples)))
+        if delay is not None:
+            CHK(nidaq.DAQmxSetDelayFromSampClkDelayUnits(taskHandle,
+                DAQmx_Val_Seconds))
+            CHK(nidaq.DAQmxSetDelayFromSampClkDelay(taskHandle,
+                float64(delay)))
+    except:
+        clear_task(taskHandle)
+        raise
+
+    return taskHandle
+
+def create_ao_task(devchans, data, freq, minv=-10.0, maxv=10.0,
+            timeout=10.0):
+    '''
+    Create a task to write samples to one or more output channels with
+    a sample clock. The data is written to the device buffer, start the
+    output with start_task(). The sample clock of the task is available
+    to other tasks as /<device>/ao/SampleClock.
+
+    Input:
+        devchans (list of strings): device/channel specifiers
+        data (numpy.array): the values, one row per channel
+        freq (float): the update frequency
+        minv (float): the minimum voltage
+        maxv (float): the maximum voltage
+        timeout (float): the time in seconds to wait for writing
+
+    Output:
+        The task handle, raises RuntimeError on error
+    '''
+
+    data = numpy.array(data, dtype=numpy.float64, ndmin=2, order='C')
+    samples = data.shape[1]
+    taskHandle = TaskHandle(0)
+    written = int32()
+    try:
+        CHK(nidaq.DAQmxCreateTask("", ctypes.byref(taskHandle)))
+        CHK(nidaq.DAQmxCreateAOVoltageChan(taskHandle, ','.join(devchans),
+            "", float64(minv), float64(maxv), DAQmx_Val_Volts, None))
+        CHK(nidaq.DAQmxCfgSampClkTiming(taskHandle, "", float64(freq),
+            DAQmx_Val_Rising, DAQmx_Val_FiniteSamps, uInt64(samples)))
+        CHK(nidaq.DAQmxWriteAnalogF64(taskHandle, samples, 0,
+            float64(timeout), DAQmx_Val_GroupByChannel, data.ctypes.data,
+            ctypes.byref(written), None))
+    except:
+        clear_task(taskHandle)
+        raise
+
+    return taskHandle
+
+def start_task(taskHandle):
+    '''Start a task created by create_ai_task() or create_ao_task().'''
+    CHK(nidaq.DAQmxStartTask(taskHandle))
+
+def read_task(taskHandle, nchans, samples, timeout=10.0):
+    '''
+    Wait for and read the samples acquired by a task from create_ai_task().
+
+    Output:
+        A numpy.array with one row per channel
+    '''
+
+    data = numpy.zeros((nchans, samples), dtype=numpy.float64)
+    read = int32()
+    CHK(nidaq.DAQmxReadAnalogF64(taskHandle, samples, float64(timeout),
+        DAQmx_Val_GroupByChannel, data.ctypes.data,
+        data.size, ctypes.byref(read), None))
+    return data[:, :read.value]
+
+def wait_task(taskHandle, timeout=10.0):
+    '''Wait until a task from create_ao_task() is done.'''
+    CHK(nidaq.DAQmxWaitUntilTaskDone(taskHandle, float64(timeout)))
+
+def clear_task(taskHandle):
+    '''Stop and clear a task.'''
+    if taskHandle.value != 0:
+        nidaq.DAQmxStopTask(taskHandle)
+        nidaq.DAQmxClearTask(taskHandle)
+
 def read_counter(devchan="/Dev1/ctr0", samples=1, freq=1.0, timeout=1.0, src=""):
     '''
     Read counter 'devchan'.
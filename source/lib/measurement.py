@@ -19,8 +19,147 @@ import time
 import gtk
 import gobject
 import logging
+import numpy
 import qt
 from data import Data
+from instrument import Instrument
+from lib.readout import ParallelReader
+from lib.adaptive import AdaptiveSampler
+from lib.pacing import Pacer
+
+class SweepPlan():
+    '''
+    Table of all setpoints of a measurement loop, computed in advance.
+
+    The coordinates are given as a list of dictionaries with the
+    'setpoints' of each axis and optionally:
+        'mode': 'linear' (default) to sweep every pass in the same
+            direction, or 'serpentine' to reverse the direction on every
+            pass of the outer loop.
+        'hysteresis': if True, sweep through the setpoints and back.
+        'delay': delay after setting the value, in ms.
+    The first coordinate changes fastest.
+
+    The plan holds, as numpy arrays with one row per point:
+        indices: index of the setpoint of each axis
+        setpoints: value of each axis
+        changed: whether each axis has to be set to go to this point
+            (all axes for the first point)
+        new_block: whether an axis other than the first one changed
+        delays: extra delay after setting the changed axes, in seconds
+    '''
+
+    def __init__(self, coords):
+        self._coords = coords
+
+        axes = []
+        for coord in coords:
+            values = numpy.asarray(coord['setpoints'], dtype=float)
+            if coord.get('hysteresis', False):
+                values = numpy.concatenate((values, values[-2::-1]))
+            axes.append(values)
+        self._axes = axes
+
+        naxes = len(axes)
+        sizes = [len(v) for v in axes]
+        self._npoints = int(numpy.prod(sizes)) if naxes > 0 else 0
+
+        n = numpy.arange(self._npoints)
+        self.indices = numpy.empty((self._npoints, naxes), dtype=int)
+        self.setpoints = numpy.empty((self._npoints, naxes), dtype=float)
+        period = 1
+        for i, size in enumerate(sizes):
+            index = (n // period) % size
+            if coords[i].get('mode', 'linear') == 'serpentine':
+                npass = n // (period * size)
+                index = numpy.where(npass % 2 == 1, size - 1 - index, index)
+            elif coords[i].get('mode', 'linear') != 'linear':
+                raise ValueError('Unknown sweep mode %r' % coords[i]['mode'])
+            self.indices[:, i] = index
+            self.setpoints[:, i] = axes[i][index]
+            period *= size
+
+        self.changed = numpy.ones((self._npoints, naxes), dtype=bool)
+        if self._npoints > 1:
+            self.changed[1:] = self.indices[1:] != self.indices[:-1]
+        self.new_block = self.changed[:, 1:].any(axis=1)
+        if self._npoints > 0:
+            self.new_block[0] = False
+
+        axis_delays = numpy.array([c.get('delay', 0) for c in coords],
+                dtype=float) / 1000.0
+        self.delays = numpy.dot(self.changed, axis_delays)
+
+    def get_npoints(self):
+        return self._npoints
+
+    def get_axis_setpoints(self, axis):
+        '''Return the setpoints of axis, including hysteresis.'''
+        return self._axes[axis]
+
+    def check(self):
+        '''
+        Check the setpoints against the limits of the instrument parameters.
+
+        Input: None
+        Output: list of problems (strings), empty if everything is ok
+        '''
+
+        problems = []
+        for i, coord in enumerate(self._coords):
+            if 'ins' not in coord or len(self._axes[i]) == 0:
+                continue
+            opts = coord['ins'].get_parameter_options(coord['var'])
+            if opts is None:
+                problems.append('%s has no parameter %s' % \
+                        (coord['ins'].get_name(), coord['var']))
+                continue
+            vmin = self._axes[i].min()
+            vmax = self._axes[i].max()
+            if opts.get('minval', None) is not None and vmin < opts['minval']:
+                problems.append('%s.%s: setpoint %s below minimum %s' % \
+                        (coord['ins'].get_name(), coord['var'], vmin, opts['minval']))
+            if opts.get('maxval', None) is not None and vmax > opts['maxval']:
+                problems.append('%s.%s: setpoint %s above maximum %s' % \
+                        (coord['ins'].get_name(), coord['var'], vmax, opts['maxval']))
+        return problems
+
+    def estimate_time(self, delay):
+        '''
+        Estimate the duration of the loop in seconds, using the loop delay
+        (in ms), the extra delays of the axes and the time instruments need
+        to step to new values (the maxstep and stepdelay options).
+        '''
+
+        total = self._npoints * delay / 1000.0 + self.delays.sum()
+        for i, coord in enumerate(self._coords):
+            if 'ins' not in coord or self._npoints < 2:
+                continue
+            opts = coord['ins'].get_parameter_options(coord['var'])
+            if not opts or not opts.get('maxstep', None):
+                continue
+            jumps = numpy.abs(numpy.diff(self.setpoints[:, i]))
+            nsteps = numpy.ceil(jumps / opts['maxstep']).sum()
+            total += nsteps * opts.get('stepdelay', 0) / 1000.0
+        return total
+
+    def dump(self, fn=None):
+        '''
+        Return the plan as text, one line per point with the setpoints
+        and a column per axis telling whether it is set. If fn is given,
+        write it to that file as well.
+        '''
+
+        lines = []
+        for row, changed in zip(self.setpoints, self.changed):
+            lines.append('\t'.join(['%r' % v for v in row] +
+                    ['%d' % c for c in changed]))
+        text = '\n'.join(lines) + '\n'
+        if fn is not None:
+            f = open(fn, 'w')
+            f.write(text)
+            f.close()
+        return text
 
 class Measurement(gobject.GObject):
 
@@ -43,9 +182,14 @@ class Measurement(gobject.GObject):
 
         self._coords = []
         self._measurements = []
+        self._plan = None
+        self._stop_msg = None
+        self._reader = None
+        self._pacer = None
+        self._armed = []
 
         if name in qt.data:
-            self._data = qt.data['name']
+            self._data = qt.data[name]
         else:
             self._data = Data()
 
@@ -53,36 +197,69 @@ class Measurement(gobject.GObject):
         return self._data
 
     def _add_coordinate_options(self, coord, **kwargs):
-        if 'steps' in kwargs:
+        if 'values' in kwargs:
+            values = [float(v) for v in kwargs['values']]
+            if len(values) == 0:
+                logging.warning('Unable to add coordinate without values')
+                return False
+            coord['start'] = values[0]
+            coord['end'] = values[-1]
+            coord['steps'] = len(values)
+            coord['setpoints'] = numpy.array(values)
+        elif 'start' not in coord or 'end' not in coord:
+            logging.warning('Unable to add coordinate without start and end or values')
+            return False
+        elif 'steps' in kwargs:
             if kwargs['steps'] == 0:
                 logging.warning('Unable to add coordinate with 0 steps')
                 return False
 
-            coord['steps'] = kwargs['steps']
-            coord['stepsize'] = float(coord['end'] - coord['start']) / (kwargs['steps'] - 1.0)
+            coord['steps'] = int(kwargs['steps'])
+            coord['setpoints'] = numpy.linspace(coord['start'], coord['end'],
+                    coord['steps'])
         elif 'stepsize' in kwargs:
             if kwargs['stepsize'] == 0:
                 logging.warning('Unable to add coordinate with 0 stepsize')
                 return False
 
-            if start < end:
-                coord['stepsize'] = kwargs['stepsize']
-            else:
-                coord['stepsize'] = -kwargs['stepsize']
-            coord['steps'] = math.ceil((coord['end'] - coord['start']) / kwargs['stepsize'])
+            stepsize = abs(kwargs['stepsize'])
+            if coord['end'] < coord['start']:
+                stepsize = -stepsize
+            coord['steps'] = int(numpy.floor((coord['end'] - coord['start']) / \
+                    stepsize + 1e-9)) + 1
+            coord['setpoints'] = coord['start'] + \
+                    numpy.arange(coord['steps']) * stepsize
         else:
-            logging.warning('_add_coordinate_options requires steps or stepsize argument')
+            logging.warning('_add_coordinate_options requires steps, stepsize or values argument')
+            return False
 
-        if 'delay' in kwargs:
-            coord['delay'] = kwargs['delay']
+        if len(coord['setpoints']) > 1:
+            coord['stepsize'] = coord['setpoints'][1] - coord['setpoints'][0]
+        else:
+            coord['stepsize'] = 0
 
-        self._coords.append(coord)
+        for key in ('delay', 'mode', 'hysteresis'):
+            if key in kwargs:
+                coord[key] = kwargs[key]
 
-    def add_coordinate(self, ins, var, start, end, **kwargs):
+        self._coords.append(coord)
+        self._plan = None
+
+        # Size of the axis in the data, values are not stored there
+        size = coord['steps']
+        if coord.get('hysteresis', False):
+            size = 2 * size - 1
+        kwargs['size'] = size
+        for key in ('values', 'mode', 'hysteresis'):
+            kwargs.pop(key, None)
+        return kwargs
+
+    def add_coordinate(self, ins, var, start=None, end=None, **kwargs):
         '''
-        Add a loop coordinate to the internal list. The first coordinate is
-        the outer part of the loop, the last coordinate the inner part. The
-        measurement loop will set the value of instrument ins, variable var.
+        Add a loop coordinate to the internal list. The first coordinate
+        changes fastest, the last coordinate is the outer part of the loop.
+        The measurement loop will set the value of instrument ins,
+        variable var.
 
         Input:
             ins (Instrument): the instrument
@@ -90,45 +267,58 @@ class Measurement(gobject.GObject):
             start (float): start value
             end (float): end value
             **kwargs: options:
-                steps (int) or stepsize (float). One of these is required.
+                steps (int), stepsize (float) or values (list of floats,
+                    instead of start and end). One of these is required.
                 delay (float): delay after setting value, in ms
+                mode (string): 'linear' (default) or 'serpentine' to
+                    reverse the sweep direction on every pass
+                hysteresis (bool): sweep to the end and back again
 
         Output:
             None
         '''
 
-        coord = {'start': float(start), 'end': float(end),
-                'ins': ins, 'var': var}
+        coord = {'ins': ins, 'var': var}
+        if start is not None:
+            coord['start'] = float(start)
+        if end is not None:
+            coord['end'] = float(end)
 
-        self._add_coordinate_options(coord, **kwargs)
+        kwargs = self._add_coordinate_options(coord, **kwargs)
+        if kwargs is False:
+            return
 
         kwargs['instrument'] = ins.get_name()
         kwargs['parameter'] = var
-        kwargs['size'] = kwargs['steps']
         self._data.add_coordinate(var, **kwargs)
 
-    def add_coordinate_func(self, func, start, end, **kwargs):
+    def add_coordinate_func(self, func, start=None, end=None, **kwargs):
         '''
-        Add a loop coordinate to the internal list. The first coordinate is
-        the outer part of the loop, the last coordinate the inner part. The
-        measurement loop will call function func with the variable value.
+        Add a loop coordinate to the internal list, like add_coordinate().
+        The measurement loop will call function func with the variable
+        value.
 
         Input:
             func (function): the function to call
             start (float): start value
             end (float): end value
-            **kwargs: options:
-                steps (int) or stepsize (float). One of these is required.
-                delay (float): delay after setting value, in ms
+            **kwargs: options, see add_coordinate()
 
         Output:
             None
         '''
 
-        coord = {'start': float(start), 'end': float(end), 'func': func}
-        self._add_coordinate_options(coord, **kwargs)
-        kwargs['size'] = kwargs['steps']
-        self._data.add_coordinate(func, **kwargs)
+        coord = {'func': func}
+        if start is not None:
+            coord['start'] = float(start)
+        if end is not None:
+            coord['end'] = float(end)
+
+        kwargs = self._add_coordinate_options(coord, **kwargs)
+        if kwargs is False:
+            return
+
+        self._data.add_coordinate(func.__name__, **kwargs)
 
     def get_ncoordinates(self):
         return len(self._coords)
@@ -156,7 +346,7 @@ class Measurement(gobject.GObject):
 
     def add_measurement_func(self, func, **kwargs):
         meas = {'func': func}
-        for key, val in kwargs.iter_items():
+        for key, val in kwargs.iteritems():
             meas[key] = val
         self._measurements.append(meas)
 
@@ -169,57 +359,97 @@ class Measurement(gobject.GObject):
     def emit(self, *args):
         gobject.idle_add(gobject.GObject.emit, self, *args)
 
-    def _do_set_values(self, iter):
+    def get_plan(self):
         '''
-        Input:
-            iter (int): iteration number, -1 to set starting values
+        Return the SweepPlan of the loop, which can be used to check or
+        time the measurement before starting it.
+        '''
+        if self._plan is None:
+            self._plan = SweepPlan(self._coords)
+        return self._plan
 
-        Output:
-            float: extra delay required
+    def estimate_time(self):
+        '''Return the estimated duration of the measurement in seconds.'''
+        return self.get_plan().estimate_time(self._get_delay() or 0)
+
+    def get_readout_stats(self):
+        '''
+        Return the timing statistics of the readout of the last
+        measurement with the 'parallel_readout' option, see
+        ParallelReader.get_stats(), or None.
+        '''
+        if self._reader is None:
+            return None
+        return self._reader.get_stats()
+
+    def get_pacing_stats(self):
+        '''
+        Return the timing of the waits between points of the last
+        measurement, see Pacer.get_stats(), or None.
         '''
+        if self._pacer is None:
+            return None
+        return self._pacer.get_stats()
 
-        extra_delay = 0
-        index = self.iter_to_index(iter + 1)
-        coords = self.index_to_coords(index)
-        self._current_coords = coords
-        delta = []
+    def stop(self, msg='Stopped'):
+        '''
+        Stop the measurement loop after the current point. A running
+        buffered sweep is aborted.
+        '''
+        self._stop_msg = msg
+        # Sweeps paced in software (e.g. IVVI) end at the next step
+        for ins in self._armed:
+            ins.abort_buffered()
 
-        for i in xrange(len(coords)):
-            delta.append(index[i] - self._last_index[i])
+    def _set_coords(self, row, changed):
+        '''
+        Set the coordinates for which changed is True to their values in
+        row 'row' of the plan.
 
-        if iter != -1:
-            set_all = False
-        else:
-            set_all = True
+        Output:
+            bool: False if setting failed, the measurement is then stopped
+        '''
 
-        self._last_index = index
-        self._new_data_block = False
+        values = self._plan.setpoints[row].tolist()
+        for i, coord in enumerate(self._coords):
+            if not changed[i]:
+                continue
 
-        # Set loop variables
-        for i in xrange(len(coords)):
-            if delta[i] != 0:
+            try:
+                if 'ins' in coord:
+                    coord['ins'].set(coord['var'], values[i])
+                elif 'func' in coord:
+                    coord['func'](values[i])
+            except Exception, e:
+                self.stop(str(e))
+                return False
 
-                if i != 0:
-                    self._new_data_block = True
+        return True
 
-                try:
-                    val = coords[i]
-                    if 'ins' in self._coords[i]:
-                        ins = self._coords[i]['ins']
-                        ins.set(self._coords[i]['var'], val)
-                    elif 'func' in self._coords[i]:
-                        func = self._coords[i]['func']
-                        func(val)
-                except Exception, e:
-                    self.stop(str(e))
-                    return False
+    def _do_set_values(self, iter):
+        '''
+        Input:
+            iter (int): iteration number, -1 to set starting values
 
-                if 'delay' in self._coords[i]:
-                    extra_delay += self._coords[i]['delay'] / 1000.0
+        Output:
+            float: extra delay required, in seconds
+        '''
 
-        return extra_delay
+        row = iter + 1
+        plan = self._plan
+        self._current_coords = plan.setpoints[row].tolist()
+        self._new_data_block = bool(plan.new_block[row])
+
+        # Set loop variables that changed
+        if not self._set_coords(row, plan.changed[row].tolist()):
+            return 0
+
+        return plan.delays[row]
 
     def _do_measurements(self):
+        if self._reader is not None:
+            return self._reader.read()
+
         data = []
         for m in self._measurements:
             if 'ins' in m:
@@ -242,7 +472,7 @@ class Measurement(gobject.GObject):
             iter (int): the iteration number
 
         Output:
-            float: extra requested timeout in ms
+            float: extra requested delay in seconds
         '''
 
         coords = self._current_coords
@@ -265,6 +495,48 @@ class Measurement(gobject.GObject):
 
         return extra_delay
 
+    def _create_reader(self):
+        '''Read independent instruments concurrently if requested.'''
+        if self._options.get('parallel_readout', False):
+            items = []
+            for m in self._measurements:
+                if 'ins' in m:
+                    items.append((m['ins'], m['var']))
+                else:
+                    items.append(m['func'])
+            self._reader = ParallelReader(items)
+        else:
+            self._reader = None
+
+    def _create_pacer(self):
+        jitter = self._options.get('jitter', None)
+        if jitter is not None:
+            jitter /= 1000.0
+        self._pacer = Pacer(idle=qt.flow.service_events, jitter=jitter)
+
+    def _wait(self, delay):
+        '''
+        Wait delay seconds between points, handling events in the slack
+        time, see lib.pacing.
+
+        With option 'paced' = True the delay is the time between the
+        starts of successive points, kept on an absolute timeline, rather
+        than a settling time after setting the coordinates. Option
+        'jitter' (ms) is the timing error to report violations of.
+        '''
+        if self._options.get('paced', False):
+            self._pacer.next(delay)
+        else:
+            self._pacer.sleep(delay)
+
+    def _get_delay(self):
+        last_coord = self._coords[len(self._coords) - 1]
+        if 'delay' in self._options:
+            return self._options['delay']
+        elif 'delay' in last_coord:
+            return last_coord['delay']
+        return None
+
     def start(self):
         '''
         Start measurement loop.
@@ -276,36 +548,210 @@ class Measurement(gobject.GObject):
             return False
 
         # determine loop delay
-        last_coord = self._coords[len(self._coords) - 1]
-        if 'delay' in self._options:
-            self._delay = self._options['delay']
-        elif 'delay' in last_coord:
-            self._delay = last_coord['delay']
-        else:
+        self._delay = self._get_delay()
+        if self._delay is None:
             logging.warning('measurement delay undefined')
             return False
 
-        # determine loop steps
-        self._ntotal = 1
-        for coord in self._coords:
-            self._ntotal *= coord['steps']
+        # All setpoints are computed in advance
+        plan = self.get_plan()
+        problems = plan.check()
+        if len(problems) > 0:
+            for msg in problems:
+                logging.warning('Measurement plan: %s', msg)
+            self.emit('finished', 'Invalid setpoints')
+            return False
+        self._ntotal = plan.get_npoints()
+
+        # Create file, optionally writing data from a separate thread
+        self._data.create_file(self._name,
+                async_write=self._options.get('async_write', None))
+
+        self._create_reader()
+        self._create_pacer()
+
+        self._stop_msg = None
+        msg = None
+        try:
+            if self._use_buffered():
+                msg = self._run_buffered()
+            if msg is None:
+                msg = self._run_points()
+        finally:
+            self._close_run()
+        self.emit('finished', msg)
 
-        # Create file
-        self._data.create_file(self._name)
+    def _close_run(self):
+        '''Stop the reader threads and close the file, also after an error.'''
+        if self._reader is not None:
+            self._reader.close()
+        self._pacer.log_stats(self._name)
+        self._data.close_file()
+
+    def _run_points(self):
+        '''
+        Run the loop point by point.
+
+        Output:
+            string: the finish message
+        '''
 
         # Set starting values and sleep
-        self._last_index = [-1 for i in xrange(len(self._coords))]
-        self._do_set_values(-1)
-        time.sleep(self._delay / 1000.0)
+        extra_delay = self._do_set_values(-1)
+        time.sleep(self._delay / 1000.0 + extra_delay)
+        self._pacer.start()
+
+        msg = 'Ok'
+        for i in xrange(self._ntotal):
+            if self._stop_msg is not None:
+                msg = self._stop_msg
+                break
+            extra_delay = self._measure(i)
+            try:
+                self._wait(self._delay / 1000.0 + extra_delay)
+            except:
+                msg = 'Interrupted'
+                break
+
+        return msg
+
+    def _use_buffered(self):
+        '''
+        Whether the loop can run as buffered sweeps, see
+        Instrument.arm_buffered(): the first coordinate and all
+        measurements should support it, and option 'buffered' should be
+        True (default False).
+
+        Readers sample half an interval after each setpoint, so the
+        settling time in a buffered sweep is only half of the delay of
+        the point by point loop.
+        '''
+
+        if not self._options.get('buffered', False):
+            return False
+        coord = self._coords[0]
+        if 'ins' not in coord or len(self._measurements) == 0 or \
+                len(self._plan.get_axis_setpoints(0)) < 2 or \
+                self._get_interval() <= 0:
+            return False
+        if not coord['ins'].supports_buffered(coord['var'],
+                Instrument.FLAG_SET):
+            return False
+        for m in self._measurements:
+            if 'ins' not in m or \
+                    not m['ins'].supports_buffered(m['var'], Instrument.FLAG_GET):
+                return False
+        return True
 
-        for i in range(self._ntotal):
-            self._measure()
+    def _get_interval(self):
+        '''Time per point of the first coordinate, in seconds.'''
+        return (self._delay + self._coords[0].get('delay', 0)) / 1000.0
+
+    def _run_buffered(self):
+        '''
+        Run the loop as one buffered sweep of the first coordinate per
+        block; the other coordinates are set at the start of every block.
+
+        Output:
+            string: the finish message, None to continue point by point
+                if the first sweep could not be armed
+        '''
+
+        plan = self._plan
+        interval = self._get_interval()
+        source = self._coords[0]['ins']
+        source_var = self._coords[0]['var']
+
+        # Parameters to read per instrument, the source last
+        names = []
+        gets = {}
+        instruments = {}
+        for m in self._measurements:
+            name = m['ins'].get_name()
+            if name not in gets:
+                names.append(name)
+                gets[name] = []
+                instruments[name] = m['ins']
+            gets[name].append(m['var'])
+        source_name = source.get_name()
+        if source_name in names:
+            names.remove(source_name)
+        names.append(source_name)
+        instruments[source_name] = source
+
+        bounds = [0] + numpy.flatnonzero(plan.new_block).tolist() + \
+                [self._ntotal]
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            if self._stop_msg is not None:
+                return self._stop_msg
+
+            # Set the other coordinates and move to the first point
+            changed = plan.changed[a].tolist()
+            changed[0] = True
+            if not self._set_coords(a, changed):
+                return self._stop_msg
             try:
-                qt.msleep(self._delay / 1000.0)
+                self._pacer.sleep(self._delay / 1000.0 + plan.delays[a])
             except:
-                self.emit('finished', 'Interrupted')
+                return 'Interrupted'
+
+            npoints = b - a
+            setpoints = plan.setpoints[a:b, 0]
+            armed = []
+            self._armed = armed
+            try:
+                for name in names:
+                    if name == source_name:
+                        sets = {source_var: setpoints}
+                    else:
+                        sets = {}
+                    if not instruments[name].arm_buffered(npoints, interval,
+                            sets=sets, gets=gets.get(name, [])):
+                        raise ValueError('Unable to arm %s' % name)
+                    armed.append(instruments[name])
+            except Exception, e:
+                for ins in armed:
+                    ins.abort_buffered()
+                if a == 0:
+                    logging.info('Not using buffered sweep: %s', str(e))
+                    return None
+                return 'Buffered sweep failed: %s' % str(e)
+
+            values = {}
+            try:
+                start = time.time()
+                for name in names:
+                    instruments[name].trigger_buffered()
+                # Wait in short steps so that stop() ends the wait as well
+                remaining = start + npoints * interval - time.time()
+                while remaining > 0 and self._stop_msg is None:
+                    self._pacer.sleep(min(remaining, 0.1))
+                    remaining = start + npoints * interval - time.time()
+                if self._stop_msg is not None:
+                    for ins in armed:
+                        ins.abort_buffered()
+                    return self._stop_msg
+
+                while len(armed) > 0:
+                    ins = armed.pop(0)
+                    for var, vals in ins.fetch_buffered().iteritems():
+                        values[(ins.get_name(), var)] = vals
+            except Exception, e:
+                for ins in armed:
+                    ins.abort_buffered()
+                return 'Buffered sweep failed: %s' % str(e)
+
+            cols = [plan.setpoints[a:b, i] for i in range(len(self._coords))]
+            for m in self._measurements:
+                cols.append(values[(m['ins'].get_name(), m['var'])])
+            self._data.add_data_point(*cols, **{'newblock': b < self._ntotal})
+
+            self.emit('progress', {
+                'current': b - 1,
+                'total': self._ntotal,
+                })
 
-        self.emit('finished', 'Ok')
+        return 'Ok'
 
     def _finished_cb(self, sender, msg):
         logging.debug('Measurement finished: %s', msg)
@@ -316,23 +762,149 @@ class Measurement(gobject.GObject):
         self.emit('new-data', data)
 
     def iter_to_index(self, iter):
-        ret = []
-        for opts in self._coords:
-            v = iter % opts['steps']
-            ret.append(v)
-            iter = (iter - v) / opts['steps']
+        return self.get_plan().indices[iter].tolist()
 
-        return ret
+    def index_to_coords(self, index):
+        plan = self.get_plan()
+        return [plan.get_axis_setpoints(i)[j] for i, j in enumerate(index)]
+
+class AdaptiveMeasurement(Measurement):
+    '''
+    Measurement loop over one or two coordinates that chooses the next
+    point from the data measured so far, see lib.adaptive. The points are
+    stored with their coordinates, not on a grid. Coordinates are added
+    with start, end and optionally delay.
+
+    Options, besides those of Measurement:
+        loss (string or function): 'curvature' (default), 'gradient',
+            'variance', 'uniform' or a loss function, see lib.adaptive
+        npoints (int): maximum number of points, also sent as 'total'
+            with the 'progress' signal; without it 'total' is left out
+        loss_goal (float): stop when the largest loss is below this value
+        min_size (float): smallest cell, relative to the sweep range
+        initial (int): start with a uniform grid of 2**initial cells
+            along each axis, default 3
+        loss_value (int): index of the measurement that drives the
+            refinement, default 0
+    '''
+
+    def __init__(self, name, **kwargs):
+        Measurement.__init__(self, name, **kwargs)
+        self._sampler = None
+
+    def _add_coordinate_options(self, coord, **kwargs):
+        if 'start' not in coord or 'end' not in coord:
+            logging.warning('Adaptive coordinate requires start and end')
+            return False
+        for key in ('values', 'steps', 'stepsize', 'mode', 'hysteresis'):
+            if key in kwargs:
+                logging.warning('Option %s not supported for adaptive coordinates', key)
+                return False
+        if 'delay' in kwargs:
+            coord['delay'] = kwargs['delay']
+        self._coords.append(coord)
+        self._sampler = None
+        return kwargs
+
+    def get_plan(self):
+        logging.warning('Adaptive measurement has no plan')
+        return None
+
+    def iter_to_index(self, iter):
+        raise ValueError('Adaptive measurement points are not on a grid')
 
     def index_to_coords(self, index):
-        ret = []
-        i = 0
-        for opts in self._coords:
-            v = opts['start'] + index[i] * opts['stepsize']
-            ret.append(v)
-            i += 1
-
-        return ret
+        raise ValueError('Adaptive measurement points are not on a grid')
+
+    def estimate_time(self):
+        return None
+
+    def get_sampler(self):
+        '''Return the AdaptiveSampler of the last run.'''
+        return self._sampler
+
+    def start(self):
+        '''
+        Start measurement loop.
+        '''
+
+        if len(self._coords) not in (1, 2):
+            logging.warning('Adaptive measurement needs 1 or 2 coordinates')
+            self.emit('finished', 'Invalid coordinates')
+            return False
+
+        self._delay = self._get_delay()
+        if self._delay is None:
+            logging.warning('measurement delay undefined')
+            return False
+
+        opts = self._options
+        self._sampler = AdaptiveSampler(
+                [(c['start'], c['end']) for c in self._coords],
+                loss=opts.get('loss', 'curvature'),
+                min_size=opts.get('min_size', 1e-3),
+                initial=opts.get('initial', 3))
+        npoints = opts.get('npoints', None)
+        loss_goal = opts.get('loss_goal', None)
+        loss_value = opts.get('loss_value', 0)
+
+        self._data.create_file(self._name,
+                async_write=opts.get('async_write', None))
+        self._create_reader()
+        self._create_pacer()
+        self._stop_msg = None
+
+        msg = 'Ok'
+        last = [None] * len(self._coords)
+        n = 0
+        try:
+            while npoints is None or n < npoints:
+                if self._stop_msg is not None:
+                    msg = self._stop_msg
+                    break
+                if loss_goal is not None and n > 0 and \
+                        self._sampler.get_loss() < loss_goal:
+                    break
+                point = self._sampler.ask()
+                if point is None:
+                    break
+
+                # Set the coordinates that changed
+                delay = self._delay / 1000.0
+                try:
+                    for i, coord in enumerate(self._coords):
+                        if point[i] == last[i]:
+                            continue
+                        if 'ins' in coord:
+                            coord['ins'].set(coord['var'], point[i])
+                        elif 'func' in coord:
+                            coord['func'](point[i])
+                        delay += coord.get('delay', 0) / 1000.0
+                except Exception, e:
+                    msg = str(e)
+                    break
+                last = list(point)
+
+                try:
+                    self._wait(delay)
+                except:
+                    msg = 'Interrupted'
+                    break
+
+                data = self._do_measurements()
+                self._sampler.tell(point, data[loss_value])
+                self._data.add_data_point(*(last + data))
+                n += 1
+
+                # Without npoints the total number of points is not known
+                if (n % self._PROGRESS_STEPS) == 0:
+                    progress = {'current': n}
+                    if npoints is not None:
+                        progress['total'] = npoints
+                    self.emit('progress', progress)
+        finally:
+            self._close_run()
+        self.emit('finished', msg)
 
 #FIXME: Change to NamedList
 class Measurements(gobject.GObject):
@@ -27,9 +27,96 @@ import inspect
 import time
 import gobject
 import types
+import struct
+import select
+import threading
+import itertools
+import errno
+import Queue
+import zlib
+import os
+import tempfile
+import weakref
+import atexit
+try:
+    from cStringIO import StringIO
+except:
+    from StringIO import StringIO
+try:
+    import numpy
+except:
+    numpy = None
+try:
+    import lz4.block as lz4
+except:
+    try:
+        import lz4
+    except:
+        lz4 = None
 
 PORT = 12002
-BUFSIZE = 8192
+BUFSIZE = 65536             # Minimum size to receive at once
+MAX_BUFSIZE = 16 * 1024**2  # Maximum size to receive at once
+
+# Features of this side of a connection, announced to the peer in the info
+# of the root object. Older peers do not announce anything.
+CAPABILITIES = ['zlib', 'signal_count']
+if numpy is not None:
+    CAPABILITIES.extend(['ndarray', 'shm'])
+if lz4 is not None:
+    CAPABILITIES.append('lz4')
+
+# Compression of packets, if the peer supports it. Codecs in order of
+# preference, with their id in the packet header. Packets smaller than
+# COMPRESS_MIN_SIZE are never compressed, and a packet is sent uncompressed
+# if compression does not make it smaller than COMPRESS_MAX_RATIO times
+# the original size. Connections to the local host are not compressed,
+# unless COMPRESS_LOCAL is True.
+COMPRESS_CODECS = ('lz4', 'zlib')
+COMPRESS_IDS = {'zlib': 1, 'lz4': 2}
+COMPRESS_MIN_SIZE = 16384
+COMPRESS_MAX_RATIO = 0.9
+COMPRESS_LOCAL = False
+ZLIB_LEVEL = 1
+
+# Arrays of at least this many bytes are sent as separate binary segments
+# to peers that support it, instead of inside the pickle.
+OOB_MIN_SIZE = 4096
+
+# Arrays of at least SHM_MIN_SIZE bytes are passed through memory mapped
+# files in SHM_DIR to peers on the same host, only the file name is sent.
+# Arrays allocated with shm_empty() are always passed this way, without
+# copying. The sender keeps the memory until the peer has mapped it.
+SHM_ENABLED = True
+SHM_MIN_SIZE = 1024**2
+if os.path.isdir('/dev/shm'):
+    SHM_DIR = '/dev/shm'
+else:
+    SHM_DIR = tempfile.gettempdir()
+
+# Number of threads and queue size to handle calls to thread-safe objects
+WORKER_THREADS = 4
+WORKER_QUEUE_SIZE = 100
+
+# Maximum number of signal packets per second sent to each client, None
+# to send every signal immediately.
+SIGNAL_RATE = 20.0
+
+# How signals are combined if they are emitted more than once before they
+# are sent to a client:
+#   'latest': only the last emission is sent; if the last argument is a
+#             dictionary, the dictionaries are merged, latest values win.
+#   'count': only the last emission is sent, with its arguments unchanged.
+#   'queue': every emission is sent, in order (default for other signals)
+# For combined signals the number of emissions is sent along; callbacks
+# can get it with ObjectSharer.get_signal_count().
+# A combined signal keeps the position of its first emission, so order is
+# only kept relative to 'queue' signals: a 'latest' or 'count' signal can
+# arrive before another combined signal that was emitted earlier.
+SIGNAL_POLICIES = {
+    'changed': 'latest',
+    'new-data-point': 'count',
+}
 
 class RemoteException(Exception):
     pass
@@ -51,20 +138,56 @@ class ObjectSharer():
         self.server = None
 
         self._last_hid = 0
-        self._last_call_id = 0
+        self._call_ids = itertools.count(1)
         self._return_cbs = {}
-        self._return_vals = {}
 
         self._client_timeout = 60
 
-        # Store callback info indexed on hid and on signam__objname
+        # Store callback info indexed on hid and on signame__objname (a dict
+        # of hid -> info). The (function, args, kwargs) tuples to call for a
+        # name, in order of connection, are cached in _callbacks_bound.
         self._callbacks_hid = {}
         self._callbacks_name = {}
+        self._callbacks_bound = {}
         self._event_callbacks = {}
 
-        # Buffers to store partly received packets
-        self._buffers = {}
+        # Readers to decode (partly) received packets, per connection
+        self._readers = {}
         self._send_queue = {}
+        self._send_lock = threading.RLock()
+
+        # Calls to thread-safe objects are handled by these workers
+        self._workers = _WorkerPool(WORKER_THREADS, WORKER_QUEUE_SIZE)
+
+        # Signals waiting to be sent, per client
+        self._signal_queues = {}
+        self._signal_lock = threading.Lock()
+        self._signal_rate = SIGNAL_RATE
+        self._signal_policies = dict(SIGNAL_POLICIES)
+        self._signal_count = 1
+
+        # Capabilities announced by the peer, per connection
+        self._capabilities = {}
+
+        # Whether to pass arrays through shared memory, per connection
+        self._shm_enabled = SHM_ENABLED
+        self._shm = {}
+
+        # Shared memory sent to each peer that it has not mapped yet:
+        # conn -> file name -> list of the arrays referred to, pinned so
+        # that their file is not removed, or None for a copy made for the
+        # peer. The peer acknowledges with a 'shm_mapped' packet.
+        self._shm_pending = {}
+        self._shm_lock = threading.Lock()
+
+        # Codec to compress packets with and statistics, per connection
+        self._compression = 'auto'
+        self._codecs = {}
+        self._compress_stats = {}
+
+        # Cached proxies are outdated when the remote object is replaced
+        self.connect('root', 'object-added', self._remote_object_changed_cb)
+        self.connect('root', 'object-removed', self._remote_object_changed_cb)
 
     def set_client_timeout(self, timeout):
         '''
@@ -76,11 +199,15 @@ class ObjectSharer():
         '''
         Add a client through connection 'conn'.
         '''
+        set_nodelay(conn)
         info = self.call(conn, 'root', 'get_object_info', 'root',
             timeout=self._client_timeout)
         if info is None:
             logging.warning('Unable to get client root object')
             return None
+        self._capabilities[conn] = set(info.get('capabilities', []))
+        self._codecs[conn] = self._choose_codec(conn, self._compression)
+        self._shm[conn] = self._choose_shm(conn, self._shm_enabled)
         client = ObjectProxy(conn, info)
         self._clients.append(client)
         name = client.get_instance_name()
@@ -98,6 +225,14 @@ class ObjectSharer():
         if client in self._clients:
             del self._clients[self._clients.index(client)]
 
+        self._signal_lock.acquire()
+        try:
+            queue = self._signal_queues.pop(client, None)
+        finally:
+            self._signal_lock.release()
+        if queue is not None and queue.hid is not None:
+            gobject.source_remove(queue.hid)
+
         self._do_event_callbacks('disconnected', client)
 
     def register_event_callback(self, event, cb):
@@ -127,6 +262,14 @@ class ObjectSharer():
 
         if conn in self._send_queue:
             del self._send_queue[conn]
+        if conn in self._capabilities:
+            del self._capabilities[conn]
+        if conn in self._readers:
+            del self._readers[conn]
+        self._codecs.pop(conn, None)
+        self._compress_stats.pop(conn, None)
+        self._shm.pop(conn, None)
+        self._shm_release(conn)
 
     def get_clients(self):
         return self._clients
@@ -174,10 +317,21 @@ class ObjectSharer():
 
         fullname = self._get_full_object_name(client, objname)
         if objname != fullname:
-            self._object_cache[objname] = proxy
+            self._object_cache[fullname] = proxy
 
         return proxy
 
+    def _remote_object_changed_cb(self, objname):
+        '''
+        Drop cached proxies for an object that was added (possibly
+        replacing another one) or removed on a remote side.
+        '''
+
+        suffix = ':' + objname
+        for key in self._object_cache.keys():
+            if key == objname or key.endswith(suffix):
+                self._object_cache.pop(key)._release()
+
     def find_remote_object(self, objname):
         '''
         Locate a shared object. Search with connected clients.
@@ -254,26 +408,324 @@ class ObjectSharer():
 
         return self.find_remote_object(objname)
 
-    def _pickle_packet(self, info, data):
+    def _new_segments(self, conn):
+        '''
+        Return a list to collect out-of-band array segments for a packet
+        to conn, or None if the peer does not support them.
+        '''
+        if 'ndarray' in self._capabilities.get(conn, ()):
+            return []
+        return None
+
+    def _is_local(self, conn):
+        '''Return whether the peer of conn is on the local host.'''
         try:
-            retdata = pickle.dumps((info, data))
+            host = conn.getpeername()
         except Exception, e:
-            msg = 'Unable to encode object: %s' % str(e)
-            retdata = pickle.dumps((info, msg))
-        return retdata
+            host = None
+        # Unix sockets have no address
+        return type(host) is not types.TupleType or \
+                host[0] in ('127.0.0.1', '::1', 'localhost')
+
+    def _choose_shm(self, conn, enable):
+        caps = self._capabilities.get(conn, ())
+        return bool(enable and 'shm' in CAPABILITIES and 'shm' in caps and
+                self._is_local(conn))
+
+    def set_shared_memory(self, enable, conn=None):
+        '''
+        Set whether large arrays are passed through shared memory to peers
+        on the same host. If conn is None, this applies to all connections.
+        '''
+
+        if conn is None:
+            self._shm_enabled = enable
+            conns = self._shm.keys()
+        else:
+            conns = [conn]
+        for c in conns:
+            self._shm[c] = self._choose_shm(c, enable)
+
+    def _choose_codec(self, conn, codec):
+        '''
+        Return the codec to compress packets to conn with: codec itself if
+        the peer supports it, or the preferred codec supported by both
+        sides if codec is 'auto'.
+        '''
+
+        caps = self._capabilities.get(conn, ())
+        if codec is None:
+            return None
+        elif codec != 'auto':
+            if codec not in CAPABILITIES or codec not in caps:
+                logging.warning('Compression %s not supported by both sides', codec)
+                return None
+            return codec
+
+        if not COMPRESS_LOCAL and self._is_local(conn):
+            return None
 
-    def _unpickle_packet(self, data):
+        for name in COMPRESS_CODECS:
+            if name in CAPABILITIES and name in caps:
+                return name
+        return None
+
+    def set_compression(self, codec='auto', conn=None):
+        '''
+        Set the codec to compress packets with: 'auto' to use the best one
+        supported by both sides for remote hosts, None to disable, or a
+        codec name (e.g. 'zlib') to use if the peer supports it.
+        If conn is None, this applies to all connections.
+        '''
+
+        if conn is None:
+            self._compression = codec
+            conns = self._codecs.keys()
+        else:
+            conns = [conn]
+        for c in conns:
+            self._codecs[c] = self._choose_codec(c, codec)
+
+    def get_codec(self, conn):
+        '''Return the codec used for packets sent to conn, or None.'''
+        return self._codecs.get(conn, None)
+
+    def get_compression_stats(self, conn):
+        '''
+        Return a dictionary with compression statistics for conn:
+            sent_packets, sent_bytes, sent_compressed, compress_time,
+            recv_packets, recv_bytes, recv_compressed, decompress_time,
+            sent_ratio, recv_ratio
+        The byte counts and times only include compressed packets; bytes
+        is the original size, compressed the size sent. Times are in
+        seconds spent (de)compressing.
+        '''
+
+        stats = dict(self._compress_stats.get(conn, {}))
+        for key in ('sent_packets', 'sent_bytes', 'sent_compressed',
+                'compress_time'):
+            stats.setdefault(key, 0)
+
+        reader = self._readers.get(conn, None)
+        if reader is not None:
+            stats.update(reader.compress_stats)
+        for key in ('recv_packets', 'recv_bytes', 'recv_compressed',
+                'decompress_time'):
+            stats.setdefault(key, 0)
+
+        for prefix in ('sent', 'recv'):
+            if stats['%s_bytes' % prefix] > 0:
+                stats['%s_ratio' % prefix] = \
+                        float(stats['%s_compressed' % prefix]) / \
+                        stats['%s_bytes' % prefix]
+            else:
+                stats['%s_ratio' % prefix] = None
+        return stats
+
+    def _compress(self, conn, codec, tosend, size):
+        '''
+        Compress the frame in tosend (a list of strings and buffers, size
+        bytes in total). Return the list to send instead, which is tosend
+        itself if compression does not help.
+        '''
+
+        start = time.time()
+        if codec == 'zlib':
+            z = zlib.compressobj(ZLIB_LEVEL)
+            zdata = ''.join([z.compress(d) for d in tosend] + [z.flush()])
+        else:
+            zdata = lz4.compress(''.join([str(d) for d in tosend]))
+        dt = time.time() - start
+
+        zlen = len(zdata)
+        if zlen >= size * COMPRESS_MAX_RATIO:
+            logging.debug('Not compressing packet, ratio %.2f',
+                    float(zlen) / size)
+            return tosend
+
+        self._send_lock.acquire()
         try:
+            stats = self._compress_stats.setdefault(conn, {})
+            stats['sent_packets'] = stats.get('sent_packets', 0) + 1
+            stats['sent_bytes'] = stats.get('sent_bytes', 0) + size
+            stats['sent_compressed'] = stats.get('sent_compressed', 0) + zlen
+            stats['compress_time'] = stats.get('compress_time', 0) + dt
+        finally:
+            self._send_lock.release()
+
+        header = struct.pack('>2sIB', 'QZ', zlen, COMPRESS_IDS[codec])
+        if zlen < BUFSIZE:
+            return [header + zdata]
+        return [header, zdata]
+
+    def _dumps(self, obj, segments, shm=False, shm_sent=None):
+        '''
+        Pickle obj, return the data and whether it contains references
+        to segments or shared memory. With shm, (file name, array) is
+        appended to shm_sent for every reference to shared memory, with
+        array None for a copy.
+        '''
+
+        if segments is None:
+            return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL), False
+
+        # Put large arrays in segments, the pickle only contains a
+        # reference with the dtype, shape and strides. With shm, arrays
+        # in shared memory are referred to by file name and offset.
+        refs = []
+        def persistent_id(o):
+            if type(o) not in (numpy.ndarray, numpy.memmap) or \
+                    o.nbytes < OOB_MIN_SIZE or o.dtype.hasobject:
+                return None
+            refs.append(True)
+            if shm:
+                ref = _shm_find(o)
+                if ref is not None:
+                    shm_sent.append((ref[0], o))
+                    return ('shm', ref[0], ref[1], o.dtype, o.shape,
+                            o.strides, False)
+                if o.nbytes >= SHM_MIN_SIZE:
+                    path = _shm_copy(o)
+                    if path is not None:
+                        shm_sent.append((path, None))
+                        return ('shm', path, 0, o.dtype, o.shape,
+                                _c_strides(o), True)
+            if type(o) is not numpy.ndarray:
+                o = o.view(numpy.ndarray)
+            if o.flags.c_contiguous:
+                segments.append(o)
+            elif o.flags.f_contiguous:
+                segments.append(o.T)    # Same memory, but C-contiguous
+            else:
+                o = numpy.ascontiguousarray(o)
+                segments.append(o)
+            return ('ndarray', len(segments) - 1, o.dtype, o.shape, o.strides)
+
+        f = StringIO()
+        p = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+        p.persistent_id = persistent_id
+        p.dump(obj)
+        return f.getvalue(), len(refs) > 0
+
+    def _loads(self, data, segments, shm=False, shm_mapped=None):
+        '''
+        Unpickle data. segments is None for a 'QT' packet, which contains
+        no references, or the (possibly empty) list of segments of a 'QA'
+        packet. References to shared memory are only accepted with shm,
+        the file names mapped are appended to shm_mapped.
+        '''
+
+        if segments is None:
             return pickle.loads(data)
+
+        def persistent_load(pid):
+            if pid[0] == 'shm':
+                if not shm:
+                    raise pickle.UnpicklingError('Shared memory not enabled')
+                a = _shm_load(*pid[1:])
+                shm_mapped.append(pid[1])
+                return a
+            elif pid[0] != 'ndarray':
+                raise pickle.UnpicklingError('Unknown reference %r' % (pid, ))
+            index, dtype, shape, strides = pid[1:]
+            a = numpy.frombuffer(segments[index], dtype=dtype)
+            return numpy.lib.stride_tricks.as_strided(a, shape, strides)
+
+        u = pickle.Unpickler(StringIO(data))
+        u.persistent_load = persistent_load
+        return u.load()
+
+    def _pickle_packet(self, conn, info, data):
+        '''
+        Return the pickled packet for conn and the segments to send with
+        it, which is None if the pickle contains no references to segments
+        or shared memory.
+        '''
+
+        segments = self._new_segments(conn)
+        shm_sent = []
+        try:
+            retdata, refs = self._dumps((info, data), segments,
+                    self._shm.get(conn, False), shm_sent)
+        except Exception, e:
+            # Copies made before the error are not referred to
+            for path, a in shm_sent:
+                if a is None:
+                    _shm_discard(path)
+            shm_sent = []
+            msg = 'Unable to encode object: %s' % str(e)
+            retdata = pickle.dumps((info, msg), pickle.HIGHEST_PROTOCOL)
+            refs = False
+        if len(shm_sent) > 0:
+            self._shm_add_pending(conn, shm_sent)
+        if not refs:
+            segments = None
+        return retdata, segments
+
+    def _unpickle_packet(self, conn, data, segments=None):
+        shm_mapped = []
+        try:
+            return self._loads(data, segments, self._shm.get(conn, False),
+                    shm_mapped)
         except Exception, e:
             logging.warning('Unable to decode object: %s [%r]', str(e), data)
             raise e
+        finally:
+            # Also if decoding failed, the peer can release the memory
+            if len(shm_mapped) > 0:
+                self.send_packet(conn, pickle.dumps((('shm_mapped', ),
+                        shm_mapped), pickle.HIGHEST_PROTOCOL))
+
+    def _shm_add_pending(self, conn, shm_sent):
+        '''Keep shared memory sent to conn until the peer has mapped it.'''
+        self._shm_lock.acquire()
+        try:
+            pending = self._shm_pending.setdefault(conn, {})
+            for path, a in shm_sent:
+                pending.setdefault(path, []).append(a)
+        finally:
+            self._shm_lock.release()
+
+    def _shm_mapped(self, conn, paths):
+        '''The peer on conn has mapped the shared memory files paths.'''
+        self._shm_lock.acquire()
+        try:
+            pending = self._shm_pending.get(conn, {})
+            for path in paths:
+                arrays = pending.get(path, None)
+                if arrays is None:
+                    continue
+                a = arrays.pop(0)
+                if a is None:
+                    # The peer removes its copy
+                    _shm_copies.discard(path)
+                if len(arrays) == 0:
+                    del pending[path]
+        finally:
+            self._shm_lock.release()
+
+    def _shm_release(self, conn):
+        '''
+        Release the shared memory sent to conn, which will not be mapped
+        anymore. Copies for it are removed.
+        '''
+        self._shm_lock.acquire()
+        try:
+            pending = self._shm_pending.pop(conn, {})
+        finally:
+            self._shm_lock.release()
+        for path, arrays in pending.iteritems():
+            if None in arrays:
+                _shm_discard(path)
 
     def _send_return(self, conn, callid, retval):
         logging.debug('Returning for call %d: %r', callid, retval)
+        # Signals emitted before the reply, e.g. those that invalidate
+        # cached results, should arrive before it.
+        self._flush_signals_for_conn(conn)
         retinfo = ('return', callid)
-        retdata = self._pickle_packet(retinfo, retval)
-        self.send_packet(conn, retdata)
+        retdata, segments = self._pickle_packet(conn, retinfo, retval)
+        self.send_packet(conn, retdata, segments)
 
     def handle_data(self, conn, data):
         '''
@@ -282,30 +734,59 @@ class ObjectSharer():
         immediately.
         '''
 
-        if conn not in self._buffers:
-            self._buffers[conn] = ''
+        reader = self._get_reader(conn)
+        reader.lock.acquire()
+        try:
+            reader.feed(data)
+            self._process_packets(conn, reader)
+        finally:
+            reader.lock.release()
 
-        self._buffers[conn] = self._buffers[conn] + data
+    def receive(self, conn, blocking=True):
+        '''
+        Receive data from connection 'conn' and handle the complete packets.
+        Data is received directly in the buffers of the packet reader.
 
-        # Decode complete packets
-        while len(self._buffers[conn]) >= 6:
-            b = self._buffers[conn]
+        Only one thread reads from a connection at a time. If blocking is
+        False and another thread is reading, return None immediately;
+        that thread will handle the data.
 
-            if b[0] != 'Q' or b[1] != 'T':
-                self._buffers[conn] = ''
+        Returns the number of bytes received, 0 if the connection was closed.
+        Socket errors are passed on.
+        '''
+
+        reader = self._get_reader(conn)
+        if not reader.lock.acquire(blocking):
+            return None
+        try:
+            n = reader.recv(conn)
+            if n > 0:
+                self._process_packets(conn, reader)
+        finally:
+            reader.lock.release()
+        return n
+
+    def _get_reader(self, conn):
+        reader = self._readers.get(conn, None)
+        if reader is None:
+            reader = self._readers.setdefault(conn, _PacketReader())
+        return reader
+
+    def _process_packets(self, conn, reader):
+        '''Decode and handle complete packets.'''
+        while True:
+            try:
+                packet = reader.next_packet()
+            except ValueError, e:
                 logging.warning('Packet magic missing, dumping data')
                 return None
 
-            datalen = (ord(b[2]) << 24) + (ord(b[3]) << 16) + (ord(b[4]) << 8)  + ord(b[5])
-            if len(b) < datalen + 6:
+            if packet is None:
                 logging.debug('Incomplete packet received')
                 return None
 
-            packet = b[6:6+datalen]
-            self._buffers[conn] = b[6+datalen:]
-
             try:
-                packet = self._unpickle_packet(packet)
+                packet = self._unpickle_packet(conn, *packet)
             except Exception, e:
                 logging.warning('Unable to unpickle packet')
                 return
@@ -323,13 +804,11 @@ class ObjectSharer():
         if info[0] == 'return':
             # (a)synchronous function reply
             callid = info[1]
-            if callid not in self._return_cbs:
-                logging.warning('Return received for unknown call %d', callid)
+            func = self._return_cbs.pop(callid, None)
+            if func is None:
+                logging.warning('Return received for unknown or timed out call %d', callid)
                 return
 
-            func = self._return_cbs[callid]
-            del self._return_cbs[callid]
-
             if type(callinfo) == types.StringType and callinfo.startswith('sharedname:'):
                 sn = callinfo[11:]
                 logging.debug('Received shared object reference, finding %s', sn)
@@ -338,6 +817,10 @@ class ObjectSharer():
             func(callinfo)
             return
 
+        elif info[0] == 'shm_mapped':
+            self._shm_mapped(conn, callinfo)
+            return
+
         elif info[0] not in ('call', 'signal'):
             logging.warning('Invalid request: %r, %r', info, callinfo)
             return False
@@ -352,8 +835,19 @@ class ObjectSharer():
             return None
 
         obj = self._objects[objname]
-        func = getattr(obj, funcname)
+
+        # Thread-safe objects don't have to wait for earlier calls. If all
+        # workers are busy, handle the call here.
+        if info[0] == 'call' and getattr(obj, '_threadsafe', False):
+            if self._workers.submit(self._do_call, conn, info, obj,
+                    funcname, args, kwargs):
+                return
+
+        self._do_call(conn, info, obj, funcname, args, kwargs)
+
+    def _do_call(self, conn, info, obj, funcname, args, kwargs):
         try:
+            func = getattr(obj, funcname)
             ret = func(*args, **kwargs)
         except Exception, e:
             import traceback
@@ -375,7 +869,7 @@ class ObjectSharer():
         try:
             ret = conn.send(data)
         except socket.error, e:
-            if e.errno not in (10035, ):
+            if e.errno not in (10035, errno.EAGAIN, errno.EWOULDBLOCK):
                 logging.warning('Send exception (%s), assuming client disconnected', e)
                 self._client_disconnected(conn)
                 return -1
@@ -388,6 +882,14 @@ class ObjectSharer():
         Process send queue on a per connection basis.
         '''
 
+        self._send_lock.acquire()
+        try:
+            self._do_process_send_queue()
+        finally:
+            self._send_lock.release()
+        return True
+
+    def _do_process_send_queue(self):
         for conn in self._send_queue.keys():
             datalist = self._send_queue[conn]
             while len(datalist) > 0:
@@ -405,100 +907,170 @@ class ObjectSharer():
 
                 # Partially sent
                 else:
-                    datalist[0] = datalist[0][nsent:]
+                    datalist[0] = buffer(datalist[0], nsent)
                     break
 
-        return True
+    def send_packet(self, conn, data, segments=None):
+        '''
+        Send pickled data and optionally the array segments referred to
+        from it. The segments are sent from the array memory directly.
+        If segments is not None the packet is sent as 'QA', also with no
+        segments, to mark that the pickle contains references.
+        '''
 
-    def send_packet(self, conn, data):
         dlen = len(data)
         if dlen > 0xffffffffL:
             logging.error('Trying to send too long packet: %d', dlen)
             return -1
 
-        tosend = 'QT%c%c%c%c' % ((dlen&0xff000000)>>24, \
-            (dlen&0x00ff0000)>>16, (dlen&0x0000ff00)>>8, (dlen&0x000000ff))
-        tosend += data
-
-        if conn not in self._send_queue:
-            self._send_queue[conn] = []
-        self._send_queue[conn].append(tosend)
-        self._process_send_queue()
+        if segments is not None:
+            seglens = [s.nbytes for s in segments]
+            header = struct.pack('>2sII%dQ' % len(seglens), 'QA', dlen,
+                len(seglens), *seglens)
+        else:
+            header = struct.pack('>2sI', 'QT', dlen)
 
-    def _call_cb(self, callid, val):
-        if callid in self._return_vals:
-            logging.warning('Received late reply for call %d', callid)
-            del self._return_vals[callid]
+        # Don't copy large packets just to prepend the header
+        if dlen < BUFSIZE:
+            tosend = [header + data]
         else:
-            self._return_vals[callid] = val
+            tosend = [header, data]
+        if segments:
+            tosend.extend([buffer(s) for s in segments])
+
+        codec = self._codecs.get(conn, None)
+        if codec is not None:
+            size = len(header) + dlen
+            if segments:
+                size += sum(seglens)
+            if size >= COMPRESS_MIN_SIZE:
+                tosend = self._compress(conn, codec, tosend, size)
+
+        self._send_lock.acquire()
+        try:
+            if conn not in self._send_queue:
+                self._send_queue[conn] = []
+            self._send_queue[conn].extend(tosend)
+            self._do_process_send_queue()
+        finally:
+            self._send_lock.release()
 
     def call(self, conn, objname, funcname, *args, **kwargs):
         '''
         Call a function through connection 'conn'
+
+        Special keyword arguments:
+            callback: function to call with the result, don't wait for it
+            signal: send as a signal, i.e. don't expect a result
+            timeout: time to wait for the result of a blocking call
         '''
 
         cb = kwargs.pop('callback', None)
         is_signal = kwargs.pop('signal', False)
         timeout = kwargs.pop('timeout', self.TIMEOUT)
-        blocking = (cb is None and not is_signal)
 
-        if not is_signal:
-            self._last_call_id += 1
-            callid = self._last_call_id
-            if cb is not None:
-                self._return_cbs[callid] = cb
-            else:
-                self._return_cbs[callid] = lambda val: self._call_cb(callid, val)
+        if is_signal:
+            self._send_call(conn, None, objname, funcname, args, kwargs)
+        elif cb is not None:
+            self._send_call(conn, cb, objname, funcname, args, kwargs)
+        else:
+            future = self.call_async(conn, objname, funcname, *args, **kwargs)
+            if not future.wait(timeout):
+                logging.warning('Blocking call %d timed out', future.get_id())
+                self._return_cbs.pop(future.get_id(), None)
+                return None
+            return future.result()
+
+    def call_async(self, conn, objname, funcname, *args, **kwargs):
+        '''
+        Call a function through connection 'conn' without waiting for the
+        result. Returns a CallFuture to get the result later.
+
+        Many calls can be made this way before collecting the results, they
+        are sent directly after each other and the replies can arrive in
+        any order.
+        '''
+
+        future = CallFuture(self, conn)
+        callid = self._send_call(conn, future.set_result, objname, funcname,
+                args, kwargs)
+        future.set_id(callid)
+        return future
+
+    def _send_call(self, conn, cb, objname, funcname, args, kwargs):
+        '''
+        Send a call request, or a signal if cb is None. The result will be
+        passed to cb. Returns the call id.
+        '''
 
+        if cb is not None:
+            callid = self._call_ids.next()
+            self._return_cbs[callid] = cb
             info = ('call', callid)
         else:
-            cb = None
+            callid = None
             info = ('signal', )
 
-        logging.debug('Calling %s.%s(%r, %r), info=%r, blocking=%r', objname, funcname, args, kwargs, info, blocking)
+        logging.debug('Calling %s.%s(%r, %r), info=%r', objname, funcname, args, kwargs, info)
 
         callinfo = (objname, funcname, args, kwargs)
-        cmd = self._pickle_packet(info, callinfo)
-        start_time = time.time()
-        self.send_packet(conn, cmd)
+        cmd, segments = self._pickle_packet(conn, info, callinfo)
+        self.send_packet(conn, cmd, segments)
+        return callid
 
-        if not blocking:
-            return
+    def _wait_reply(self, conn, future, end_time):
+        '''
+        Wait until future has its result or until end_time. Returns whether
+        the result is available.
 
-        # Wait for return
-        while time.time() - start_time < timeout:
-            if callid in self._return_vals:
-                break
+        If no other thread is reading from conn, read and handle the data
+        here, so that we don't depend on a main loop while blocking; the
+        reply is handled as soon as it arrives. Otherwise wait for the
+        reading thread to set the result.
+        '''
+
+        reader = self._get_reader(conn)
+        while not future.done():
+            remaining = end_time - time.time()
+            if remaining <= 0:
+                return False
+
+            # Check again regularly, the reading thread might stop
+            # before our reply arrives. Wait on the event itself, not
+            # future.wait(), which would come back here.
+            if not reader.lock.acquire(False):
+                future._event.wait(min(remaining, 0.05))
+                continue
+
+            try:
+                if future.done():
+                    break
+
+                # Also send queued data if the socket was full
+                if len(self._send_queue.get(conn, [])) > 0:
+                    wlist = [conn]
+                else:
+                    wlist = []
+                lists = select.select([conn], wlist, [], remaining)
+                if len(lists[1]) > 0:
+                    self._process_send_queue()
+                if len(lists[0]) == 0:
+                    continue
 
-            # Don't depend on a main loop to receive data while blocking
-            import select
-            lists = select.select([conn], [], [], 0.1)
-            if len(lists[0]) > 0:
                 try:
-                    data = conn.recv(BUFSIZE)
-                except:
+                    n = self.receive(conn)
+                except socket.error, e:
                     # Cope with strange windows errors?
                     time.sleep(0.002)
                     continue
 
-                if len(data) == 0:
+                if n == 0:
                     self._client_disconnected(conn)
-                    return
-                self.handle_data(conn, data)
-            else:
-                time.sleep(0.002)
-
-        if callid in self._return_vals:
-            ret = self._return_vals[callid]
-            del self._return_vals[callid]
-            if isinstance(ret, Exception):
-                raise Exception('Remote error: %s' % str(ret))
-            return ret
-        else:
-            logging.warning('Blocking call %d timed out', callid)
-            self._return_vals[callid] = None    # Mark as timed out
+                    return False
+            finally:
+                reader.lock.release()
 
-        return None
+        return True
 
     def connect(self, objname, signame, callback, *args, **kwargs):
         '''
@@ -516,30 +1088,142 @@ class ObjectSharer():
 
         self._callbacks_hid[self._last_hid] = info
         name = '%s__%s' % (objname, signame)
-        if name in self._callbacks_name:
-            self._callbacks_name[name].append(info)
-        else:
-            self._callbacks_name[name] = [info]
+        if name not in self._callbacks_name:
+            self._callbacks_name[name] = {}
+        self._callbacks_name[name][self._last_hid] = info
+        self._callbacks_bound.pop(name, None)
 
         return self._last_hid
 
     def disconnect(self, hid):
-        if hid in self._callbacks_hid:
-            del self._callbacks_hid[hid]
+        info = self._callbacks_hid.pop(hid, None)
+        if info is None:
+            return
 
-        for name, info_list in self._callbacks_name.iteritems():
-            for index, info in enumerate(info_list):
-                if info['hid'] == hid:
-                    del self._callbacks_name[name][index]
-                    break
+        name = '%s__%s' % (info['object'], info['signal'])
+        info_dict = self._callbacks_name[name]
+        del info_dict[hid]
+        if len(info_dict) == 0:
+            del self._callbacks_name[name]
+        self._callbacks_bound.pop(name, None)
+
+    def set_signal_rate(self, rate):
+        '''
+        Set the maximum number of signal packets per second sent to each
+        client. Signals emitted in between are combined according to the
+        signal policies. If rate is None, send every signal immediately.
+        '''
+        self._signal_rate = rate
+
+    def set_signal_policy(self, signame, policy):
+        '''
+        Set how emissions of signal signame are combined, one of 'latest',
+        'count' or 'queue'. See SIGNAL_POLICIES.
+        '''
+        if policy not in ('latest', 'count', 'queue'):
+            raise ValueError('Unknown signal policy %r' % policy)
+        self._signal_policies[signame] = policy
+
+    def get_signal_stats(self):
+        '''
+        Return a dictionary of client instance name -> (number of signals
+        emitted, number of signals sent, number of packets).
+        '''
+        stats = {}
+        for client, queue in self._signal_queues.items():
+            stats[client.get_instance_name()] = \
+                    (queue.nemitted, queue.nsent, queue.npackets)
+        return stats
 
     def emit_signal(self, objname, signame, *args, **kwargs):
         logging.debug('Emitting %s(%r, %r) for %s to %d clients',
                 signame, args, kwargs, objname, len(self._clients))
 
-        kwargs['signal'] = True
-        for client in self._clients:
-            client.receive_signal(objname, signame, *args, **kwargs)
+        if self._signal_rate is None:
+            kwargs['signal'] = True
+            for client in self._clients:
+                client.receive_signal(objname, signame, *args, **kwargs)
+            return
+
+        # Queue for each client; they are sent by _flush_signals
+        policy = self._signal_policies.get(signame, 'queue')
+        self._signal_lock.acquire()
+        try:
+            for client in self._clients:
+                queue = self._signal_queues.get(client, None)
+                if queue is None:
+                    queue = self._signal_queues[client] = _SignalQueue()
+                queue.add(policy, objname, signame, args, kwargs)
+
+                if queue.hid is None:
+                    delay = queue.last_flush + 1.0 / self._signal_rate - time.time()
+                    queue.hid = gobject.timeout_add(max(0, int(delay * 1000)),
+                            self._flush_signals, client)
+        finally:
+            self._signal_lock.release()
+
+    def _flush_signals_for_conn(self, conn):
+        '''Send the queued signals to the client on connection conn now.'''
+
+        if len(self._signal_queues) == 0:
+            return
+        self._signal_lock.acquire()
+        try:
+            client = None
+            for c, queue in self._signal_queues.iteritems():
+                if len(queue.entries) > 0 and c.get_connection() == conn:
+                    client = c
+                    if queue.hid is not None:
+                        gobject.source_remove(queue.hid)
+                        queue.hid = None
+                    break
+        finally:
+            self._signal_lock.release()
+        if client is not None:
+            self._flush_signals(client)
+
+    def _flush_signals(self, client):
+        '''
+        Send the queued signals to client, in one packet if the client
+        supports that.
+        '''
+
+        self._signal_lock.acquire()
+        try:
+            queue = self._signal_queues.get(client, None)
+            if queue is None:
+                return False
+            queue.hid = None
+            queue.last_flush = time.time()
+            entries = queue.take()
+        finally:
+            self._signal_lock.release()
+
+        if len(entries) == 0 or client not in self._clients:
+            return False
+
+        try:
+            caps = self._capabilities.get(client.get_connection(), ())
+            if hasattr(client, 'receive_signals'):
+                if 'signal_count' not in caps:
+                    entries = [e[:4] for e in entries]
+                client.receive_signals(entries, signal=True)
+            else:
+                for objname, signame, args, kwargs, count in entries:
+                    kwargs = dict(kwargs, signal=True)
+                    client.receive_signal(objname, signame, *args, **kwargs)
+        except Exception, e:
+            logging.warning('Sending signals failed: %s', str(e))
+
+        return False
+
+    def get_signal_count(self):
+        '''
+        Return the number of emissions that were combined into the signal
+        whose callbacks are being called, see SIGNAL_POLICIES. Returns 1
+        otherwise.
+        '''
+        return self._signal_count
 
     def receive_signal(self, objname, signame, *args, **kwargs):
         logging.debug('Received signal %s(%r, %r) from %s',
@@ -548,18 +1232,25 @@ class ObjectSharer():
         ncalls = 0
         start = time.time()
         name = '%s__%s' % (objname, signame)
-        if name in self._callbacks_name:
-            info_list = self._callbacks_name[name]
-            for info in info_list:
-                try:
-                    fargs = list(args)
-                    fargs.extend(info['args'])
+        callbacks = self._callbacks_bound.get(name, None)
+        if callbacks is None:
+            info_dict = self._callbacks_name.get(name, {})
+            callbacks = tuple((info_dict[hid]['function'],
+                    info_dict[hid]['args'], info_dict[hid]['kwargs'])
+                    for hid in sorted(info_dict))
+            self._callbacks_bound[name] = callbacks
+
+        for func, cbargs, cbkwargs in callbacks:
+            try:
+                if cbkwargs or kwargs:
                     fkwargs = kwargs.copy()
-                    fkwargs.update(info['kwargs'])
-                    info['function'](*fargs, **fkwargs)
-                    ncalls += 1
-                except Exception, e:
-                    logging.warning('Callback to %s failed for %s.%s: %s', info['function'], objname, signame, str(e))
+                    fkwargs.update(cbkwargs)
+                    func(*(args + cbargs), **fkwargs)
+                else:
+                    func(*(args + cbargs))
+                ncalls += 1
+            except Exception, e:
+                logging.warning('Callback to %s failed for %s.%s: %s', func, objname, signame, str(e))
 
         end = time.time()
         logging.debug('Did %d callbacks in %.03fms for sig %s',
@@ -573,19 +1264,522 @@ class ObjectSharer():
         for client in self._clients:
             client.get_connection().close()
 
+class CallFuture():
+    '''
+    The result of a remote call, which becomes available when the reply
+    is received. Returned by ObjectSharer.call_async().
+    '''
+
+    def __init__(self, sharer, conn):
+        self._sharer = sharer
+        self._conn = conn
+        self._id = None
+        self._event = threading.Event()
+        self._result = None
+
+    def set_id(self, callid):
+        self._id = callid
+
+    def get_id(self):
+        '''Return the call id.'''
+        return self._id
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def done(self):
+        '''Return whether the result is available.'''
+        return self._event.isSet()
+
+    def wait(self, timeout=None):
+        '''
+        Wait at most timeout seconds (default ObjectSharer.TIMEOUT) for the
+        result, return whether it is available. Data from the connection
+        is received while waiting, unless another thread is doing that.
+        '''
+
+        if timeout is None:
+            timeout = self._sharer.TIMEOUT
+        return self._sharer._wait_reply(self._conn, self,
+                time.time() + timeout)
+
+    def result(self, timeout=None):
+        '''
+        Wait for and return the result. Raises an exception if the remote
+        function raised one. Returns None if the result did not arrive
+        within timeout seconds.
+        '''
+
+        if not self.wait(timeout):
+            logging.warning('Result of call %d not available', self._id)
+            return None
+        if isinstance(self._result, Exception):
+            raise Exception('Remote error: %s' % str(self._result))
+        return self._result
+
+# Shared memory arrays created by shm_empty(): file name -> (address, size)
+_shm_regions = {}
+_shm_refs = {}
+# Mapped files received from peers, by (file name, inode, size)
+_shm_maps = weakref.WeakValueDictionary()
+# Files that could not be removed yet (Windows keeps mapped files open)
+_shm_leftover = []
+# Copies made for peers that have not mapped them yet
+_shm_copies = set()
+
+def set_nodelay(sock):
+    '''
+    Disable Nagle's algorithm on a TCP socket, so that small packets, e.g.
+    pipelined calls and their replies, are sent without waiting for the
+    acknowledgement of earlier ones.
+    '''
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (socket.error, AttributeError), e:
+        logging.debug('Unable to set TCP_NODELAY: %s', str(e))
+
+def _shm_new_file():
+    fd, path = tempfile.mkstemp(prefix='qtlab_', suffix='.shm', dir=SHM_DIR)
+    os.close(fd)
+    return path
+
+def _shm_remove(path):
+    try:
+        os.remove(path)
+    except OSError, e:
+        _shm_leftover.append(path)
+
+def _shm_freed(path):
+    _shm_regions.pop(path, None)
+    _shm_refs.pop(path, None)
+    _shm_remove(path)
+
+def _shm_discard(path):
+    '''Remove a copy that the peer will not map.'''
+    _shm_copies.discard(path)
+    try:
+        os.remove(path)
+    except OSError, e:
+        pass
+
+def _shm_cleanup():
+    for path in _shm_regions.keys() + _shm_leftover + list(_shm_copies):
+        try:
+            os.remove(path)
+        except OSError, e:
+            pass
+atexit.register(_shm_cleanup)
+
+def shm_empty(shape, dtype=float):
+    '''
+    Return a new array of given shape and dtype in shared memory. When it
+    (or a view on it) is sent to a peer on the same host, the peer maps
+    the same memory instead of receiving a copy, so it sees later changes
+    to the array. The memory is released when the array is no longer used
+    here.
+    '''
+
+    path = _shm_new_file()
+    try:
+        a = numpy.memmap(path, dtype=dtype, mode='w+', shape=shape)
+    except:
+        _shm_remove(path)
+        raise
+    _shm_regions[path] = (a.__array_interface__['data'][0], a.nbytes)
+    _shm_refs[path] = weakref.ref(a, lambda ref, path=path: _shm_freed(path))
+    return a
+
+def _shm_find(a):
+    '''
+    Return (file name, offset) if array a is in memory from shm_empty(),
+    otherwise None.
+    '''
+
+    if len(_shm_regions) == 0:
+        return None
+    addr = a.__array_interface__['data'][0]
+    for path, (start, size) in _shm_regions.items():
+        if start <= addr < start + size:
+            return path, addr - start
+    return None
+
+def _c_strides(a):
+    strides = []
+    stride = a.itemsize
+    for n in reversed(a.shape):
+        strides.insert(0, stride)
+        stride *= n
+    return tuple(strides)
+
+def _shm_copy(a):
+    '''
+    Copy array a to a new shared memory file and return its name. The
+    receiver removes the file.
+    '''
+
+    path = None
+    try:
+        path = _shm_new_file()
+        _shm_copies.add(path)
+        m = numpy.memmap(path, dtype=a.dtype, mode='w+', shape=a.shape)
+        m[...] = a
+        del m
+        return path
+    except Exception, e:
+        logging.warning('Unable to copy array to shared memory: %s', str(e))
+        if path is not None:
+            _shm_discard(path)
+        return None
+
+def _shm_load(path, offset, dtype, shape, strides, owned):
+    '''
+    Return an array in shared memory file path. If owned, the file is a
+    copy made for us: it is mapped copy-on-write and removed.
+    '''
+
+    # Only map (and remove) files made by _shm_new_file()
+    path = os.path.abspath(path)
+    if os.path.dirname(path) != os.path.abspath(SHM_DIR) or \
+            not os.path.basename(path).startswith('qtlab_'):
+        raise pickle.UnpicklingError('Invalid shared memory file %r' % path)
+
+    if owned:
+        m = numpy.memmap(path, dtype=numpy.uint8, mode='c')
+        _shm_remove(path)
+    else:
+        # The same file name could be used again for a new file
+        st = os.stat(path)
+        key = (path, st.st_ino, st.st_size)
+        m = _shm_maps.get(key, None)
+        if m is None:
+            m = numpy.memmap(path, dtype=numpy.uint8, mode='r')
+            _shm_maps[key] = m
+    return numpy.ndarray(shape, dtype=dtype, buffer=m, offset=offset,
+            strides=strides)
+
+class _SignalQueue():
+    '''
+    Signals waiting to be sent to one client, combined according to the
+    policy of each signal.
+    '''
+
+    def __init__(self):
+        self.entries = []   # (objname, signame, args, kwargs, count)
+        self._index = {}    # (objname, signame) -> entry that can be combined
+        self.hid = None     # Scheduled flush
+        self.last_flush = 0
+
+        self.nemitted = 0
+        self.nsent = 0
+        self.npackets = 0
+
+    def add(self, policy, objname, signame, args, kwargs):
+        self.nemitted += 1
+        key = (objname, signame)
+        index = self._index.get(key, None)
+
+        # Don't move signals across a signal that is always sent
+        if policy == 'queue':
+            self.entries.append((objname, signame, args, kwargs, 1))
+            self._index = {}
+            return
+
+        if index is None:
+            self._index[key] = len(self.entries)
+            self.entries.append((objname, signame, args, kwargs, 1))
+            return
+
+        count = self.entries[index][4] + 1
+        if policy == 'latest':
+            oldargs = self.entries[index][2]
+            if len(args) > 0 and len(oldargs) == len(args) and \
+                    type(args[-1]) is types.DictType and \
+                    type(oldargs[-1]) is types.DictType:
+                merged = dict(oldargs[-1])
+                merged.update(args[-1])
+                args = args[:-1] + (merged, )
+        self.entries[index] = (objname, signame, args, kwargs, count)
+
+    def take(self):
+        '''Return the queued signals and clear the queue.'''
+        entries = self.entries
+        self.entries = []
+        self._index = {}
+        self.nsent += len(entries)
+        self.npackets += 1
+        return entries
+
+class _WorkerPool():
+    '''
+    A fixed number of threads taking functions to call from a bounded
+    queue. The threads are started when they are first needed.
+    '''
+
+    def __init__(self, nthreads, maxqueue):
+        self._nthreads = nthreads
+        self._queue = Queue.Queue(maxqueue)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._lock.acquire()
+        try:
+            while len(self._threads) < self._nthreads:
+                t = threading.Thread(target=self._run,
+                        name='ObjectSharerWorker')
+                t.setDaemon(True)
+                t.start()
+                self._threads.append(t)
+        finally:
+            self._lock.release()
+
+    def submit(self, func, *args):
+        '''
+        Queue func(*args) to be called by a worker thread. Returns False if
+        the queue is full.
+        '''
+
+        if len(self._threads) < self._nthreads:
+            self._start()
+        try:
+            self._queue.put_nowait((func, args))
+            return True
+        except Queue.Full:
+            return False
+
+    def _run(self):
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except Exception, e:
+                logging.warning('Error in worker thread: %s', str(e))
+
+class _PacketReader():
+    '''
+    Decodes the packets received on a connection. A packet is either:
+        'QT' <length> <pickle data>
+    or, if the pickle contains references to arrays sent as separate
+    binary segments or in shared memory (then possibly zero segments):
+        'QA' <length> <nsegments> <segment lengths> <pickle data> <segments>
+    or, compressed:
+        'QZ' <length> <codec id> <compressed 'QT' or 'QA' packet>
+    All lengths are big-endian unsigned ints, 4 bytes, or 8 bytes for the
+    segment lengths, the codec id is 1 byte. Segments are received into preallocated bytearrays,
+    which the unpickled arrays use as their memory.
+
+    Data is received with recv_into in a bytearray that is only compacted
+    or grown when it is full, so the cost is linear in the data size. Once
+    the length of a packet is known, space for all of it is reserved and
+    it is received in chunks of up to MAX_BUFSIZE.
+    '''
+
+    def __init__(self):
+        self.lock = threading.RLock()   # Held by the thread reading
+
+        self._buf = bytearray(BUFSIZE)
+        self._start = 0         # Start of data not yet decoded
+        self._end = 0           # End of received data
+        self._need = 0          # Bytes missing for the current packet
+        self._packet = None     # Packet waiting for segment data
+        self._seg = 0           # Segment and position to fill
+        self._pos = 0
+
+        self.compress_stats = {}
+
+    def _reserve(self, n):
+        '''Make room for at least n bytes after the received data.'''
+        if len(self._buf) - self._end >= n:
+            return
+
+        if self._start > 0:
+            del self._buf[:self._start]
+            self._end -= self._start
+            self._start = 0
+
+        free = len(self._buf) - self._end
+        if free < n:
+            self._buf.extend(bytearray(max(n - free, len(self._buf))))
+
+    def _segments_done(self):
+        return self._seg >= len(self._packet[1])
+
+    def _fill(self, data):
+        '''
+        Copy data (a memoryview) into the segments of the current packet,
+        return the number of bytes used.
+        '''
+
+        segments = self._packet[1]
+        used = 0
+        while self._seg < len(segments):
+            seg = segments[self._seg]
+            n = min(len(seg) - self._pos, len(data) - used)
+            seg[self._pos:self._pos+n] = data[used:used+n]
+            self._pos += n
+            used += n
+            if self._pos < len(seg):
+                break
+            self._seg += 1
+            self._pos = 0
+        return used
+
+    def feed(self, data):
+        '''Add received data (a string).'''
+        data = memoryview(data)
+        if self._packet is not None:
+            data = data[self._fill(data):]
+        n = len(data)
+        if n > 0:
+            self._reserve(n)
+            self._buf[self._end:self._end+n] = data
+            self._end += n
+
+    def recv(self, conn):
+        '''
+        Receive data from socket conn, return the number of bytes received.
+        '''
+
+        # Directly into the array segment
+        if self._packet is not None and not self._segments_done():
+            seg = self._packet[1][self._seg]
+            n = conn.recv_into(memoryview(seg)[self._pos:],
+                    min(len(seg) - self._pos, MAX_BUFSIZE))
+            self._fill(memoryview(seg)[self._pos:self._pos+n])
+            return n
+
+        size = min(max(self._need, BUFSIZE), MAX_BUFSIZE)
+        self._reserve(size)
+        n = conn.recv_into(memoryview(self._buf)[self._end:], size)
+        self._end += n
+        return n
+
+    def _consume(self, n):
+        self._start += n
+        if self._start == self._end:
+            self._start = self._end = 0
+            # Don't hold on to the memory of a very large packet
+            if len(self._buf) > MAX_BUFSIZE:
+                self._buf = bytearray(BUFSIZE)
+
+    def next_packet(self):
+        '''
+        Return the next complete packet as (pickle data, segments), or None
+        if no complete packet is available.
+        Raises ValueError if the data is not a valid packet.
+        '''
+
+        if self._packet is not None:
+            if not self._segments_done():
+                return None
+            packet = self._packet
+            self._packet = None
+            return packet
+
+        b = self._buf
+        start = self._start
+        avail = self._end - start
+        if avail < 6:
+            self._need = 6 - avail
+            return None
+
+        magic = b[start:start+2]
+        if magic == 'QT':
+            datalen = struct.unpack_from('>I', b, start + 2)[0]
+            if avail < datalen + 6:
+                self._need = datalen + 6 - avail
+                self._reserve(self._need)
+                return None
+            self._need = 0
+            data = memoryview(self._buf)[start+6:start+6+datalen].tobytes()
+            self._consume(6 + datalen)
+            return data, None
+
+        elif magic == 'QA':
+            if avail < 10:
+                self._need = 10 - avail
+                return None
+            datalen, nseg = struct.unpack_from('>II', b, start + 2)
+            hlen = 10 + 8 * nseg
+            if avail < hlen + datalen:
+                self._need = hlen + datalen - avail
+                self._reserve(self._need)
+                return None
+            self._need = 0
+            seglens = struct.unpack_from('>%dQ' % nseg, b, start + 10)
+            data = memoryview(b)[start+hlen:start+hlen+datalen].tobytes()
+            self._consume(hlen + datalen)
+
+            self._packet = (data, [bytearray(n) for n in seglens])
+            self._seg = 0
+            self._pos = 0
+            if self._end > self._start:
+                used = self._fill(memoryview(self._buf)[self._start:self._end])
+                self._consume(used)
+            return self.next_packet()
+
+        elif magic == 'QZ':
+            if avail < 7:
+                self._need = 7 - avail
+                return None
+            datalen, codec = struct.unpack_from('>IB', b, start + 2)
+            if avail < datalen + 7:
+                self._need = datalen + 7 - avail
+                self._reserve(self._need)
+                return None
+            self._need = 0
+            zdata = memoryview(b)[start+7:start+7+datalen].tobytes()
+            self._consume(7 + datalen)
+            return self._decompress(codec, zdata)
+
+        self._start = self._end = 0
+        raise ValueError('Packet magic missing')
+
+    def _decompress(self, codec, zdata):
+        '''Decompress and decode the packet in a 'QZ' packet.'''
+
+        start = time.time()
+        try:
+            if codec == COMPRESS_IDS['zlib']:
+                data = zlib.decompress(zdata)
+            elif codec == COMPRESS_IDS['lz4'] and lz4 is not None:
+                data = lz4.decompress(zdata)
+            else:
+                raise ValueError('Unsupported compression %d' % codec)
+        except Exception, e:
+            raise ValueError('Unable to decompress packet: %s' % str(e))
+        dt = time.time() - start
+
+        stats = self.compress_stats
+        stats['recv_packets'] = stats.get('recv_packets', 0) + 1
+        stats['recv_bytes'] = stats.get('recv_bytes', 0) + len(data)
+        stats['recv_compressed'] = stats.get('recv_compressed', 0) + len(zdata)
+        stats['decompress_time'] = stats.get('decompress_time', 0) + dt
+
+        reader = _PacketReader()
+        reader.feed(data)
+        packet = reader.next_packet()
+        if packet is None or reader._start != reader._end:
+            raise ValueError('Invalid compressed packet')
+        return packet
+
 class SharedObject():
     '''
     Server side object that can be shared and emit signals.
     '''
 
-    def __init__(self, name, replace=False, wrapobj=None):
+    def __init__(self, name, replace=False, wrapobj=None, threadsafe=False):
         '''
         Create SharedObject, arguments:
         name:       shared name
         replace:    whether to replace object when it already exists
         wrapobj:    object instance to wrap
+        threadsafe: whether remote calls can be handled concurrently, in
+                    worker threads
         '''
 
+        self._threadsafe = threadsafe
         self.__last_hid = 1
         self.__callbacks = {}
         self.__name = name
@@ -652,21 +1846,22 @@ class SharedObject():
         if hid in self.__callbacks:
             del self.__callbacks[hid]
 
-def create_shared_object(name, obj):
+def create_shared_object(name, obj, threadsafe=False):
     '''
     Create a shared object called <name> for an already instantiated object
     <obj>.
     '''
-    return SharedObject(name, wrapobj=obj)
+    return SharedObject(name, wrapobj=obj, threadsafe=threadsafe)
 
 class SharedGObject(gobject.GObject, SharedObject):
 
-    def __init__(self, name, replace=False, idle_emit=False):
+    def __init__(self, name, replace=False, idle_emit=False, threadsafe=False):
         logging.debug('Creating shared Gobject: %r', name)
         self.__hid_map = {}
         self._do_idle_emit = idle_emit
         gobject.GObject.__init__(self)
-        SharedObject.__init__(self, name, replace=replace)
+        SharedObject.__init__(self, name, replace=replace,
+                threadsafe=threadsafe)
 
     def connect(self, signal, *args, **kwargs):
         hid = SharedObject.connect(self, signal, *args, **kwargs)
@@ -696,6 +1891,14 @@ class SharedGObject(gobject.GObject, SharedObject):
         del self.__hid_map[ghid]
         return gobject.GObject.disconnect(self, ghid)
 
+def _copy_result(ret):
+    '''Copy cached lists and dicts, so that callers can't modify the cache.'''
+    if isinstance(ret, list):
+        return list(ret)
+    elif isinstance(ret, dict):
+        return dict(ret)
+    return ret
+
 class _FunctionCall():
 
     def __init__(self, conn, objname, funcname, share_options):
@@ -710,16 +1913,57 @@ class _FunctionCall():
 
         self._cached_result = None
 
+        # Results per arguments, for functions with 'cache_args'. The
+        # generation is increased when the cache is cleared, so that a
+        # result requested before that is not stored.
+        self._cache = {}
+        self._cache_gen = 0
+
     def __call__(self, *args, **kwargs):
+        if self._share_options.get('cache_args', False):
+            return self._call_cached(args, kwargs)
+
         cache = self._share_options.get('cache_result', False) 
         if cache and self._cached_result is not None:
-            return self._cached_result
+            return _copy_result(self._cached_result)
 
         ret = helper.call(self._conn, self._objname, self._funcname, *args, **kwargs)
         if cache:
             self._cached_result = ret
         return ret
 
+    def _call_cached(self, args, kwargs):
+        try:
+            key = (args, tuple(sorted(kwargs.items())))
+            ret = self._cache.get(key, None)
+        except TypeError:
+            # Unhashable arguments
+            return helper.call(self._conn, self._objname, self._funcname,
+                    *args, **kwargs)
+        if ret is not None:
+            return _copy_result(ret)
+
+        gen = self._cache_gen
+        ret = helper.call(self._conn, self._objname, self._funcname,
+                *args, **kwargs)
+        if ret is not None and gen == self._cache_gen:
+            self._cache[key] = ret
+            return _copy_result(ret)
+        return ret
+
+    def clear_cache(self):
+        '''Forget the results cached for this function.'''
+        self._cache = {}
+        self._cache_gen += 1
+
+    def async_call(self, *args, **kwargs):
+        '''
+        Call the remote function without waiting for the result. Returns a
+        CallFuture, use its result() function to get the return value.
+        '''
+        return helper.call_async(self._conn, self._objname, self._funcname,
+                *args, **kwargs)
+
 class ObjectProxy():
     '''
     Client side object proxy.
@@ -734,12 +1978,34 @@ class ObjectProxy():
         self.__new_hid = 1
         self.__callbacks = {}
 
+        # Functions with cached results, per signal that invalidates them
+        self.__cached_funcs = {}
+
         for funcname, share_options in info['functions']:
-            setattr(self, funcname, _FunctionCall(self.__conn, self.__name, funcname, share_options))
+            func = _FunctionCall(self.__conn, self.__name, funcname, share_options)
+            setattr(self, funcname, func)
+            if share_options is not None:
+                for signame in share_options.get('invalidate_on', ()):
+                    self.__cached_funcs.setdefault(signame, []).append(func)
 
         for propname in info['properties']:
             setattr(self, propname, 'blaat')
 
+        self.__cache_hids = [helper.connect(self.__name, signame,
+                self._invalidate_cache_cb, signame)
+                for signame in self.__cached_funcs]
+
+    def _invalidate_cache_cb(self, *args):
+        # The last argument is the signal name
+        for func in self.__cached_funcs.get(args[-1], ()):
+            func.clear_cache()
+
+    def _release(self):
+        '''Stop listening for signals, called when the proxy is dropped.'''
+        for hid in self.__cache_hids:
+            helper.disconnect(hid)
+        self.__cache_hids = []
+
     def get_connection(self):
         return self.__conn
 
@@ -761,6 +2027,18 @@ def cache_result(f):
     f._share_options = {'cache_result': True}
     return f
 
+def cache_result_until(*signals):
+    '''
+    Decorator for shared functions whose result only changes when the
+    object emits one of the signals. Remote proxies cache the result for
+    each set of arguments until one of the signals is received.
+    '''
+
+    def decorator(f):
+        f._share_options = {'cache_args': True, 'invalidate_on': signals}
+        return f
+    return decorator
+
 class RootObject(SharedObject):
 
     def __init__(self, name):
@@ -791,11 +2069,29 @@ class RootObject(SharedObject):
             'properties': props,
             'functions': funcs,
         }
+        if objname == 'root':
+            info['capabilities'] = CAPABILITIES
         return info
 
     def receive_signal(self, objname, signame, *args, **kwargs):
         helper.receive_signal(objname, signame, *args, **kwargs)
 
+    def receive_signals(self, signals):
+        '''
+        Receive a list of signals (objname, signame, args, kwargs[, count])
+        sent in one packet. count is the number of emissions combined into
+        the signal, available to callbacks through
+        ObjectSharer.get_signal_count().
+        '''
+        for entry in signals:
+            objname, signame, args, kwargs = entry[:4]
+            if len(entry) > 4:
+                helper._signal_count = entry[4]
+            try:
+                helper.receive_signal(objname, signame, *args, **kwargs)
+            finally:
+                helper._signal_count = 1
+
     def list_objects(self):
         return self._objects.keys()
 
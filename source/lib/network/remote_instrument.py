@@ -47,6 +47,12 @@ class InstrumentServer(objsh.SharedObject):
             params[name]['set_func'] = None
         return params
 
+    def snapshot(self, instrument_names=None, query=False):
+        return qt.instruments.snapshot(instrument_names, query=query)
+
+    def snapshot_delta(self, version, instrument_names=None):
+        return qt.instruments.snapshot_delta(version, instrument_names)
+
     def get_ins_functions(self, insname):
         funcs = copy.copy(qt.instruments[insname].get_functions())
         for name in funcs.keys():
@@ -12,6 +12,24 @@ class Handler(tcpservergtk.GlibTCPHandler):
                 packet_len=True)
         self.client = objsh.helper.add_client(self.socket, self)
 
+    def _handle_recv(self, sock, number):
+        # Let the object sharer receive into its own buffers
+        try:
+            n = objsh.helper.receive(self.socket)
+        except socket.error, e:
+            # No data anyway...
+            return True
+
+        if n == 0:
+            self._handle_hup()
+            return False
+        return True
+
+    def _handle_hup(self, *args):
+        # Release what was kept for the peer, e.g. shared memory
+        objsh.helper._client_disconnected(self.socket)
+        return tcpservergtk.GlibTCPHandler._handle_hup(self, *args)
+
     def handle(self, data):
         if len(data) > 0:
             data = objsh.helper.handle_data(self.socket, data)
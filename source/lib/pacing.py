@@ -0,0 +1,219 @@
+# pacing.py, wait for measurement points on an absolute timeline
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import time
+import logging
+import numpy
+from misc import exact_time
+
+# Bin edges, in seconds, of the histogram of achieved - requested interval
+HISTOGRAM_EDGES = numpy.array([-numpy.inf, -1e-1, -1e-2, -1e-3, -1e-4, -1e-5,
+        1e-5, 1e-4, 1e-3, 1e-2, 1e-1, numpy.inf])
+
+class Pacer:
+    '''
+    Waits between measurement points with a precise and known timing.
+
+    Deadlines are kept on an absolute timeline: next(interval) waits
+    until the previous deadline plus interval, so the time spent
+    measuring does not add up and there is no drift. A point that is
+    late is absorbed by the slack of the following intervals; only when
+    a whole interval is lost the timeline restarts from the current time,
+    instead of measuring a burst of points to catch up. sleep(delay)
+    waits relative to the current time, as a settling time.
+
+    While waiting, the idle function (e.g. qt.flow.service_events) is called
+    with the time it may use, up to 'margin' seconds before the deadline. It
+    is called at least once per wait, with a zero budget if there is no
+    slack or the point is late, so that an abort is always noticed and the
+    GUI keeps responding. The last 'spin' seconds are spent in a busy loop,
+    so the wake-up error is set by the clock resolution rather than by the
+    scheduler or the GUI load. An event handler that is already running can
+    not be interrupted, so the error is bounded by the busy loop only if no
+    single handler takes longer than 'margin'. The achieved error of every
+    wait is recorded, see get_stats(); waits that exceed 'jitter' are
+    counted as violations.
+
+    Usage:
+        p = Pacer(idle=qt.flow.service_events)
+        p.start()
+        for i in range(n):
+            measure()
+            p.next(0.01)
+    '''
+
+    def __init__(self, idle=None, margin=0.005, spin=0.001, jitter=None):
+        '''
+        Input:
+            idle (function): called with the available time in seconds to
+                handle events, should return within that time; with a
+                budget <= 0 it should only do a minimal non-blocking check
+            margin (float): stop calling idle this many seconds before a
+                deadline
+            spin (float): busy-wait the last this many seconds
+            jitter (float): required bound on the timing error in seconds
+        '''
+
+        self._idle = idle
+        self._margin = max(margin, spin)
+        self._spin = spin
+        self._jitter = jitter
+        self.reset()
+
+    def reset(self):
+        '''Clear the recorded timing and restart the timeline.'''
+        self._deadline = None
+        self._last = None
+        self._counts = numpy.zeros(len(HISTOGRAM_EDGES) - 1, dtype=int)
+        self._n = 0
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._min = None
+        self._max = None
+        self._max_late = 0.0
+        self._resyncs = 0
+        self._violations = 0
+
+    def start(self):
+        '''Start the timeline at the current time.'''
+        self._deadline = exact_time()
+        self._last = self._deadline
+
+    def _service(self, deadline):
+        if self._idle is not None:
+            self._idle(max(deadline - self._margin - exact_time(), 0.0))
+
+    def _wait_until(self, deadline):
+        while self._idle is not None:
+            self._service(deadline)
+            # Don't spin on an empty event queue
+            nap = min(deadline - self._margin - exact_time(), 0.01)
+            if nap <= 0:
+                break
+            time.sleep(nap)
+
+        remaining = deadline - exact_time()
+        if remaining > self._spin:
+            time.sleep(remaining - self._spin)
+        now = exact_time()
+        while now < deadline:
+            now = exact_time()
+        return now
+
+    def _add(self, error, late):
+        self._counts[numpy.searchsorted(HISTOGRAM_EDGES, error, 'right') - 1] += 1
+        self._n += 1
+        self._sum += error
+        self._sumsq += error ** 2
+        if self._min is None or error < self._min:
+            self._min = error
+        if self._max is None or error > self._max:
+            self._max = error
+        self._max_late = max(self._max_late, late)
+        if self._jitter is not None and abs(error) > self._jitter:
+            self._violations += 1
+
+    def next(self, interval):
+        '''
+        Wait until interval seconds after the previous deadline.
+
+        Output:
+            float: time in seconds the deadline was missed by, 0 if it
+                was met
+        '''
+
+        if self._deadline is None:
+            self.start()
+
+        deadline = self._deadline + interval
+        late = exact_time() - deadline
+        if late > 0:
+            self._service(deadline)
+            now = exact_time()
+        else:
+            now = self._wait_until(deadline)
+            late = 0
+        if late > interval:
+            # Restart the timeline rather than catch up
+            self._resyncs += 1
+            self._deadline = now
+        else:
+            self._deadline = deadline
+
+        self._add((now - self._last) - interval, now - deadline)
+        self._last = now
+        return late
+
+    def sleep(self, delay):
+        '''
+        Wait for delay seconds from now. The timeline of next() continues
+        from the end of the sleep.
+        '''
+
+        start = exact_time()
+        now = self._wait_until(start + delay)
+        self._add((now - start) - delay, now - start - delay)
+        self._deadline = now
+        self._last = now
+
+    def get_histogram(self):
+        '''
+        Return the histogram of the achieved - requested time of all
+        waits, as an array of counts and an array of bin edges in seconds.
+        '''
+        return self._counts.copy(), HISTOGRAM_EDGES.copy()
+
+    def get_stats(self):
+        '''
+        Return a dictionary with the number of waits 'n', the 'mean',
+        'rms', 'min' and 'max' error (achieved - requested, seconds), the
+        largest delay of a wake-up after its deadline 'max_late', the
+        number of 'resyncs' of the timeline, the required 'jitter' bound,
+        the number of 'violations' of it, and the 'histogram' (see
+        get_histogram()). Returns None if nothing was recorded.
+        '''
+
+        if self._n == 0:
+            return None
+        mean = self._sum / self._n
+        return {
+            'n': self._n,
+            'mean': mean,
+            'rms': numpy.sqrt(self._sumsq / self._n),
+            'min': self._min,
+            'max': self._max,
+            'max_late': self._max_late,
+            'resyncs': self._resyncs,
+            'jitter': self._jitter,
+            'violations': self._violations,
+            'histogram': self.get_histogram(),
+        }
+
+    def log_stats(self, name=''):
+        '''Log a summary, as a warning if the jitter bound was violated.'''
+
+        stats = self.get_stats()
+        if stats is None:
+            return
+        msg = 'Pacing %s: %d waits, error rms %.1f us, max %.1f us, ' \
+                'latest %.1f us, %d resyncs' % (name, stats['n'],
+                stats['rms'] * 1e6, max(-stats['min'], stats['max']) * 1e6,
+                stats['max_late'] * 1e6, stats['resyncs'])
+        if stats['violations'] > 0:
+            logging.warning('%s; %d exceed the jitter bound of %.1f us',
+                    msg, stats['violations'], self._jitter * 1e6)
+        else:
+            logging.info(msg)
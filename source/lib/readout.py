@@ -0,0 +1,200 @@
+# readout.py, read several instruments concurrently
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import time
+import threading
+import Queue
+import logging
+
+_NO_VALUE = object()
+
+class _Stats:
+    '''Running count, mean, minimum and maximum of a time.'''
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def add(self, dt):
+        self.n += 1
+        self.total += dt
+        self.last = dt
+        if self.min is None or dt < self.min:
+            self.min = dt
+        if self.max is None or dt > self.max:
+            self.max = dt
+
+    def get(self):
+        if self.n == 0:
+            return None
+        return {
+            'n': self.n,
+            'mean': self.total / self.n,
+            'min': self.min,
+            'max': self.max,
+            'last': self.last,
+        }
+
+class ParallelReader:
+    '''
+    Reads a list of instrument parameters for every measurement point,
+    reading independent instruments at the same time.
+
+    The reads are grouped on the instrument lock class (see
+    Instrument.get_lock_class(), by default the instrument name; drivers
+    on a shared bus use the same 'lockclass'). Each group is read in order
+    by its own worker thread, so instruments on different buses are read
+    concurrently while those sharing a bus stay serialized. The first group
+    is read in the calling thread. Functions are called in the calling
+    thread as well. A qt.msleep() in the get path of a driver read by a
+    worker thread only sleeps, events are handled by the main thread.
+
+    Items are (instrument, parameter) tuples or functions without
+    arguments. If error_value is given, a failing read returns it instead
+    of raising the error.
+
+    The time of every point, and of each group, is recorded; see
+    get_stats().
+    '''
+
+    def __init__(self, items, error_value=_NO_VALUE):
+        self._items = items
+        self._error_value = error_value
+
+        # Group item indices on lock class, in order of first appearance
+        groups = {}
+        order = []
+        local = []
+        for i, item in enumerate(items):
+            if callable(item):
+                local.append(i)
+                continue
+            ins = item[0]
+            if hasattr(ins, 'get_lock_class'):
+                key = ins.get_lock_class()
+            else:
+                key = ins.get_name()
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            groups[key].append(i)
+
+        self._groups = [(key, groups[key]) for key in order]
+        self._local = local
+        self._stats = {}
+        self._point_stats = _Stats()
+        for key in order:
+            self._stats[key] = _Stats()
+
+        # A worker for each group except the first one
+        self._workers = []
+        self._done = Queue.Queue()
+        for key, indices in self._groups[1:]:
+            q = Queue.Queue()
+            t = threading.Thread(target=self._run, args=(q, ),
+                    name='Readout %s' % key)
+            t.setDaemon(True)
+            t.start()
+            self._workers.append((q, t))
+
+    def _read_item(self, i):
+        item = self._items[i]
+        try:
+            if callable(item):
+                return item()
+            else:
+                return item[0].get(item[1])
+        except Exception, e:
+            if self._error_value is _NO_VALUE:
+                raise
+            logging.warning('Reading %r failed: %s', item, str(e))
+            return self._error_value
+
+    def _read_group(self, key, indices, result):
+        start = time.time()
+        for i in indices:
+            result[i] = self._read_item(i)
+        self._stats[key].add(time.time() - start)
+
+    def _run(self, q):
+        while True:
+            task = q.get()
+            if task is None:
+                return
+            key, indices, result = task
+            try:
+                self._read_group(key, indices, result)
+                self._done.put(None)
+            except Exception, e:
+                self._done.put(e)
+
+    def read(self):
+        '''
+        Read all items and return the values, in the order of the items.
+        '''
+
+        start = time.time()
+        result = [None] * len(self._items)
+        for (q, t), (key, indices) in zip(self._workers, self._groups[1:]):
+            q.put((key, indices, result))
+
+        error = None
+        try:
+            if len(self._groups) > 0:
+                key, indices = self._groups[0]
+                self._read_group(key, indices, result)
+            for i in self._local:
+                result[i] = self._read_item(i)
+        except Exception, e:
+            error = e
+
+        # Always wait for the workers, so the next point starts cleanly
+        for i in xrange(len(self._workers)):
+            e = self._done.get()
+            if e is not None and error is None:
+                error = e
+        if error is not None:
+            raise error
+
+        self._point_stats.add(time.time() - start)
+        return result
+
+    def get_stats(self):
+        '''
+        Return timing statistics in seconds: a dictionary with 'point'
+        for the total time per point and 'groups', a dictionary of lock
+        class -> time to read that group. Each item is a dictionary with
+        'n', 'mean', 'min', 'max' and 'last', or None if nothing was read.
+        '''
+
+        groups = {}
+        for key, stats in self._stats.iteritems():
+            groups[key] = stats.get()
+        return {
+            'point': self._point_stats.get(),
+            'groups': groups,
+        }
+
+    def close(self):
+        '''Stop the worker threads.'''
+        for q, t in self._workers:
+            q.put(None)
+        for q, t in self._workers:
+            t.join()
+        self._workers = []
@@ -405,8 +405,9 @@ class _QTGnuPlot():
                 datadict[key] = val
 
         s = ''
-        if 'binary' in datadict and datadict['binary'] == True:
-            data = datadict['data']
+        data = datadict.get('data', None)
+        if datadict.get('binary', False) == True or \
+                (data is not None and data.is_binary()):
             dimsizes = [data.get_dimension_size(i) \
                     for i in datadict['coorddims']]
             dt = data.get_data().dtype
@@ -610,7 +611,10 @@ class Plot2D(plot.Plot2DBase, _QTGnuPlot):
 
             startpoint = max(0, npoints_last_block - self._maxpoints)
             startblock = max(0, nblocks - self._maxtraces)
-            if len(coorddims) == 0:
+            if data.is_binary():
+                # Binary files have no blank lines separating blocks
+                every = "::%d" % max(0, npoints - self._maxpoints)
+            elif len(coorddims) == 0:
                 every = "::%d" % (startpoint)
             else:
                 every = '::%d:%d' % (startpoint, startblock)
@@ -19,6 +19,7 @@
 import gobject
 import gtk
 import logging
+import threading
 import time
 from gettext import gettext as _L
 from lib.misc import exact_time, get_traceback
@@ -56,6 +57,8 @@ class FlowControl(SharedGObject):
         self._pause = False
         self._exit_handlers = []
         self._callbacks = {}
+        self._last_idle_emit = 0
+        self._main_thread = threading.currentThread()
 
     #########
     ### signals
@@ -134,8 +137,16 @@ class FlowControl(SharedGObject):
 
         If exact=True, timing should be a bit more precise, but in this case
         a delay <= 1msec will result in NO gui interaction.
+
+        Events are only handled by the main thread. Called from another
+        thread, e.g. by a driver read by a lib.readout worker, this just
+        sleeps for 'delay' seconds.
         '''
 
+        if threading.currentThread() is not self._main_thread:
+            time.sleep(delay)
+            return
+
         start = exact_time()
 
         self.emit('measurement-idle')
@@ -163,6 +174,37 @@ class FlowControl(SharedGObject):
                 time.sleep(max(0, delay - dt))
                 return
 
+    def service_events(self, budget, emit_interval=1):
+        '''
+        Handle events for at most <budget> seconds and return, without
+        sleeping. Used by lib.pacing.Pacer in the slack time between
+        measurement points.
+
+        Like measurement_idle, it checks whether an abort has been
+        requested, waits while paused and emits 'measurement-idle' every
+        <emit_interval> seconds. Events are only started while the budget
+        is not used up; an event handler that runs longer is not
+        interrupted. At least one pending event is handled, also with a
+        budget <= 0, so the GUI keeps responding without slack time.
+        '''
+
+        self.check_abort()
+        now = exact_time()
+        if now - self._last_idle_emit > emit_interval:
+            self.emit('measurement-idle')
+            self._last_idle_emit = now
+
+        while self._pause:
+            self.check_abort()
+            self.run_mainloop(0.01)
+
+        gtk.gdk.threads_enter()
+        if gtk.events_pending():
+            gtk.main_iteration_do(False)
+        gtk.gdk.threads_leave()
+
+        self.run_mainloop(budget - (exact_time() - now), wait=False, exact=True)
+
     def _run_script(self, scriptfile):
         return execfile(scriptfile)
 
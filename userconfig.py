@@ -22,6 +22,18 @@ config['allowed_ips'] = (
 #    '145.94.*.*',
 )
 
+## Maximum number of signal packets per second sent to each client (e.g.
+## the GUI); signals in between are combined. None sends every signal.
+#config['signal_rate'] = 20
+
+## Compression of large network packets to remote hosts: 'auto' uses lz4
+## or zlib if both sides support it, None disables it.
+#config['network_compression'] = 'auto'
+
+## Pass large arrays to clients on the same host (e.g. the GUI) through
+## shared memory instead of the socket.
+#config['network_shared_memory'] = True
+
 # Start instrument server to share with instruments with remote QTLab?
 config['instrument_server'] = False
 
@@ -30,6 +42,26 @@ config['instrument_server'] = False
 # config['datadir'] = os.path.join(config['execdir'], 'YOUR-RELATIVE-PATH-HERE')
 config['datadir'] = 'C:\YOUR-DATA-DIRECTORY-PATH'
 
+## How often data files are flushed to disk. Flushing every row is the
+## safest if qtlab crashes, but slow on network drives.
+#config['data_flush_rows'] = 1           # flush every N rows, 0 to disable
+#config['data_flush_interval'] = None    # flush every T seconds
+#config['data_flush_on_block'] = True    # flush at every new block
+
+## Write data files from a separate thread, so disk access does not delay
+## measurements. If the queue is full, 'block' waits and 'error' raises.
+#config['data_async_write'] = False
+#config['data_async_queue_size'] = 10000
+#config['data_async_policy'] = 'block'
+
+## Store new data files in a binary format (.bin with a .json header),
+## which is faster to write and to open than text .dat files.
+#config['data_binary'] = False
+
+## Keep the data of new measurements in shared memory, so that clients on
+## the same host can read it while it is measured without copying.
+#config['data_shared_memory'] = False
+
 ## This sets a default directory for qtlab to start in
 #config['startdir'] = 'd:/scripts'
 